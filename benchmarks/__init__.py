@@ -0,0 +1,7 @@
+"""
+Benchmarks for the kiosk. Run from the repository root, e.g.:
+
+    python -m benchmarks.scan_benchmark --synthetic 200 --json run.json
+    python -m benchmarks.scan_benchmark --corpus recordings/ --compare baseline.json
+    python -m benchmarks.startup --runs 5 --latency fixed:300
+"""
@@ -0,0 +1,198 @@
+"""
+Frames to benchmark the vision path on: recorded frames and videos from disk, and synthetic passes generated with a
+known payload under controlled conditions.
+"""
+
+import base64
+import json
+import os
+import random
+from typing import Optional
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.mjpeg', '.mjpg')
+
+# Conditions synthetic passes are generated under. Module size is in pixels per QR module.
+MODULE_SIZES = (2, 3, 4, 5)
+BLURS = (0.0, 1.0, 2.0)
+GLARES = (0.0, 0.5, 0.9)
+ROTATIONS = (0, 15, 30, 45)
+POLARITIES = ('normal', 'inverted')
+
+
+class CorpusFrame:
+    """
+    One frame to benchmark on. `expected` is the payload the frame should decode to, if known; `tags` describe the
+    conditions it was captured or generated under, for breaking hit rates down.
+    """
+
+    def __init__(self, buffer, source: str, expected: Optional[bytes] = None, tags: Optional[dict] = None):
+        self.buffer = buffer
+        self.source = source
+        self.expected = expected
+        self.tags = tags if tags is not None else {}
+
+
+def load_recorded(
+        directory: str, frame_step: int = 1, max_frames_per_video: Optional[int] = None
+) -> list[CorpusFrame]:
+    """
+    Load every image and video in `directory`, taking every `frame_step`th frame of each video. If a file has a
+    sidecar `<file name>.txt` next to it, its contents are the payload every frame of that file should decode to.
+    """
+
+    frames = []
+
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        extension = os.path.splitext(name)[1].lower()
+
+        expected = None
+        if os.path.isfile(path + '.txt'):
+            with open(path + '.txt', 'rb') as file:
+                expected = file.read().strip()
+
+        tags = {'file': name}
+
+        if extension in IMAGE_EXTENSIONS:
+            buffer = cv2.imread(path, cv2.IMREAD_COLOR)
+
+            if buffer is None:
+                print(f'Corpus Error: could not read {path}')
+                continue
+
+            frames.append(CorpusFrame(buffer, name, expected, tags))
+
+        elif extension in VIDEO_EXTENSIONS:
+            capture = cv2.VideoCapture(path)
+            index = 0
+            taken = 0
+
+            while max_frames_per_video is None or taken < max_frames_per_video:
+                ret, buffer = capture.read()
+
+                if not ret:
+                    break
+
+                if index % frame_step == 0:
+                    frames.append(CorpusFrame(buffer, f'{name}#{index}', expected, tags))
+                    taken += 1
+
+                index += 1
+
+            capture.release()
+
+    return frames
+
+
+def make_token(rng: random.Random) -> str:
+    """A pass token shaped like the real ones: header, base64 JSON payload and signature, separated by dots."""
+
+    def encode(data: bytes) -> str:
+        return base64.b64encode(data).decode().rstrip('=')
+
+    payload = {
+        '_id': ''.join(rng.choice('0123456789abcdef') for _ in range(24)),
+        'name': f'Guest {rng.randrange(10000)}',
+        'phone': f'9{rng.randrange(10 ** 9):09d}',
+        'type': rng.choice(('GA', 'VIP', '!ALL!', '!STAFF!')),
+        'exp': 4102444800
+    }
+
+    return '.'.join((
+        encode(json.dumps({'alg': 'RS256', 'typ': 'JWT'}).encode()),
+        encode(json.dumps(payload).encode()),
+        encode(rng.randbytes(256))
+    ))
+
+
+def synthetic_pass(
+        payload: str, module_size: int, blur: float, glare: float, rotation: float, inverted: bool,
+        frame_size: tuple[int, int], rng: random.Random
+):
+    """Render a QR code for `payload` into a BGR frame of `frame_size` (width, height) under the given conditions."""
+
+    width, height = frame_size
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+
+    code = cv2.QRCodeEncoder.create().encode(payload)
+    code = cv2.copyMakeBorder(code, 2, 2, 2, 2, cv2.BORDER_CONSTANT, value=255)  # a full 4-module quiet zone
+    code = cv2.resize(code, None, fx=module_size, fy=module_size, interpolation=cv2.INTER_NEAREST)
+
+    # A phone screen: the code on a white (or, inverted, black) background, slightly dimmer than pure white.
+    code = (code.astype(np.float32) * 0.9 + 10).astype(np.uint8)
+    if inverted:
+        code = cv2.bitwise_not(code)
+
+    # Rotate on a canvas large enough to hold every angle, along with a mask of where the code is.
+    side = int(np.ceil(code.shape[0] * np.sqrt(2)))
+    offset = (side - code.shape[0]) // 2
+    matrix = cv2.getRotationMatrix2D((code.shape[1] / 2 + offset, code.shape[0] / 2 + offset), rotation, 1.0)
+
+    padding = side - code.shape[0] - offset
+    canvas = cv2.copyMakeBorder(code, offset, padding, offset, padding, cv2.BORDER_CONSTANT, value=0)
+    mask = np.zeros_like(canvas)
+    mask[offset:offset + code.shape[0], offset:offset + code.shape[1]] = 255
+
+    canvas = cv2.warpAffine(canvas, matrix, (side, side), flags=cv2.INTER_LINEAR)
+    mask = cv2.warpAffine(mask, matrix, (side, side), flags=cv2.INTER_NEAREST)
+
+    # A textured, unevenly lit background.
+    background = np_rng.normal(rng.uniform(70, 180), 25, (height // 8, width // 8)).clip(0, 255).astype(np.uint8)
+    frame = cv2.resize(background, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    left = rng.randrange(0, max(1, width - side))
+    top = rng.randrange(0, max(1, height - side))
+    region = frame[top:top + side, left:left + side]
+    region_mask = mask[:region.shape[0], :region.shape[1]] > 0
+    region[region_mask] = canvas[:region.shape[0], :region.shape[1]][region_mask]
+
+    frame = frame.astype(np.float32)
+
+    if glare > 0:
+        # A specular highlight off the phone screen, centred somewhere on the code.
+        centre_x = left + rng.uniform(0.2, 0.8) * side
+        centre_y = top + rng.uniform(0.2, 0.8) * side
+        radius = side * rng.uniform(0.15, 0.35)
+
+        ys, xs = np.ogrid[:height, :width]
+        frame += glare * 255 * np.exp(-((xs - centre_x) ** 2 + (ys - centre_y) ** 2) / (2 * radius ** 2))
+
+    if blur > 0:
+        frame = cv2.GaussianBlur(frame, (0, 0), blur)
+
+    frame += np_rng.normal(0, 3, frame.shape)  # sensor noise
+
+    return cv2.cvtColor(frame.clip(0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def generate_synthetic(count: int, seed: int = 0, frame_size: tuple[int, int] = (1280, 720)) -> list[CorpusFrame]:
+    """
+    Generate `count` synthetic passes, each under a random combination of module size, blur, glare, rotation and
+    polarity. The same seed always gives the same frames, so runs can be compared.
+    """
+
+    rng = random.Random(seed)
+    frames = []
+
+    for index in range(count):
+        tags = {
+            'module_size': rng.choice(MODULE_SIZES),
+            'blur': rng.choice(BLURS),
+            'glare': rng.choice(GLARES),
+            'rotation': rng.choice(ROTATIONS),
+            'polarity': rng.choice(POLARITIES)
+        }
+
+        token = make_token(rng)
+        buffer = synthetic_pass(
+            token, tags['module_size'], tags['blur'], tags['glare'], tags['rotation'], tags['polarity'] == 'inverted',
+            frame_size, rng
+        )
+
+        frames.append(CorpusFrame(buffer, f'synthetic#{index}', token.encode(), tags))
+
+    return frames
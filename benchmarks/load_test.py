@@ -0,0 +1,359 @@
+"""
+Load and fault test of the kiosk's server client. Starts a `MockTicketingServer` (or targets one already running) and
+simulates many kiosks scanning at once, each with its own `ServerBridge`: scan a pass, verify it, and mark attendance
+on some of the valid ones. Kiosks go through the same clients as the real one: verifications through an
+`AsyncServerBridge`, marks through an `AttendanceJournal` that syncs them in batches. Reports throughput and latency
+percentiles per operation and the outcomes the kiosks saw, under whatever latency, errors and outages the mock is set
+to.
+
+    python -m benchmarks.load_test --kiosks 40 --duration 30
+    python -m benchmarks.load_test --kiosks 40 --duration 60 --latency lognormal:150,0.8 --error-rate 0.05
+    python -m benchmarks.load_test --kiosks 40 --duration 60 --outage-every 20 --outage-for 5 --json outage.json
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import keyring
+import requests
+from keyring.backend import KeyringBackend
+
+from benchmarks.mock_server import MockTicketingServer, add_fault_arguments, faults_from_arguments
+from benchmarks.stats import compare, environment, summarize, write_json
+from utils.async_bridge import AsyncServerBridge
+from utils.bridge import ServerBridge
+from utils.journal import AttendanceJournal
+
+COMPARED_METRICS = ('throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+
+
+class MemoryKeyring(KeyringBackend):
+    """
+    Keyring kept in memory, so simulated kiosks never touch the credentials of a real kiosk on this machine. Each
+    `ServerBridge` keeps its own credentials once enrolled, so kiosks sharing it don't interfere.
+    """
+
+    priority = 1
+
+    def __init__(self):
+        super().__init__()
+        self._passwords: dict[tuple[str, str], str] = {}
+
+    def get_password(self, service, username):
+        return self._passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        self._passwords[(service, username)] = password
+
+    def delete_password(self, service, username):
+        self._passwords.pop((service, username), None)
+
+    def clear(self):
+        self._passwords.clear()
+
+
+class LoadRecorder:
+    """Thread-safe collection of operation durations and outcomes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.outcomes: dict[str, Counter] = {}
+
+    def record(self, operation: str, elapsed: float, outcome: str):
+        with self._lock:
+            self.samples.setdefault(operation, []).append(elapsed)
+            self.outcomes.setdefault(operation, Counter())[outcome] += 1
+
+
+class SimulatedKiosk:
+    """
+    One kiosk. Scans a random pass every `think_time` seconds on average (exponentially distributed), rescanning the
+    previous pass instead with probability `rescan_share`, as happens when a pass lingers in front of the camera.
+    Valid passes get their attendance marked with probability `mark_share`.
+
+    Marks are recorded in the kiosk's own in-memory journal, whose flusher syncs them with the server: "mark" measures
+    the local commit, "sync" the time from the commit to the server's final answer.
+    """
+
+    def __init__(
+            self, bridge: ServerBridge, tokens: list[str], recorder: LoadRecorder, rng: random.Random,
+            think_time: float, rescan_share: float, mark_share: float
+    ):
+        self.bridge = bridge
+        self.tokens = tokens
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.rescan_share = rescan_share
+        self.mark_share = mark_share
+
+        self.async_bridge = AsyncServerBridge(bridge, max_workers=1)
+        self.journal = AttendanceJournal(bridge, ':memory:')
+        self.journal.subscribe(self._on_synced)
+
+        self._recorded_at: dict[str, float] = {}
+
+    def run(self, deadline: float, stop_event: threading.Event):
+        token = None
+
+        while time.monotonic() < deadline and not stop_event.is_set():
+            if token is None or self.rng.random() >= self.rescan_share:
+                token = self.rng.choice(self.tokens)
+
+                # The previous pass has left the camera, as the scanner would.
+                self.async_bridge.cancel_stale(keep=(token,), owner=self)
+
+            scan_start = time.perf_counter()
+            verification = self.async_bridge.verify(token, owner=self).result()
+            elapsed = time.perf_counter() - scan_start
+
+            if verification is None:
+                self.recorder.record('verify', elapsed, 'no assignment')
+                self.bridge.get_assignment()
+            else:
+                self.recorder.record('verify', elapsed, f"{verification['status']} {verification['text']}")
+
+                if verification['status'] == 200 and verification['text'] == 'valid' \
+                        and self.rng.random() < self.mark_share:
+                    mark_start = time.perf_counter()
+                    self._recorded_at.setdefault(token, mark_start)
+                    recorded = self.journal.record(token)
+                    self.recorder.record('mark', time.perf_counter() - mark_start, 'recorded' if recorded else 'refused')
+
+            self.recorder.record('scan', time.perf_counter() - scan_start, 'done')
+
+            if self.think_time > 0:
+                # Never think past the deadline, or the run overruns its duration and understates throughput.
+                think = self.rng.expovariate(1 / self.think_time)
+                stop_event.wait(max(0.0, min(think, deadline - time.monotonic())))
+
+    def close(self):
+        self.journal.close()
+        self.async_bridge.shutdown()
+        self.bridge.close()
+
+    def _on_synced(self, token: str, status: int):
+        recorded_at = self._recorded_at.pop(token, None)
+
+        if recorded_at is not None:
+            self.recorder.record('sync', time.perf_counter() - recorded_at, str(status))
+
+
+def enroll_kiosks(
+        address: str, enroll_code: str, kiosks: int, connect_timeout: float = 3.05, read_timeout: float = 5.0,
+        attempts: int = 5
+) -> list[ServerBridge]:
+    """Enroll `kiosks` bridges with the server, each retried up to `attempts` times in case the server is faulty."""
+
+    backend = MemoryKeyring()
+    keyring.set_keyring(backend)
+
+    bridges = []
+
+    for index in range(kiosks):
+        # Every bridge starts from an empty keyring, or it would pick up the previous kiosk's credentials.
+        backend.clear()
+
+        bridge = ServerBridge(connect_timeout, read_timeout, pool_size=1)
+
+        for _ in range(attempts):
+            bridge.enroll(address, enroll_code, f'Load Kiosk {index + 1}')
+
+            if not bridge.need_init:
+                break
+
+        if bridge.need_init:
+            raise RuntimeError(f'Kiosk {index + 1} could not enroll with {address}')
+
+        bridges.append(bridge)
+
+    return bridges
+
+
+def run(
+        bridges: list[ServerBridge], tokens: list[str], duration: float, think_time: float = 1.0,
+        rescan_share: float = 0.3, mark_share: float = 0.8, seed: int = 0
+) -> dict:
+    rng = random.Random(seed)
+    recorder = LoadRecorder()
+
+    simulated = [
+        SimulatedKiosk(
+            bridge, tokens, recorder, random.Random(rng.getrandbits(32)), think_time, rescan_share, mark_share
+        )
+        for bridge in bridges
+    ]
+
+    for kiosk in simulated:
+        kiosk.bridge.get_assignment()
+        kiosk.journal.start()
+
+    stop_event = threading.Event()
+    started = time.monotonic()
+    deadline = started + duration
+
+    threads = [threading.Thread(target=kiosk.run, args=(deadline, stop_event), daemon=True) for kiosk in simulated]
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    elapsed = time.monotonic() - started
+
+    # Marks still waiting in the journals when the run ended, e.g. because the server was down.
+    unsynced = sum(kiosk.journal.pending_count() for kiosk in simulated)
+
+    for kiosk in simulated:
+        kiosk.close()
+
+    stages = {}
+
+    for operation, samples in recorder.samples.items():
+        stages[operation] = summarize(samples)
+        # Operations per second of wall time across all kiosks, rather than per second spent in the operation.
+        stages[operation]['throughput_per_s'] = len(samples) / elapsed
+        stages[operation]['outcomes'] = dict(recorder.outcomes[operation].most_common())
+
+    verify_outcomes = recorder.outcomes.get('verify', Counter())
+    verifications = sum(verify_outcomes.values())
+    network_errors = sum(count for outcome, count in verify_outcomes.items() if outcome.startswith('0 '))
+
+    return {
+        'environment': environment(),
+        'config': {
+            'address': bridges[0].server_ip if len(bridges) > 0 else None,
+            'kiosks': len(bridges),
+            'duration': duration,
+            'think_time': think_time,
+            'rescan_share': rescan_share,
+            'mark_share': mark_share,
+            'timeout': list(bridges[0].timeout) if len(bridges) > 0 else None,
+            'passes': len(tokens)
+        },
+        'elapsed': elapsed,
+        'stages': stages,
+        'network_error_rate': network_errors / verifications if verifications > 0 else 0.0,
+        'unsynced_marks': unsynced
+    }
+
+
+def print_report(report: dict):
+    config = report['config']
+    print(f"{config['kiosks']} kiosks for {report['elapsed']:.1f} s against {config['address']}")
+    print()
+
+    print(f"{'operation':<12}{'count':>8}{'ops/s':>9}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+
+    for operation, stage in report['stages'].items():
+        print(
+            f"{operation:<12}{stage['count']:>8}{stage['throughput_per_s']:>9.1f}{stage['mean_ms']:>9.1f}"
+            f"{stage['p50_ms']:>9.1f}{stage['p95_ms']:>9.1f}{stage['p99_ms']:>9.1f}{stage['max_ms']:>9.1f}"
+        )
+
+    for operation in ('verify', 'mark', 'sync'):
+        if operation not in report['stages']:
+            continue
+
+        print()
+        print(f'{operation} outcomes:')
+
+        for outcome, count in report['stages'][operation]['outcomes'].items():
+            print(f'  {outcome:<40}{count:>8}')
+
+    print()
+    print(f"network error rate {report['network_error_rate']:.1%}")
+    print(f"marks not yet synced {report['unsynced_marks']}")
+
+    if 'server' in report:
+        print()
+        print('server saw:')
+
+        for endpoint, outcomes in sorted(report['server'].items()):
+            print(f"  {endpoint:<20}{', '.join(f'{outcome}: {count}' for outcome, count in sorted(outcomes.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', help='address of a mock server already running; by default one is started here')
+    parser.add_argument('--tokens', help='file of pass tokens, one per line, when using --server')
+    parser.add_argument('--enroll-code', default='000000')
+    parser.add_argument('--kiosks', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to run for')
+    parser.add_argument('--passes', type=int, default=2000, help='passes to issue on the local mock server')
+    parser.add_argument('--think-time', type=float, default=1.0, help='mean seconds between scans per kiosk')
+    parser.add_argument('--rescan-share', type=float, default=0.3)
+    parser.add_argument('--mark-share', type=float, default=0.8)
+    parser.add_argument('--connect-timeout', type=float, default=3.05)
+    parser.add_argument('--read-timeout', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='compare against a report saved with --json')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    mock: Optional[MockTicketingServer] = None
+    faults = faults_from_arguments(args)
+
+    if args.server is not None:
+        if args.tokens is None:
+            parser.error('--tokens is required with --server')
+
+        with open(args.tokens) as file:
+            tokens = [line.strip() for line in file if line.strip()]
+
+        address = args.server.rstrip('/')
+    else:
+        mock = MockTicketingServer(enroll_code=args.enroll_code, seed=args.seed)
+        tokens = mock.issue_passes(args.passes)
+        mock.start()
+
+        address = mock.address
+
+    try:
+        bridges = enroll_kiosks(address, args.enroll_code, args.kiosks, args.connect_timeout, args.read_timeout)
+
+        # Faults only start once every kiosk is enrolled, so the run measures scanning rather than enrollment.
+        if mock is not None:
+            mock.set_faults(faults)
+
+        report = run(bridges, tokens, args.duration, args.think_time, args.rescan_share, args.mark_share, args.seed)
+        report['config']['faults'] = faults.as_dict() if mock is not None else None
+
+        try:
+            report['server'] = requests.get(address + '/_admin/stats', timeout=5).json()
+        except (requests.RequestException, ValueError):
+            pass
+
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    print_report(report)
+
+    if args.json is not None:
+        write_json(report, args.json)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        print()
+        print(f"Compared with {args.compare} ({baseline['environment'].get('commit')}):")
+
+        for line in compare(report, baseline, COMPARED_METRICS):
+            print(f'  {line}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,559 @@
+"""
+Local stand-in for the ticketing server, for exercising `ServerBridge` without a real backend. Implements `/enroll`,
+`/assignment`, `/verify`, `/mark`, `/publickey` and `/roster` with the status codes and `REASON:` bodies the bridge
+relies on, and can be made slow, flaky or unreachable through a `FaultProfile`.
+
+Run standalone to point a kiosk at it:
+
+    python -m benchmarks.mock_server --port 8000 --passes 200 --tokens-out tokens.txt --latency lognormal:40,0.5
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+except ImportError:
+    rsa = None
+
+OUTAGE_MODES = ('refuse', 'hang', 'error')
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution, in milliseconds, into a sampler returning seconds. One of `fixed:MS`,
+    `uniform:LOW,HIGH`, `lognormal:MEDIAN,SIGMA` or `exponential:MEAN`.
+    """
+
+    kind, _, arguments = spec.partition(':')
+    values = [float(value) for value in arguments.split(',')] if arguments else []
+
+    match kind, len(values):
+        case 'fixed', 1:
+            return lambda rng: values[0] / 1000
+
+        case 'uniform', 2:
+            return lambda rng: rng.uniform(values[0], values[1]) / 1000
+
+        case 'lognormal', 2:
+            # Parametrised by the median, which is what people quote for network latency.
+            return lambda rng: values[0] * rng.lognormvariate(0, values[1]) / 1000
+
+        case 'exponential', 1:
+            return lambda rng: rng.expovariate(1 / values[0]) / 1000 if values[0] > 0 else 0.0
+
+        case _:
+            raise ValueError(f'Invalid latency distribution: {spec!r}')
+
+
+class FaultProfile:
+    """
+    How badly the mock server behaves. Every request is delayed by a sample of `latency`, then dropped without a
+    response with probability `drop_rate` or answered 503 with probability `error_rate`. Every `outage_every` seconds
+    the server goes down for the last `outage_for` of them; setting `outage` takes it down until cleared. While down,
+    connections are closed unanswered (`refuse`), held for `hang_for` seconds and then closed (`hang`), or answered
+    503 (`error`), depending on `outage_mode`.
+    """
+
+    def __init__(
+            self, latency: str = 'fixed:0', error_rate: float = 0.0, drop_rate: float = 0.0, outage_every: float = 0.0,
+            outage_for: float = 0.0, outage_mode: str = 'refuse', hang_for: float = 30.0
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.outage_every = outage_every
+        self.outage_for = outage_for
+        self.outage_mode = outage_mode
+        self.hang_for = hang_for
+        self.outage = False
+
+        self._sample_latency = parse_latency(latency)
+
+    def update(self, changes: dict):
+        """Change knobs at runtime. Unknown keys raise `ValueError`; nothing is changed in that case."""
+
+        unknown = set(changes) - set(self.as_dict())
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown fault settings: {sorted(unknown)}')
+
+        if changes.get('outage_mode', self.outage_mode) not in OUTAGE_MODES:
+            raise ValueError(f"Outage mode must be one of {OUTAGE_MODES}")
+
+        sample_latency = parse_latency(changes.get('latency', self.latency))
+
+        for key, value in changes.items():
+            setattr(self, key, value)
+
+        self._sample_latency = sample_latency
+
+    def sample_latency(self, rng: random.Random) -> float:
+        return self._sample_latency(rng)
+
+    def in_outage(self, elapsed: float) -> bool:
+        if self.outage:
+            return True
+
+        if self.outage_every <= 0 or self.outage_for <= 0:
+            return False
+
+        return elapsed % self.outage_every >= self.outage_every - self.outage_for
+
+    def as_dict(self) -> dict:
+        return {
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'drop_rate': self.drop_rate,
+            'outage_every': self.outage_every,
+            'outage_for': self.outage_for,
+            'outage_mode': self.outage_mode,
+            'hang_for': self.hang_for,
+            'outage': self.outage
+        }
+
+
+class MockPass:
+    """A pass known to the mock server. `version` is the roster version it last changed in."""
+
+    def __init__(self, id_: str, token: str, event: str, state: str, version: int):
+        self.id = id_
+        self.token = token
+        self.event = event
+        self.state = state
+        self.version = version
+        self.mark_key: Optional[str] = None
+
+
+class MockTicketingServer:
+    """
+    In-process mock of the ticketing server on a `ThreadingHTTPServer`, with HTTP/1.1 keep-alive like the real one.
+    Kiosks enroll with `enroll_code` and are assigned to `event_name`/`event_id` straight away (see `assign()`).
+    Passes are issued with `issue_passes()`; if `cryptography` is installed they are RS256-signed with a key served
+    at `/publickey`.
+
+    `faults` may be changed at any time, directly or with `POST /_admin/faults` and a JSON body of the settings to
+    change. `GET /_admin/stats` returns the request counts by endpoint and status. Admin endpoints are never faulted.
+    """
+
+    def __init__(
+            self, host: str = '127.0.0.1', port: int = 0, enroll_code: str = '000000', event_id: str = 'evt-1',
+            event_name: str = 'Main Gate', faults: Optional[FaultProfile] = None, seed: int = 0, sign: bool = True
+    ):
+        self.enroll_code = enroll_code
+        self.event_id = event_id
+        self.event_name = event_name
+        self.faults = faults if faults is not None else FaultProfile()
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._kiosks: dict[str, dict] = {}
+        self._passes: dict[str, MockPass] = {}
+        self._pass_ids: dict[str, MockPass] = {}
+        self._roster_version = 1
+
+        self.stats: dict[str, Counter] = {}
+
+        self._private_key = None
+        self.public_key_pem: Optional[str] = None
+
+        if sign and rsa is not None:
+            self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            self.public_key_pem = self._private_key.public_key().public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode()
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = time.monotonic()
+
+    @property
+    def address(self) -> str:
+        host, port = self._httpd.server_address[:2]
+
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._started_at = time.monotonic()
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def set_faults(self, faults: FaultProfile):
+        """Replace the fault profile, restarting the outage schedule from now."""
+
+        self.faults = faults
+        self._started_at = time.monotonic()
+
+    def issue_passes(
+            self, count: int, staff_share: float = 0.05, revoked_share: float = 0.02, event: Optional[str] = None
+    ) -> list[str]:
+        """Issue `count` passes for `event` (default: the mock's event) and return their tokens."""
+
+        tokens = []
+
+        with self._lock:
+            for _ in range(count):
+                roll = self._rng.random()
+                state = 'staff' if roll < staff_share else 'revoked' if roll < staff_share + revoked_share else 'valid'
+                id_ = '%024x' % self._rng.getrandbits(96)
+
+                payload = {
+                    '_id': id_,
+                    'name': f'Guest {len(self._passes) + 1}',
+                    'phone': f'9{self._rng.randrange(10 ** 9):09d}',
+                    'type': '!STAFF!' if state == 'staff' else 'GA',
+                    'exp': int(time.time()) + 86400
+                }
+
+                token = self._sign(payload)
+                event_id = event if event is not None else self.event_id
+                mock_pass = MockPass(id_, token, event_id, state, self._roster_version)
+
+                self._passes[token] = mock_pass
+                self._pass_ids[id_] = mock_pass
+                tokens.append(token)
+
+            self._roster_version += 1
+
+        return tokens
+
+    def assign(self, kiosk_token: str, assignment: Optional[str]):
+        """Set a kiosk's assignment: `'<name>+<event id>'`, `'<name>+!ALL!'` for verify-only, or None for none."""
+
+        with self._lock:
+            self._kiosks[kiosk_token]['assignment'] = assignment
+
+    def handle(self, method: str, path: str, query: dict, body: bytes, headers) -> tuple[int, str]:
+        """Answer one request as the ticketing server would. Returns the status code and the response body."""
+
+        with self._lock:
+            match method, path:
+                case 'POST', '/enroll':
+                    return self._enroll(body)
+
+                case 'GET', '/assignment':
+                    return self._assignment(query)
+
+                case 'GET', '/verify':
+                    return self._verify(query)
+
+                case 'PUT', '/mark':
+                    return self._mark(body, headers.get('Idempotency-Key'))
+
+                case 'GET', '/publickey':
+                    if self.public_key_pem is None:
+                        return 404, 'NOT FOUND'
+
+                    return 200, self.public_key_pem
+
+                case 'GET', '/roster':
+                    return self._roster(query)
+
+                case _:
+                    return 404, 'NOT FOUND'
+
+    def record(self, method: str, path: str, outcome: str):
+        with self._lock:
+            self.stats.setdefault(f'{method} {path}', Counter())[outcome] += 1
+
+    def _sign(self, payload: dict) -> str:
+        def encode(data: bytes) -> str:
+            return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+        header = {'alg': 'RS256' if self._private_key is not None else 'none', 'typ': 'JWT'}
+        signing_input = f'{encode(json.dumps(header).encode())}.{encode(json.dumps(payload).encode())}'
+
+        signature = b''
+        if self._private_key is not None:
+            signature = self._private_key.sign(signing_input.encode(), padding.PKCS1v15(), hashes.SHA256())
+
+        return f'{signing_input}.{encode(signature)}'
+
+    def _enroll(self, body: bytes) -> tuple[int, str]:
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, 'BAD REQUEST'
+
+        if request.get('code') != self.enroll_code:
+            return 401, 'INVALID CODE'
+
+        kiosk_token = '%032x' % self._rng.getrandbits(128)
+        self._kiosks[kiosk_token] = {'name': request.get('name'), 'assignment': f'{self.event_name}+{self.event_id}'}
+
+        return 200, kiosk_token
+
+    def _assignment(self, query: dict) -> tuple[int, str]:
+        kiosk = self._kiosks.get(query.get('kioskToken'))
+
+        if kiosk is None:
+            return 401, 'INVALID TOKEN'
+
+        if kiosk['assignment'] is None:
+            return 204, ''
+
+        return 200, kiosk['assignment']
+
+    def _verify(self, query: dict) -> tuple[int, str]:
+        mock_pass = self._passes.get(query.get('token'))
+
+        if mock_pass is None:
+            return 404, 'INVALID PASS REASON: Pass not found.'
+
+        event = query.get('event')
+        if event != '!ALL!' and event != mock_pass.event:
+            return 403, 'WRONG EVENT REASON: Pass is for another event.'
+
+        match mock_pass.state:
+            case 'staff':
+                return 200, 'staff'
+
+            case 'marked':
+                return 409, 'ALREADY MARKED REASON: Attendance was already marked.'
+
+            case 'revoked':
+                return 403, 'REVOKED REASON: Pass was revoked.'
+
+            case _:
+                return 200, 'valid'
+
+    def _mark(self, body: bytes, idempotency_key: Optional[str]) -> tuple[int, str]:
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, 'BAD REQUEST'
+
+        kiosk = self._kiosks.get(request.get('kioskToken'))
+
+        if kiosk is None:
+            return 401, 'INVALID TOKEN'
+
+        # Verify-only kiosks can't mark attendance.
+        if kiosk['assignment'] is None or kiosk['assignment'].endswith('+!ALL!'):
+            return 409, 'CONFLICT REASON: Kiosk may not mark attendance.'
+
+        mock_pass = self._passes.get(request.get('token'))
+
+        if mock_pass is None or mock_pass.event != request.get('event'):
+            return 404, 'INVALID PASS'
+
+        if mock_pass.state == 'marked':
+            # A retry of a mark that went through is answered as the original was.
+            if idempotency_key is not None and idempotency_key == mock_pass.mark_key:
+                return 200, 'OK'
+
+            return 409, 'ALREADY MARKED'
+
+        if mock_pass.state != 'valid':
+            return 409, f'{mock_pass.state.upper()}'
+
+        mock_pass.state = 'marked'
+        mock_pass.mark_key = idempotency_key
+        mock_pass.version = self._roster_version
+        self._roster_version += 1
+
+        return 200, 'OK'
+
+    def _roster(self, query: dict) -> tuple[int, str]:
+        if query.get('kioskToken') not in self._kiosks:
+            return 401, 'INVALID TOKEN'
+
+        event = query.get('event')
+        since = query.get('since')
+
+        try:
+            since_version = int(since) if since is not None else None
+        except ValueError:
+            since_version = None
+
+        if since_version is not None and since_version >= self._roster_version - 1:
+            return 304, ''
+
+        passes = {
+            mock_pass.id: mock_pass.state for mock_pass in self._pass_ids.values()
+            if mock_pass.event == event and (since_version is None or mock_pass.version > since_version)
+        }
+
+        return 200, json.dumps({
+            'version': str(self._roster_version - 1),
+            'passes': passes,
+            'full': since_version is None,
+            'removed': []
+        })
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_PUT(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        mock: MockTicketingServer = self.server.mock
+
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if url.path.startswith('/_admin/'):
+            self._admin(mock, url.path, body)
+            return
+
+        faults = mock.faults
+
+        if faults.in_outage(time.monotonic() - mock._started_at):
+            mock.record(self.command, url.path, f'outage-{faults.outage_mode}')
+
+            match faults.outage_mode:
+                case 'error':
+                    self._respond(503, 'SERVICE UNAVAILABLE')
+
+                case 'hang':
+                    time.sleep(faults.hang_for)
+                    self.close_connection = True
+
+                case _:
+                    self.close_connection = True
+
+            return
+
+        time.sleep(faults.sample_latency(mock._rng))
+
+        roll = mock._rng.random()
+
+        if roll < faults.drop_rate:
+            mock.record(self.command, url.path, 'dropped')
+            self.close_connection = True
+            return
+
+        headers = {}
+
+        if roll < faults.drop_rate + faults.error_rate:
+            status, text = 503, 'SERVICE UNAVAILABLE'
+        else:
+            status, text = mock.handle(self.command, url.path, query, body, self.headers)
+
+            # Successful GETs carry an ETag, and a matching If-None-Match is answered 304 Not Modified.
+            if self.command == 'GET' and status == 200:
+                headers['ETag'] = '"' + hashlib.sha1(text.encode()).hexdigest()[:16] + '"'
+
+                if self.headers.get('If-None-Match') == headers['ETag']:
+                    status, text = 304, ''
+
+        mock.record(self.command, url.path, str(status))
+        self._respond(status, text, headers=headers)
+
+    def _admin(self, mock: MockTicketingServer, path: str, body: bytes):
+        match self.command, path:
+            case 'GET', '/_admin/stats':
+                with mock._lock:
+                    stats = {endpoint: dict(counter) for endpoint, counter in mock.stats.items()}
+
+                self._respond(200, json.dumps(stats), 'application/json')
+
+            case 'GET', '/_admin/faults':
+                self._respond(200, json.dumps(mock.faults.as_dict()), 'application/json')
+
+            case 'POST', '/_admin/faults':
+                try:
+                    mock.faults.update(json.loads(body))
+                except ValueError as e:
+                    self._respond(400, str(e))
+                    return
+
+                self._respond(200, json.dumps(mock.faults.as_dict()), 'application/json')
+
+            case _:
+                self._respond(404, 'NOT FOUND')
+
+    def _respond(self, status: int, text: str, content_type: str = 'text/plain', headers: Optional[dict] = None):
+        data = text.encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+
+        if status not in (204, 304):
+            self.wfile.write(data)
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', default='fixed:0', help='latency distribution in ms, e.g. lognormal:40,0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered 503')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='share of connections closed unanswered')
+    parser.add_argument('--outage-every', type=float, default=0.0, help='seconds between the starts of outages')
+    parser.add_argument('--outage-for', type=float, default=0.0, help='length of each outage in seconds')
+    parser.add_argument('--outage-mode', choices=OUTAGE_MODES, default='refuse')
+    parser.add_argument('--hang-for', type=float, default=30.0, help='how long a hung request is held, in seconds')
+
+
+def faults_from_arguments(args: argparse.Namespace) -> FaultProfile:
+    return FaultProfile(
+        args.latency, args.error_rate, args.drop_rate, args.outage_every, args.outage_for, args.outage_mode,
+        args.hang_for
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock ticketing server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--enroll-code', default='000000')
+    parser.add_argument('--passes', type=int, default=100, help='number of passes to issue')
+    parser.add_argument('--tokens-out', help='write the issued pass tokens to this file, one per line')
+    parser.add_argument('--seed', type=int, default=0)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    mock = MockTicketingServer(
+        args.host, args.port, args.enroll_code, faults=faults_from_arguments(args), seed=args.seed
+    )
+    tokens = mock.issue_passes(args.passes)
+
+    if args.tokens_out is not None:
+        with open(args.tokens_out, 'w') as file:
+            file.write('\n'.join(tokens) + '\n')
+
+    mock.start()
+    print(f'Mock ticketing server on {mock.address}, enrollment code {args.enroll_code}, {len(tokens)} passes.')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
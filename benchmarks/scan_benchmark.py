@@ -0,0 +1,322 @@
+"""
+Benchmark of the kiosk's vision path. Replays recorded frames and synthetic passes through `get_buffer_and_qr_codes`,
+the pipeline's multi-scale decoder, `decode_qr` and the video tile's render conversion, and reports per-stage
+throughput, latency percentiles, decode hit rates and memory. Use `--json` to save a run and `--compare` to diff a run
+against a saved one.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+import cv2
+
+from benchmarks.corpus import CorpusFrame, generate_synthetic, load_recorded
+from benchmarks.stats import compare, environment, peak_rss_kib, summarize, write_json
+from frames.renderer import FrameRenderer
+from utils import decode_qr, get_buffer_and_qr_codes
+from utils.decoders import create_decoder
+from utils.decoding import MultiScaleDecoder
+from utils.mjpeg import MjpegFrame
+from utils.pipeline import DecodedFrame
+from utils.video_capture import CapturedFrame
+
+COMPARED_METRICS = ('throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'hit_rate', 'peak_alloc_kib')
+
+
+class ReplayCapture:
+    """
+    Serves corpus frames through the `VideoCapture.read()` interface. With `jpeg_quality` set, frames are JPEG-encoded
+    up front and served as `MjpegFrame`, like an MJPEG camera delivers them.
+    """
+
+    def __init__(self, frames: list[CorpusFrame], jpeg_quality: Optional[int] = None):
+        self.frames = frames
+        self.jpeg_quality = jpeg_quality
+        self.index = 0
+
+        self._jpegs = None
+        if jpeg_quality is not None:
+            self._jpegs = [
+                cv2.imencode('.jpg', frame.buffer, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])[1].tobytes()
+                for frame in frames
+            ]
+
+    def frame(self, index: int) -> CapturedFrame:
+        """A new, undecoded frame object for corpus frame `index`."""
+
+        if self._jpegs is not None:
+            return MjpegFrame(self._jpegs[index], index + 1, time.monotonic())
+
+        return CapturedFrame(self.frames[index].buffer, index + 1, time.monotonic())
+
+    def read(self, timeout: Optional[float] = None) -> Optional[CapturedFrame]:
+        if self.index >= len(self.frames):
+            return None
+
+        self.index += 1
+
+        return self.frame(self.index - 1)
+
+    def rewind(self):
+        self.index = 0
+
+    def close(self, timeout: float = 1.0):
+        pass
+
+
+class HitCounter:
+    """
+    Decode outcomes. A frame with a known payload is a hit if that payload was decoded, and a false decode if something
+    else was; a frame without one is a hit if any code was decoded.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.hits = 0
+        self.false_decodes = 0
+
+    def record(self, frame: CorpusFrame, qr_codes: list):
+        self.frames += 1
+
+        if frame.expected is None:
+            self.hits += len(qr_codes) > 0
+        elif any(qr.data == frame.expected for qr in qr_codes):
+            self.hits += 1
+        elif len(qr_codes) > 0:
+            self.false_decodes += 1
+
+    def as_dict(self) -> dict:
+        return {
+            'hit_rate': self.hits / self.frames if self.frames > 0 else 0.0,
+            'hits': self.hits,
+            'false_decodes': self.false_decodes
+        }
+
+
+def run(
+        frames: list[CorpusFrame], backend: Optional[str] = None, tile_size: tuple[int, int] = (960, 540),
+        jpeg_quality: Optional[int] = None, repeat: int = 1, memory: bool = False
+) -> dict:
+    capture = ReplayCapture(frames, jpeg_quality)
+
+    decoder = create_decoder(backend)
+    pipeline_decoder = MultiScaleDecoder(create_decoder(decoder.name))
+    renderer = FrameRenderer(tile_size)
+
+    timings: dict[str, list[float]] = {
+        'get_buffer_and_qr_codes': [], 'pipeline_decode': [], 'decode_qr': [], 'render': []
+    }
+    hits = {'get_buffer_and_qr_codes': HitCounter(), 'pipeline_decode': HitCounter()}
+    breakdown: dict[str, dict[str, HitCounter]] = {}
+    parsed = 0
+
+    # Warm up: first calls pay for lazy imports, detector construction and allocator growth.
+    for index in range(min(3, len(frames))):
+        decoder.decode(capture.frame(index).gray())
+        pipeline_decoder.decode(capture.frame(index))
+
+    qr_codes_per_frame = []
+
+    for _ in range(repeat):
+        capture.rewind()
+
+        for index, frame in enumerate(frames):
+            start = time.perf_counter()
+            result = get_buffer_and_qr_codes(capture, decoder=decoder)
+            timings['get_buffer_and_qr_codes'].append(time.perf_counter() - start)
+
+            frame_buffer, qr_codes = result
+            hits['get_buffer_and_qr_codes'].record(frame, qr_codes)
+
+            start = time.perf_counter()
+            pipeline_qr_codes = pipeline_decoder.decode(capture.frame(index))
+            timings['pipeline_decode'].append(time.perf_counter() - start)
+
+            hits['pipeline_decode'].record(frame, pipeline_qr_codes)
+
+            for key, value in frame.tags.items():
+                breakdown.setdefault(f'{key}={value}', {}).setdefault('pipeline_decode', HitCounter()) \
+                    .record(frame, pipeline_qr_codes)
+
+            for qr in pipeline_qr_codes:
+                start = time.perf_counter()
+                parsed += decode_qr(qr) is not None
+                timings['decode_qr'].append(time.perf_counter() - start)
+
+            decoded_frame = DecodedFrame(CapturedFrame(frame_buffer, index + 1, 0.0), pipeline_qr_codes)
+
+            start = time.perf_counter()
+            renderer.convert(decoded_frame)
+            timings['render'].append(time.perf_counter() - start)
+
+            if len(qr_codes_per_frame) < len(frames):
+                qr_codes_per_frame.append(pipeline_qr_codes)
+
+    stages = {name: summarize(samples) for name, samples in timings.items()}
+
+    for name, counter in hits.items():
+        stages[name].update(counter.as_dict())
+
+    stages['decode_qr']['parse_rate'] = parsed / len(timings['decode_qr']) if len(timings['decode_qr']) > 0 else 0.0
+
+    if memory:
+        for name, peak in measure_memory(capture, decoder, pipeline_decoder, renderer, qr_codes_per_frame).items():
+            stages[name]['peak_alloc_kib'] = peak
+
+    return {
+        'environment': environment(),
+        'config': {
+            'backend': decoder.name,
+            'frames': len(frames),
+            'repeat': repeat,
+            'tile_size': list(tile_size),
+            'jpeg_quality': jpeg_quality
+        },
+        'stages': stages,
+        'breakdown': {
+            tag: {stage: counter.as_dict() | {'frames': counter.frames} for stage, counter in counters.items()}
+            for tag, counters in sorted(breakdown.items())
+        },
+        'peak_rss_kib': peak_rss_kib()
+    }
+
+
+def measure_memory(
+        capture: ReplayCapture, decoder, pipeline_decoder: MultiScaleDecoder, renderer: FrameRenderer,
+        qr_codes_per_frame: list[list]
+) -> dict[str, float]:
+    """
+    Peak memory allocated while running each stage over the corpus once, in KiB above what was allocated before. Run
+    separately from the timed pass, as tracing allocations slows everything down.
+    """
+
+    count = len(qr_codes_per_frame)
+
+    def render(index: int):
+        captured_frame = capture.frame(index)
+        renderer.convert(DecodedFrame(CapturedFrame(captured_frame.buffer, index + 1, 0.0), qr_codes_per_frame[index]))
+
+    stages: dict[str, Callable[[int], object]] = {
+        'get_buffer_and_qr_codes': lambda index: get_buffer_and_qr_codes(capture, decoder=decoder),
+        'pipeline_decode': lambda index: pipeline_decoder.decode(capture.frame(index)),
+        'decode_qr': lambda index: [decode_qr(qr) for qr in qr_codes_per_frame[index]],
+        'render': render
+    }
+
+    peaks = {}
+    tracemalloc.start()
+
+    try:
+        for name, stage in stages.items():
+            capture.rewind()
+
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+            for index in range(count):
+                stage(index)
+
+            peaks[name] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+
+    finally:
+        tracemalloc.stop()
+
+    return peaks
+
+
+def print_report(report: dict):
+    config = report['config']
+    print(
+        f"{config['frames']} frames x {config['repeat']}, backend {config['backend']}, "
+        f"{'JPEG q' + str(config['jpeg_quality']) if config['jpeg_quality'] else 'raw'} frames"
+    )
+    print()
+
+    print(f"{'stage':<26}{'count':>7}{'ops/s':>9}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'hit':>7}{'peak KiB':>10}")
+
+    for name, stage in report['stages'].items():
+        if stage['count'] == 0:
+            print(f'{name:<26}{0:>7}')
+            continue
+
+        hit = f"{stage['hit_rate']:.0%}" if 'hit_rate' in stage else ''
+        peak = f"{stage['peak_alloc_kib']:.0f}" if 'peak_alloc_kib' in stage else ''
+
+        print(
+            f"{name:<26}{stage['count']:>7}{stage['throughput_per_s']:>9.1f}{stage['mean_ms']:>9.2f}"
+            f"{stage['p50_ms']:>9.2f}{stage['p95_ms']:>9.2f}{stage['p99_ms']:>9.2f}{hit:>7}{peak:>10}"
+        )
+
+    if len(report['breakdown']) > 0:
+        print()
+        print('pipeline_decode hit rate by condition:')
+
+        for tag, stages in report['breakdown'].items():
+            counter = stages['pipeline_decode']
+            print(f"  {tag:<24}{counter['hit_rate']:>6.0%}  ({counter['hits']}/{counter['frames']})")
+
+    if report['peak_rss_kib'] is not None:
+        print()
+        print(f"peak RSS {report['peak_rss_kib'] / 1024:.0f} MiB")
+
+
+def _size(value: str) -> tuple[int, int]:
+    width, height = value.lower().split('x')
+
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', help='directory of recorded frames (images) and videos to replay')
+    parser.add_argument('--frame-step', type=int, default=1, help='take every Nth frame of recorded videos')
+    parser.add_argument('--max-frames-per-video', type=int, default=None)
+    parser.add_argument('--synthetic', type=int, default=None, help='number of synthetic passes to generate')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the synthetic passes')
+    parser.add_argument('--frame-size', type=_size, default=(1280, 720), help='synthetic frame size, WxH')
+    parser.add_argument('--backend', default=None, help='QR decoder backend (default: first available)')
+    parser.add_argument('--mjpeg', type=int, default=None, metavar='QUALITY',
+                        help='serve frames JPEG-encoded at QUALITY, as an MJPEG camera would')
+    parser.add_argument('--tile', type=_size, default=(960, 540), help='video tile size for rendering, WxH')
+    parser.add_argument('--repeat', type=int, default=1, help='passes over the corpus')
+    parser.add_argument('--memory', action='store_true', help='also measure peak allocations per stage (slower)')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='compare against a report saved with --json')
+    args = parser.parse_args()
+
+    frames = []
+
+    if args.corpus is not None:
+        frames += load_recorded(args.corpus, args.frame_step, args.max_frames_per_video)
+
+    synthetic = args.synthetic if args.synthetic is not None else (100 if args.corpus is None else 0)
+    if synthetic > 0:
+        frames += generate_synthetic(synthetic, args.seed, args.frame_size)
+
+    if len(frames) == 0:
+        parser.error('no frames to benchmark')
+
+    report = run(frames, args.backend, args.tile, args.mjpeg, args.repeat, args.memory)
+    report['config'].update({'corpus': args.corpus, 'synthetic': synthetic, 'seed': args.seed})
+
+    print_report(report)
+
+    if args.json is not None:
+        write_json(report, args.json)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        print()
+        print(f"Compared with {args.compare} ({baseline['environment'].get('commit')}):")
+
+        for line in compare(report, baseline, COMPARED_METRICS):
+            print(f'  {line}')
+
+
+if __name__ == '__main__':
+    main()
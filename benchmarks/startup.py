@@ -0,0 +1,239 @@
+"""
+Startup benchmark. Measures how long the kiosk takes from launch to its first camera frame and to its first verdict on
+a pass held up to the camera, against a `MockTicketingServer` with whatever latency and faults it is set to. Two
+startup orders are compared: `serial` loads the bridge (keystore, assignment, public key, decoder libraries) before
+starting the camera, as the kiosk used to; `parallel` starts the camera first and loads everything in the background,
+as it does now. Importing the scanner's modules is timed separately, in fresh interpreters.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --latency fixed:400 --json startup.json
+    python -m benchmarks.startup --source recordings/gate.mp4 --compare startup.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import cv2
+
+from benchmarks.corpus import synthetic_pass
+from benchmarks.load_test import enroll_kiosks
+from benchmarks.mock_server import MockTicketingServer, add_fault_arguments, faults_from_arguments
+from benchmarks.stats import compare, environment, summarize, write_json
+from utils.async_bridge import AsyncServerBridge
+from utils.bridge import ServerBridge
+from utils.mjpeg import open_capture
+from utils.pipeline import ScanPipeline, ScanResult
+from utils.startup import run_startup, start_background
+from utils.token_validator import TokenValidator
+
+COMPARED_METRICS = ('mean_ms', 'p50_ms', 'p95_ms', 'max_ms')
+
+# Everything the kiosk imports before its first frame, short of Tk itself.
+SCANNER_MODULES = (
+    'utils.bridge', 'utils.async_bridge', 'utils.journal', 'utils.metrics', 'utils.mjpeg', 'utils.pipeline',
+    'utils.roster', 'utils.scheduler', 'utils.startup', 'utils.token_validator'
+)
+
+
+def time_imports(modules: tuple[str, ...] = SCANNER_MODULES) -> float:
+    """Seconds a fresh interpreter takes to import `modules`."""
+
+    code = (
+        'import time; start = time.perf_counter(); '
+        f'import {", ".join(modules)}; '
+        'print(time.perf_counter() - start)'
+    )
+    completed = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def write_pass_video(path: str, token: str, frames: int = 30, frame_size: tuple[int, int] = (1280, 720)):
+    """
+    A short MJPEG AVI of a pass held up to the camera, moving a little between frames as it does in a hand, so that
+    one unlucky frame can't keep a start from ever getting a verdict.
+    """
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30.0, frame_size)
+
+    for index in range(frames):
+        writer.write(synthetic_pass(token, 5, 0.0, 0.0, 0, False, frame_size, random.Random(index)))
+
+    writer.release()
+
+
+def start_once(source: str, mode: str, connect_timeout: float, read_timeout: float, limit: float) -> dict:
+    """
+    Start a scanner the `mode` way and time it. The keystore must already hold enrolled credentials. Returns seconds
+    from launch to the first frame and to the first final verdict (None if there was none within `limit` seconds).
+    """
+
+    verdict_event = threading.Event()
+    times: dict[str, Optional[float]] = {'first_frame': None, 'first_verdict': None}
+
+    start = time.perf_counter()
+
+    bridge = ServerBridge(connect_timeout, read_timeout, load=False)
+    validator = TokenValidator()
+
+    if mode == 'serial':
+        run_startup(bridge, validator)
+
+    def on_result(result: ScanResult):
+        if result.verification is not None and not result.provisional and times['first_verdict'] is None:
+            times['first_verdict'] = time.perf_counter() - start
+            verdict_event.set()
+
+    async_bridge = AsyncServerBridge(bridge)
+    pipeline = ScanPipeline(open_capture(source), async_bridge, validator, name='Startup', on_result=on_result)
+    pipeline.start()
+
+    if mode == 'parallel':
+        start_background(bridge, validator)
+
+    deadline = start + limit
+
+    while time.perf_counter() < deadline:
+        if pipeline.latest_frame() is not None:
+            times['first_frame'] = time.perf_counter() - start
+            break
+
+        time.sleep(0.001)
+
+    verdict_event.wait(max(0.0, deadline - time.perf_counter()))
+
+    pipeline.stop()
+    pipeline.capture.close()
+    async_bridge.shutdown()
+    bridge.close()
+
+    return times
+
+
+def run(
+        source: str, address: str, runs: int = 5, import_runs: int = 5, connect_timeout: float = 3.05,
+        read_timeout: float = 5.0, limit: float = 30.0
+) -> dict:
+    """Time `runs` starts in each mode. A kiosk must already be enrolled with the server at `address`."""
+
+    stages = {'import': summarize([time_imports() for _ in range(import_runs)])}
+    missed = {}
+
+    for mode in ('serial', 'parallel'):
+        samples: dict[str, list[float]] = {'first_frame': [], 'first_verdict': []}
+        missed[mode] = 0
+
+        for _ in range(runs):
+            for name, elapsed in start_once(source, mode, connect_timeout, read_timeout, limit).items():
+                if elapsed is None:
+                    missed[mode] += 1
+                else:
+                    samples[name].append(elapsed)
+
+        for name, values in samples.items():
+            stages[f'{mode}_{name}'] = summarize(values)
+
+    return {
+        'environment': environment(),
+        'config': {
+            'source': source,
+            'address': address,
+            'runs': runs,
+            'import_runs': import_runs,
+            'timeout': [connect_timeout, read_timeout]
+        },
+        'stages': stages,
+        'missed': missed
+    }
+
+
+def print_report(report: dict):
+    config = report['config']
+    print(f"{config['runs']} starts per mode from {config['source']} against {config['address']}")
+    print()
+
+    print(f"{'stage':<26}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+
+    for name, stage in report['stages'].items():
+        if stage['count'] == 0:
+            print(f'{name:<26}{0:>7}')
+            continue
+
+        print(
+            f"{name:<26}{stage['count']:>7}{stage['mean_ms']:>10.1f}{stage['p50_ms']:>10.1f}{stage['p95_ms']:>10.1f}"
+            f"{stage['max_ms']:>10.1f}"
+        )
+
+    for mode, count in report['missed'].items():
+        if count > 0:
+            print(f'{mode}: {count} milestones not reached within the time limit')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', help='camera stream or video file showing a pass (default: a synthetic video)')
+    parser.add_argument('--runs', type=int, default=5, help='starts per mode')
+    parser.add_argument('--import-runs', type=int, default=5)
+    parser.add_argument('--connect-timeout', type=float, default=3.05)
+    parser.add_argument('--read-timeout', type=float, default=5.0)
+    parser.add_argument('--limit', type=float, default=30.0, help='seconds to wait for each start to get a verdict')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='compare against a report saved with --json')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    mock = MockTicketingServer(seed=args.seed)
+    token = mock.issue_passes(1)[0]
+    mock.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = args.source
+
+        if source is None:
+            source = os.path.join(directory, 'pass.avi')
+            write_pass_video(source, token)
+
+        try:
+            # Leaves one enrolled kiosk's credentials in an in-memory keystore, for every start to load. Faults only
+            # start after that, as a kiosk that reboots is already enrolled.
+            enroll_kiosks(mock.address, mock.enroll_code, 1, args.connect_timeout, args.read_timeout)
+            mock.set_faults(faults_from_arguments(args))
+
+            report = run(
+                source, mock.address, args.runs, args.import_runs, args.connect_timeout, args.read_timeout, args.limit
+            )
+            report['config']['faults'] = mock.faults.as_dict()
+
+        finally:
+            mock.stop()
+
+    print_report(report)
+
+    if args.json is not None:
+        write_json(report, args.json)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        print()
+        print(f"Compared with {args.compare} ({baseline['environment'].get('commit')}):")
+
+        for line in compare(report, baseline, COMPARED_METRICS):
+            print(f'  {line}')
+
+
+if __name__ == '__main__':
+    main()
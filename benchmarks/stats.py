@@ -0,0 +1,100 @@
+"""
+Latency summaries and machine-readable reports shared by the benchmarks.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+def summarize(samples: list[float]) -> dict:
+    """Summarize durations in seconds. Latencies are reported in milliseconds, throughput in operations per second."""
+
+    if len(samples) == 0:
+        return {'count': 0}
+
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    total = float(np.sum(values)) / 1000
+
+    return {
+        'count': len(samples),
+        'throughput_per_s': len(samples) / total if total > 0 else 0.0,
+        'mean_ms': float(np.mean(values)),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(np.max(values))
+    }
+
+
+def peak_rss_kib() -> Optional[int]:
+    """Peak resident set size of this process, where the platform reports it."""
+
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if platform.system() == 'Darwin' else peak
+
+
+def environment() -> dict:
+    """What a run was measured on, so results from different machines and commits aren't compared by mistake."""
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__
+    }
+
+
+def write_json(report: dict, path: str):
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+def compare(report: dict, baseline: dict, metrics: tuple[str, ...]) -> list[str]:
+    """
+    Lines comparing every stage of `report` with the same stage in `baseline`, for each of `metrics` present in both.
+    Stages are the entries of the `stages` dict of each report.
+    """
+
+    lines = []
+
+    for stage, current in report.get('stages', {}).items():
+        previous = baseline.get('stages', {}).get(stage)
+
+        if previous is None:
+            continue
+
+        for metric in metrics:
+            if metric not in current or metric not in previous:
+                continue
+
+            before, after = previous[metric], current[metric]
+            change = f'{(after - before) / before:+.1%}' if before else 'n/a'
+
+            lines.append(f'{stage:<26} {metric:<18} {before:>12.3f} -> {after:>12.3f}  ({change})')
+
+    return lines
@@ -1,19 +1,39 @@
+import queue
 import tkinter as tk
 
-import utils
 from frames import generate_font
 from frames.info_frame import InfoFrame
-from utils.bridge import ServerBridge
+from utils.admit import AutoAdmitter
+from utils.assignment import AssignmentSnapshot
+from utils.async_bridge import AsyncServerBridge
+from utils.journal import AttendanceJournal
+from utils.pipeline import ScanResult
 
 
 class AdmittanceFrame:
-    def __init__(self, parent: tk.Misc, bridge: ServerBridge, info_frame: InfoFrame):
+    def __init__(
+            self, parent: tk.Misc, bridge: AsyncServerBridge, info_frame: InfoFrame, journal: AttendanceJournal,
+            admitter: AutoAdmitter
+    ):
         self.frame = tk.Frame(parent, width=parent.winfo_screenwidth() // 2, height=parent.winfo_screenheight() // 2)
         self.canvas = tk.Canvas(self.frame, width=self.frame.cget('width'), height=self.frame.cget('height'))
 
         self.bridge = bridge
         self.info_frame = info_frame
+        self.journal = journal
+        self.admitter = admitter
         self.qr = None
+        self.result = None
+
+        # Marks are refused for "!ALL!" assignments, so the button stays disabled under one.
+        self.verify_only = False
+
+        # Outcomes of automatic marks, as (token, text), from the admitter and journal threads.
+        self._outcomes: queue.SimpleQueue[tuple[str, str]] = queue.SimpleQueue()
+        self._last_outcome: tuple[str, str] = ('', '')
+
+        self.admitter.subscribe(self._on_admitted)
+        self.journal.subscribe(self._on_settled)
 
         self.canvas.pack()
 
@@ -26,21 +46,80 @@ class AdmittanceFrame:
         )
         self.mark_attendance_button['state'] = 'disabled'
 
-        self.invert_color_button = tk.Button(
-            self.canvas, text='Invert Color', font=generate_font(),
-            command=self.invert_color
+        self.auto_admit = tk.BooleanVar(value=self.admitter.enabled)
+        self.auto_admit_button = tk.Checkbutton(
+            self.canvas, text='Auto-admit', font=generate_font(font_size=14), variable=self.auto_admit,
+            command=self._toggle_auto_admit
         )
 
+        self.pending_label = tk.Label(self.canvas, text='', font=generate_font(font_size=14))
+
+        self.auto_admit_button.place(relx=0.5, rely=0.3, anchor=tk.CENTER)
         self.mark_attendance_button.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-        self.invert_color_button.place(relx=0.5, rely=0.25, anchor=tk.CENTER)
+        self.pending_label.place(relx=0.5, rely=0.7, anchor=tk.CENTER)
+
+        self._refresh_pending_count()
+        self._poll_outcomes()
 
     def mark_attendance(self):
-        if self.qr is None:
+        if self.qr is None or self.result is None:
             return
 
         decode = self.qr.data.decode('utf-8')
-        if self.bridge.mark_attendance(decode):
-            self.info_frame.update_pass_info_box([self.qr], 'Marked')
 
-    def invert_color(self):
-        utils.INVERT_COLOR = not utils.INVERT_COLOR
+        if self.journal.record(decode):
+            self.mark_attendance_button['state'] = 'disabled'
+            self.info_frame.update_pass_info_box(self.result, 'Marked')
+        else:
+            self.info_frame.update_pass_info_box(self.result, 'Not marked')
+
+    def show_outcome(self, result: ScanResult):
+        """Show how the automatic mark for `result` went, if it is already known. Must run on the Tk thread."""
+
+        token, text = self._last_outcome
+
+        if token == result.token:
+            self.info_frame.update_pass_info_box(result.verification, text)
+
+    def _toggle_auto_admit(self):
+        self.admitter.enabled = self.auto_admit.get()
+
+        if self.admitter.enabled:
+            self.mark_attendance_button['state'] = 'disabled'
+
+    def _on_admitted(self, result: ScanResult, marked: bool):
+        self._outcomes.put((result.token, 'Admitted' if marked else 'Not marked'))
+
+    def _on_settled(self, token: str, status: int):
+        # Only rejections are news; an accepted mark already shows as admitted.
+        if status != 200:
+            self._outcomes.put((token, f'Mark rejected ({status})'))
+
+    def _poll_outcomes(self):
+        while True:
+            try:
+                self._last_outcome = self._outcomes.get_nowait()
+            except queue.Empty:
+                break
+
+            token, text = self._last_outcome
+
+            # Outcomes for earlier patrons are not shown over the current one's verdict.
+            if self.result is not None and self.qr is not None and self.qr.data.decode('utf-8') == token:
+                self.info_frame.update_pass_info_box(self.result, text)
+
+        self.frame.after(100, self._poll_outcomes)
+
+    def apply_assignment(self, snapshot: AssignmentSnapshot):
+        """The assignment changed: the verdict on screen was for the previous one, so it can no longer be marked."""
+
+        self.verify_only = snapshot.verify_only
+        self.qr = None
+        self.result = None
+        self.mark_attendance_button['state'] = 'disabled'
+
+    def _refresh_pending_count(self):
+        pending = self.journal.pending_count()
+        self.pending_label.config(text=f'Awaiting sync: {pending}' if pending > 0 else '')
+
+        self.frame.after(1000, self._refresh_pending_count)
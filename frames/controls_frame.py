@@ -1,5 +1,7 @@
 import socket
+import threading
 import tkinter as tk
+from concurrent.futures import Future
 from typing import Optional
 
 from utils.bridge import ServerBridge
@@ -7,28 +9,48 @@ from frames import generate_font
 
 
 class ControlsFrame:
-    def __init__(self, parent: tk.Misc):
+    """
+    Enrollment form, shown once the kiosk's shared `ServerBridge` has loaded and turned out not to be enrolled. The
+    connectivity check runs on a background thread, so it never holds up the window or the cameras.
+    """
+
+    def __init__(self, parent: tk.Misc, server_bridge: ServerBridge):
         self.frame = tk.Frame(parent, width=parent.winfo_screenwidth() // 2, height=parent.winfo_screenheight() // 2)
         self.canvas = tk.Canvas(self.frame, width=self.frame.cget('width'), height=self.frame.cget('height'))
 
+        self.server_bridge = server_bridge
+
         self.canvas.pack()
 
-        self._post_init()
-        self._init_form()
+        self.status_label = tk.Label(self.canvas, text='Checking connection...')
+        self.status_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
 
-    def _post_init(self):
-        internet_connection = self.is_connected_to_internet()
+        self._probe: Future = Future()
+        threading.Thread(target=self._check_connection, daemon=True).start()
 
-        if not internet_connection:
-            tk.Label(self.canvas, text='Not connected to internet').place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+        self._await_probe()
+
+    def _check_connection(self):
+        self.server_bridge.loaded.wait()
+        self._probe.set_result(self.is_connected_to_internet())
+
+    def _await_probe(self):
+        if not self._probe.done():
+            self.frame.after(100, self._await_probe)
             return
 
-        self.server_bridge = ServerBridge()
+        self._post_init(self._probe.result())
+
+    def _post_init(self, internet_connection: bool):
+        if not internet_connection:
+            self.status_label.config(text='Not connected to internet')
+            return
 
         if not self.server_bridge.need_init:
-            tk.Label(self.canvas, text='Initialization not required.').place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+            self.status_label.config(text='Initialization not required.')
             return
 
+        self.status_label.place_forget()
         self._init_form()
 
     def _init_form(self):
@@ -68,24 +90,16 @@ class ControlsFrame:
 
         if code_int is not None:
             self.server_bridge.enroll(self.origin_entry.get(), code_int, self.name_entry.get())
-            self.server_bridge.need_init = False
-
-            if self.server_bridge.get_assignment():
-                assignment = self.server_bridge.assignment
-                print(assignment.get('a_id'))
-                print(assignment.get('name'))
-
-            else:
-                print('No assignment found.')
 
-            # TODO: Populate the assignment for the server bridge here.
+            # The assignment watcher fetches the new assignment and shows it along with the enrollment.
+            self.server_bridge.refresh_assignment()
 
     @staticmethod
-    def is_connected_to_internet(host: str = "8.8.8.8", port: int = 53, timeout: int = 5) -> bool:
+    def is_connected_to_internet(host: str = "8.8.8.8", port: int = 53, timeout: float = 3.0) -> bool:
+        # The timeout applies to this socket only; setting a process-wide default would also bind every other thread.
         try:
-            socket.setdefaulttimeout(timeout)
-            socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-            return True
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
 
-        except socket.error:
+        except OSError:
             return False
@@ -3,11 +3,13 @@ Information frame containing its respective frame and canvas.
 """
 
 import tkinter as tk
+from collections import Counter
 from enum import Enum
 from typing import Optional
 
 import frames
 from utils.bridge import ServerBridge
+from utils.pipeline import ScanResult
 
 
 class QueryResult(Enum):
@@ -71,10 +73,16 @@ class InfoFrame:
             bg=bg_color
         )
 
+        # Only shown while several passes are in view at once.
+        self.group_label = tk.Label(
+            self.canvas, text='', font=frames.generate_font(font_size=14), fg=fg_color, bg=bg_color
+        )
+
         self.id_label.place(relx=0.5, rely=0, anchor=tk.N)
         self.name_label.place(relx=0.5, rely=0.35, anchor=tk.CENTER)
         self.phone_number_label.place(relx=0.5, rely=0.45, anchor=tk.CENTER)
         self.pass_type_label.place(relx=0.5, rely=0.55, anchor=tk.CENTER)
+        self.group_label.place(relx=0.5, rely=0.63, anchor=tk.CENTER)
 
         self.generate_pass_info_box()
 
@@ -86,6 +94,13 @@ class InfoFrame:
         self.phone_number_label.config(text=phone_number)
         self.pass_type_label.config(text=pass_type)
 
+    def set_group(self, group: dict[bytes, Optional[ScanResult]]):
+        text = group_summary(group)
+
+        # Called on every UI tick; only touch the label when the summary changes.
+        if text != self.group_label.cget('text'):
+            self.group_label.config(text=text)
+
     def generate_pass_info_box(self, result=None):
         canvas_width = int(self.canvas.cget('width'))
         canvas_height = int(self.canvas.cget('height'))
@@ -113,15 +128,7 @@ class InfoFrame:
 
         self.text_label.place(relx=0.5, rely=0.8, anchor=tk.CENTER)
 
-    def update_pass_info_box(self, qr_codes, status: Optional[str] = None):
-        if len(qr_codes) == 0:
-            return
-
-        qr = qr_codes[0]
-
-        data = qr.data.decode('utf-8')
-        result = self.bridge.verify(data)
-
+    def update_pass_info_box(self, result: dict, status: Optional[str] = None):
         if status is None:
             status_code = result['status']
 
@@ -135,4 +142,22 @@ class InfoFrame:
             self.canvas.itemconfig(self.dialog_box, fill='yellow')
             self.text_label.config(bg='orange')
 
-        self.text_label.config(text=result['text'])
+        self.text_label.config(text=result['text'] if status is None else status)
+
+
+def group_summary(group: dict[bytes, Optional[ScanResult]]) -> str:
+    """
+    One line tallying the verdicts for a group of passes in view, e.g. "Group of 3: 2 valid, 1 ALREADY MARKED". Empty
+    for a single pass, whose verdict the info box already shows.
+    """
+
+    if len(group) < 2:
+        return ''
+
+    tally = Counter(
+        'checking' if result is None or result.verification is None or result.provisional
+        else result.verification['text']
+        for result in group.values()
+    )
+
+    return f'Group of {len(group)}: ' + ', '.join(f'{count} {text}' for text, count in tally.items())
@@ -0,0 +1,138 @@
+"""
+Conversion of captured frames into the images shown on screen. Kept free of window-system calls, so it can also be
+used (and benchmarked) without a display.
+"""
+
+from typing import Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+from PIL.ImageTk import PhotoImage
+
+from utils.pipeline import DecodedFrame, ScanResult
+
+# Box colours (BGR) by verdict, matching the info panel: yellow while checking, orange for a provisional verdict.
+PENDING_COLOR = (0, 255, 255)
+PROVISIONAL_COLOR = (0, 165, 255)
+VALID_COLOR = (0, 255, 0)
+REJECTED_COLOR = (0, 0, 255)
+
+
+class FrameRenderer:
+    """
+    Renders frames into one video tile without allocating anything per frame. The frame is resized into a preallocated
+    BGR buffer, boxes are drawn on that copy, and it is converted straight into a preallocated RGBA buffer. That buffer
+    is copied into a persistent PIL image, which is pasted into a single persistent `PhotoImage` that Tk redraws in
+    place.
+
+    The PIL image is allocated as a single block (see `new_block_image()`), as `PhotoImage.paste()` only hands a
+    block-backed image to Tk as it is; any other image (including one from `Image.new()` or `Image.frombuffer()`) is
+    first copied into a newly allocated block on every paste.
+    """
+
+    def __init__(self, size: tuple[int, int]):
+        width, height = size
+        self.size = size
+
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        self._rgba = np.empty((height, width, 4), dtype=np.uint8)
+        self._image = new_block_image(size)
+
+        # Created on first use, as a PhotoImage needs the Tk root to exist.
+        self.photo_image: Optional[PhotoImage] = None
+
+    def convert(self, decoded_frame: DecodedFrame) -> Image.Image:
+        """
+        Resize the frame, draw a box around every code with its verdict, and convert it to RGBA. Returns the renderer's
+        persistent PIL image, refreshed in place.
+        """
+
+        # Decoded ahead on the capture thread where possible; the full frame is only decoded here as a fallback.
+        if decoded_frame.display_buffer is not None:
+            frame_buffer = decoded_frame.display_buffer
+        else:
+            frame_buffer = decoded_frame.frame_buffer
+
+        height, width = frame_buffer.shape[:2]
+
+        cv2.resize(frame_buffer, self.size, dst=self._resized)
+
+        # Codes are located in full-frame coordinates.
+        reduction = decoded_frame.display_reduction if decoded_frame.display_buffer is not None else 1
+        scale = self.size[0] / (width * reduction), self.size[1] / (height * reduction)
+
+        for qr in decoded_frame.qr_codes:
+            draw_qr_verdict(self._resized, qr, decoded_frame.results.get(qr.data), scale)
+
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGBA, dst=self._rgba)
+        self._image.frombytes(self._rgba)
+
+        return self._image
+
+    def render(self, decoded_frame: DecodedFrame) -> PhotoImage:
+        image = self.convert(decoded_frame)
+
+        if self.photo_image is None:
+            self.photo_image = PhotoImage('RGBA', self.size)
+
+        self.photo_image.paste(image)
+
+        return self.photo_image
+
+
+def new_block_image(size: tuple[int, int]) -> Image.Image:
+    """
+    An RGBA image of `size` allocated as a single block. Pillow has no public way to ask for one, so this goes through
+    its internals (present in the Pillow pinned in requirements.txt). Should a Pillow release change them, it falls
+    back to a plain `Image.new()`, which renders the same at the cost of a copy per paste.
+    """
+
+    image = Image.new('RGBA', size)
+
+    try:
+        return image._new(image.im.new_block('RGBA', size))
+    except (AttributeError, TypeError, ValueError):
+        return image
+
+
+def verdict_color(result: Optional[ScanResult]) -> tuple[int, int, int]:
+    if result is None or result.verification is None:
+        return PENDING_COLOR
+
+    if result.provisional:
+        return PROVISIONAL_COLOR
+
+    return VALID_COLOR if result.verification['status'] == 200 else REJECTED_COLOR
+
+
+def draw_qr_verdict(frame_buffer, qr, result: Optional[ScanResult], scale: tuple[float, float] = (1.0, 1.0)):
+    """Box a code in the colour of its verdict and write the verdict above it, once there is one."""
+
+    color = verdict_color(result)
+    draw_qr_bounding_box(frame_buffer, qr, scale, color)
+
+    if result is None or result.verification is None:
+        return
+
+    left = int(min(point.x for point in qr.polygon) * scale[0])
+    top = int(min(point.y for point in qr.polygon) * scale[1])
+
+    # Kept inside the tile for codes at its top edge.
+    cv2.putText(
+        frame_buffer, result.verification['text'], (left, max(16, top - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2
+    )
+
+
+def draw_qr_bounding_box(
+        frame_buffer, qr, scale: tuple[float, float] = (1.0, 1.0), color: tuple[int, int, int] = VALID_COLOR
+):
+    pt1x = min(point.x for point in qr.polygon)
+    pt1y = min(point.y for point in qr.polygon)
+    pt2x = max(point.x for point in qr.polygon)
+    pt2y = max(point.y for point in qr.polygon)
+
+    pt1 = (int(pt1x * scale[0]), int(pt1y * scale[1]))
+    pt2 = (int(pt2x * scale[0]), int(pt2y * scale[1]))
+
+    cv2.rectangle(frame_buffer, pt1, pt2, color, 3)
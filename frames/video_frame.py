@@ -1,56 +1,69 @@
+import math
 import tkinter as tk
 from ctypes import windll
 from typing import Optional
 
-import cv2
-from PIL import Image
 from PIL.ImageTk import PhotoImage
 
-import utils
 from frames.admittance_frame import AdmittanceFrame
 from frames.info_frame import InfoFrame
-from utils import decode_qr, get_buffer_and_qr_codes
+from frames.renderer import FrameRenderer
 from utils.bridge import ServerBridge
-from utils.video_capture import VideoCapture
+from utils.metrics import REGISTRY, MetricsRegistry
+from utils.pipeline import DecodedFrame, ScanPipeline, ScanResult
 
 
 class VideoFrame:
-    def __init__(self, parent: tk.Misc, bridge: ServerBridge, info_frame: InfoFrame, admittance_frame: AdmittanceFrame):
+    def __init__(
+            self, parent: tk.Misc, bridge: ServerBridge, info_frame: InfoFrame, admittance_frame: AdmittanceFrame,
+            lanes: int = 1
+    ):
         self.frame = tk.Frame(parent, width=parent.winfo_screenwidth() // 2, height=parent.winfo_screenheight() // 2)
-        self.image_size = windll.user32.GetSystemMetrics(0) // 2, windll.user32.GetSystemMetrics(1) // 2
+
+        # One tile per camera lane, laid out in the most square grid that fits them.
+        self.columns = math.ceil(math.sqrt(lanes))
+        self.rows = math.ceil(lanes / self.columns)
+        self.image_size = (
+            windll.user32.GetSystemMetrics(0) // 2 // self.columns, windll.user32.GetSystemMetrics(1) // 2 // self.rows
+        )
 
         self.bridge = bridge
         self.info_frame = info_frame
         self.admittance_frame = admittance_frame
 
-        self.video_label: Optional[tk.Label] = None
+        self.video_labels: list[Optional[tk.Label]] = [None] * lanes
+        self.renderers = [FrameRenderer(self.image_size) for _ in range(lanes)]
+
+        # Live diagnostics drawn over the video tiles, toggled with `toggle_overlay()`.
+        self.overlay_label = tk.Label(
+            self.frame, font=('Consolas', 10), justify=tk.LEFT, anchor=tk.NW, fg='#00ff00', bg='black'
+        )
+        self.overlay_visible = False
 
-    def generate_image(self, capture: VideoCapture) -> Image:
-        frame_buffer, qr_codes = get_buffer_and_qr_codes(capture)
+    def generate_image(self, decoded_frame: DecodedFrame, lane: int = 0) -> PhotoImage:
+        """Render into the lane's persistent `PhotoImage` and return it. The same object is returned on every call."""
 
-        if len(qr_codes) > 0:
-            qr = qr_codes[0]
-            self.admittance_frame.qr = qr
+        return self.renderers[lane].render(decoded_frame)
 
-            if qr.data == utils.QR_DATA_PREVIOUS:
-                frame_buffer = cv2.resize(frame_buffer, (self.image_size[0], self.image_size[1]))
-                return PhotoImage(image=Image.fromarray(cv2.cvtColor(frame_buffer, cv2.COLOR_BGR2RGBA)))
+    def apply_result(self, result: ScanResult):
+        """Paint a finished verification onto the info and admittance frames. Must run on the Tk thread."""
 
-            utils.QR_DATA_PREVIOUS = qr.data
+        self.admittance_frame.qr = result.qr
 
-            request = self.bridge.verify(qr.data.decode('utf-8'))
+        if result.verification is None:
+            return
 
-            if request is not None:
-                if request['text'] == 'valid':
-                    self.admittance_frame.mark_attendance_button['state'] = 'active'
-                else:
-                    self.admittance_frame.mark_attendance_button['state'] = 'disabled'
+        self.admittance_frame.result = result.verification
 
-            decoded = decode_qr(qr)
-            if decoded is None:
-                frame_buffer = cv2.resize(frame_buffer, (self.image_size[0], self.image_size[1]))
-                return PhotoImage(image=Image.fromarray(cv2.cvtColor(frame_buffer, cv2.COLOR_BGR2RGBA)))
+        # Under auto-admit the mark is already on its way, see `AutoAdmitter`.
+        if not result.provisional and result.verification['text'] == 'valid' and not self.admittance_frame.verify_only \
+                and not self.admittance_frame.auto_admit.get():
+            self.admittance_frame.mark_attendance_button['state'] = 'active'
+        else:
+            self.admittance_frame.mark_attendance_button['state'] = 'disabled'
 
+        decoded = result.pass_info
+        if decoded is not None:
             if decoded['type'] == '!STAFF!':
                 pass_type = 'STAFF'
             elif decoded['type'] == '!ALL!':
@@ -60,33 +73,105 @@ class VideoFrame:
 
             self.info_frame.set_data(decoded['_id'], decoded['name'], decoded['phone'], pass_type)
 
-            draw_qr_bounding_box(frame_buffer, qr)
+        if result.provisional:
+            self.info_frame.update_pass_info_box(result.verification, result.verification['text'])
+        else:
+            self.info_frame.update_pass_info_box(result.verification)
+            self.admittance_frame.show_outcome(result)
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
 
-        frame_buffer = cv2.resize(frame_buffer, (self.image_size[0], self.image_size[1]))
-        self.info_frame.update_pass_info_box(qr_codes)
+        if self.overlay_visible:
+            self.overlay_label.place(x=0, y=0)
+            self.overlay_label.lift()
+        else:
+            self.overlay_label.place_forget()
 
-        return PhotoImage(image=Image.fromarray(cv2.cvtColor(frame_buffer, cv2.COLOR_BGR2RGBA)))
+    def refresh_overlay(self, pipelines: list[ScanPipeline]):
+        """Redraw the diagnostics overlay, if shown. Must run on the Tk thread."""
 
-    def refresh_image(self, photo_image: Optional[PhotoImage]):
+        if self.overlay_visible:
+            self.overlay_label.config(text='\n'.join(diagnostics_lines(pipelines)))
+
+    def refresh_image(self, photo_image: Optional[PhotoImage], lane: int = 0):
         if photo_image is None:
-            self.video_label = None
+            self.video_labels[lane] = None
 
-        if self.video_label is None:
-            self.video_label = tk.Label(self.frame, image=photo_image)
-        else:
-            self.video_label.config(image=photo_image)
+        video_label = self.video_labels[lane]
+
+        if video_label is None:
+            video_label = tk.Label(self.frame, image=photo_image)
+            video_label.grid(row=lane // self.columns, column=lane % self.columns)
+
+            self.video_labels[lane] = video_label
+
+        # The renderer updates its PhotoImage in place, so the label only needs touching if the image object changed.
+        elif video_label.image is not photo_image:
+            video_label.config(image=photo_image)
+
+        video_label.image = photo_image
+
+
+def diagnostics_lines(pipelines: list[ScanPipeline], registry: MetricsRegistry = REGISTRY) -> list[str]:
+    """Summary of the live metrics, a few lines per lane and a few for the server and the UI."""
+
+    def value(name: str, **labels) -> float:
+        metric = registry.get(name, **labels)
+        return metric.value if metric is not None else 0.0
+
+    def rate(name: str, **labels) -> float:
+        metric = registry.get(name, **labels)
+        return metric.rate() if metric is not None else 0.0
+
+    def ms(histograms: list, q: float) -> str:
+        values = [histogram.quantile(q) for histogram in histograms if histogram is not None]
+        values = [v for v in values if v is not None]
+
+        return f'{max(values) * 1000:.0f}' if len(values) > 0 else '-'
+
+    lines = []
+
+    for pipeline in pipelines:
+        source = str(pipeline.capture.name)
+        decode = [registry.get('decode_seconds', lane=pipeline.name)]
+        scan = [registry.get('scan_latency_seconds', lane=pipeline.name)]
+
+        lines.append(
+            f'{pipeline.name or "Lane"}: display {rate("frames_rendered_total", lane=pipeline.name):.1f} fps, '
+            f'camera {rate("capture_frames_total", source=source):.1f} fps, '
+            f'{value("capture_frames_dropped_total", source=source):.0f} dropped'
+        )
+        lines.append(
+            f'  decode p50 {ms(decode, 0.5)} / p95 {ms(decode, 0.95)} ms, '
+            f'scan p95 {ms(scan, 0.95)} ms, {value("decode_skipped_total", lane=pipeline.name):.0f} skipped, '
+            f'{value("decode_throttled_total", lane=pipeline.name):.0f} throttled'
+        )
+        lines.append(
+            f'  hit rate {value("decode_hit_ratio", lane=pipeline.name):.0%}, '
+            f'first-try {value("decode_first_try_hit_ratio", lane=pipeline.name):.0%}'
+        )
 
-        self.video_label.image = photo_image
-        self.video_label.pack(expand=True, fill=tk.BOTH)
+    for endpoint in ('/verify', '/mark'):
+        histograms = [
+            histogram for labels, histogram in registry.children('server_request_seconds')
+            if labels['endpoint'].endswith(endpoint)
+        ]
+        errors = sum(
+            counter.value for labels, counter in registry.children('server_responses_total')
+            if labels['endpoint'].endswith(endpoint) and (labels['status'] == 'error' or labels['status'] >= '500')
+        )
 
+        lines.append(f'{endpoint}: p50 {ms(histograms, 0.5)} / p95 {ms(histograms, 0.95)} ms, {errors:.0f} errors')
 
-def draw_qr_bounding_box(frame_buffer, qr):
-    pt1x = min(qr.polygon[0].x, qr.polygon[1].x, qr.polygon[2].x, qr.polygon[3].x)
-    pt1y = min(qr.polygon[0].y, qr.polygon[1].y, qr.polygon[2].y, qr.polygon[3].y)
-    pt2x = max(qr.polygon[0].x, qr.polygon[1].x, qr.polygon[2].x, qr.polygon[3].x)
-    pt2y = max(qr.polygon[0].y, qr.polygon[1].y, qr.polygon[2].y, qr.polygon[3].y)
+    if registry.get('cpu_headroom_ratio') is not None:
+        lines.append(
+            f'Governor: {value("cpu_headroom_ratio") * 100:.0f}% CPU free, '
+            f'pressure {value("decode_pressure_ratio"):.2f}'
+        )
 
-    pt1 = (pt1x, pt1y)
-    pt2 = (pt2x, pt2y)
+    tick_lag = [registry.get('ui_tick_lag_seconds')]
+    render = [histogram for _, histogram in registry.children('render_seconds')]
+    lines.append(f'UI: tick lag p95 {ms(tick_lag, 0.95)} ms, render p95 {ms(render, 0.95)} ms')
 
-    cv2.rectangle(frame_buffer, pt1, pt2, (0, 255, 0), 3)
+    return lines
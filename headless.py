@@ -0,0 +1,314 @@
+"""
+Headless scanner, for turnstiles and other display-less gate hardware. Runs the same capture → decode → verify
+pipelines as the kiosk window, without importing Tk, and emits one JSON object per line for every verdict: on stdout,
+and to every client connected to a local TCP socket if `--socket` is given. With `--auto-mark`, valid passes have their
+attendance recorded in the offline journal as soon as the server confirms them.
+
+    python headless.py http://localhost:5000/video
+    python headless.py --socket 9200 --auto-mark http://cam1:8080/video http://cam2:8080/video
+
+Each event looks like:
+
+    {"event": "scan", "time": 1700000000.0, "lane": "Lane 1", "pass_id": "...", "pass_type": "GA", "status": 200,
+     "text": "valid", "subtext": "", "provisional": false, "admit": true, "marked": true, "latency_ms": 84.2}
+
+`admit` is only ever true for a final verdict on a valid or staff pass; a provisional verdict (from local signature
+checks alone) is followed by the server's. `marked` is null unless auto-marking was attempted.
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from typing import Optional, TextIO
+
+from utils.admit import is_markable
+from utils.assignment import AssignmentWatcher
+from utils.async_bridge import AsyncServerBridge
+from utils.bridge import ServerBridge
+from utils.governor import DEFAULT_SCAN_SLO, DecodeGovernor
+from utils.journal import AttendanceJournal
+from utils.metrics import MetricsServer
+from utils.mjpeg import DEFAULT_VIDEO_SOURCE, open_capture
+from utils.pipeline import ScanPipeline, ScanResult
+from utils.roster import PassRoster
+from utils.scheduler import DecodeScheduler
+from utils.startup import start_background
+from utils.token_validator import TokenValidator
+
+
+class JsonLinesSink:
+    """Writes events to a text stream, one JSON object per line, flushed straight away."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def write(self, event: dict):
+        self.stream.write(json.dumps(event) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class SocketSink:
+    """
+    Listens on a local TCP socket and sends every event to every connected client as a JSON line. Clients only get
+    events from the moment they connect; one that stops reading or disconnects is dropped.
+
+    Each client has its own sender thread fed by a queue of at most `max_queued` events, so `write()` never blocks: a
+    client that stalls holds up neither stdout nor the other clients, and is dropped once its queue is full or a send
+    takes longer than `send_timeout`.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9200, send_timeout: float = 0.5, max_queued: int = 100):
+        self.send_timeout = send_timeout
+        self.max_queued = max_queued
+
+        self._server = socket.create_server((host, port))
+        self._clients: dict[socket.socket, queue.Queue[Optional[bytes]]] = {}
+        self._lock = threading.Lock()
+
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def write(self, event: dict):
+        line = (json.dumps(event) + '\n').encode()
+
+        with self._lock:
+            clients = list(self._clients.items())
+
+        for client, lines in clients:
+            try:
+                lines.put_nowait(line)
+            except queue.Full:
+                self._drop(client)
+
+    def close(self):
+        self._server.close()
+
+        with self._lock:
+            clients = list(self._clients)
+
+        for client in clients:
+            self._drop(client)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+
+            client.settimeout(self.send_timeout)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            lines = queue.Queue(self.max_queued)
+
+            with self._lock:
+                self._clients[client] = lines
+
+            threading.Thread(target=self._send_loop, args=(client, lines), daemon=True).start()
+
+    def _send_loop(self, client: socket.socket, lines: queue.Queue[Optional[bytes]]):
+        while (line := lines.get()) is not None:
+            try:
+                client.sendall(line)
+            except OSError:
+                self._drop(client)
+                return
+
+    def _drop(self, client: socket.socket):
+        with self._lock:
+            lines = self._clients.pop(client, None)
+
+        if lines is None:
+            return
+
+        # Wakes the sender if it is waiting for a line; one stuck in a send fails as soon as the socket is closed.
+        try:
+            lines.put_nowait(None)
+        except queue.Full:
+            pass
+
+        client.close()
+
+
+def scan_event(result: ScanResult, marked: Optional[bool] = None) -> dict:
+    """The event emitted for a verdict. Carries the pass ID and type but none of the holder's personal details."""
+
+    verification = result.verification
+    pass_info = result.pass_info if result.pass_info is not None else {}
+
+    return {
+        'event': 'scan',
+        'time': time.time(),
+        'lane': result.lane,
+        'pass_id': pass_info.get('_id'),
+        'pass_type': pass_info.get('type'),
+        'status': verification['status'],
+        'text': verification['text'],
+        'subtext': verification['subtext'],
+        'provisional': result.provisional,
+        'admit': is_admitted(result),
+        'marked': marked,
+        'latency_ms': round(result.latency * 1000, 1)
+    }
+
+
+def is_admitted(result: ScanResult) -> bool:
+    """Whether the gate should open: a final verdict on a valid pass or a staff pass."""
+
+    return not result.provisional and result.verification['status'] == 200 \
+        and result.verification['text'] in ('valid', 'STAFF')
+
+
+class HeadlessScanner:
+    """
+    Collects results from the pipelines and emits them to `sinks` from a single thread, so sinks never need to be
+    thread-safe and a slow sink cannot hold up verification. With `auto_mark`, final verdicts on valid (non-staff)
+    passes are recorded in `journal`, which syncs them to the server in the background.
+    """
+
+    def __init__(
+            self, sinks: list, journal: Optional[AttendanceJournal] = None, auto_mark: bool = False,
+            provisional: bool = True
+    ):
+        self.sinks = sinks
+        self.journal = journal
+        self.auto_mark = auto_mark and journal is not None
+        self.provisional = provisional
+
+        self._results: queue.Queue[ScanResult] = queue.Queue()
+
+    def on_result(self, result: ScanResult):
+        """Pipeline `on_result` callback. Never blocks."""
+
+        if result.verification is not None and (self.provisional or not result.provisional):
+            self._results.put(result)
+
+    def run(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            try:
+                result = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            self.emit(result)
+
+    def emit(self, result: ScanResult):
+        marked = None
+
+        if self.auto_mark and is_markable(result, self.journal.bridge.assignment):
+            marked = self.journal.record(result.token)
+
+        event = scan_event(result, marked)
+
+        for sink in self.sinks:
+            try:
+                sink.write(event)
+            except OSError as e:
+                print(f'Headless Sink Error: {e}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sources', nargs='*', help=f'camera stream URLs (default {DEFAULT_VIDEO_SOURCE})')
+    parser.add_argument('--socket', type=int, metavar='PORT', help='also serve events to TCP clients on this port')
+    parser.add_argument('--socket-host', default='127.0.0.1')
+    parser.add_argument('--auto-mark', action='store_true', help='record attendance for valid passes automatically')
+    parser.add_argument('--no-provisional', action='store_true', help='only emit final verdicts')
+    parser.add_argument('--decode-workers', type=int, default=0, help='decode in this many processes, not threads')
+    parser.add_argument('--no-metrics', action='store_true', help='do not serve metrics on 127.0.0.1:9108')
+    parser.add_argument(
+        '--scan-slo', type=float, default=DEFAULT_SCAN_SLO, help='target scan latency in seconds, for the decode rate'
+    )
+    args = parser.parse_args()
+
+    # stdout carries the events, so everything else the scanner prints goes to stderr instead.
+    events_stream = sys.stdout
+    sys.stdout = sys.stderr
+
+    # Loaded in the background (see `start_background` below), so the cameras start straight away.
+    bridge = ServerBridge(load=False)
+    async_bridge = AsyncServerBridge(bridge)
+
+    journal = AttendanceJournal(bridge)
+    journal.start()
+
+    assignment_watcher = AssignmentWatcher(bridge)
+    bridge.assignment_watcher = assignment_watcher
+    assignment_watcher.start()
+
+    validator = TokenValidator()
+
+    # Only consulted for passes whose signature checks out, i.e. once the public key has arrived.
+    roster = PassRoster(bridge, validator)
+    bridge.roster = roster
+    roster.start()
+
+    sinks: list = [JsonLinesSink(events_stream)]
+    if args.socket is not None:
+        sinks.append(SocketSink(args.socket_host, args.socket))
+
+    scanner = HeadlessScanner(sinks, journal, args.auto_mark, not args.no_provisional)
+
+    video_sources = args.sources or [DEFAULT_VIDEO_SOURCE]
+
+    # Without a UI to leave a core for, every core can decode.
+    decode_scheduler = DecodeScheduler(workers=max(1, min(len(video_sources), os.cpu_count() or 1)))
+    decode_scheduler.start()
+
+    decode_governor = DecodeGovernor(slo=args.scan_slo)
+    decode_governor.start()
+
+    scan_pipelines = [
+        ScanPipeline(
+            open_capture(source), async_bridge, validator, decode_workers=args.decode_workers,
+            scheduler=decode_scheduler, name=f'Lane {index + 1}', on_result=scanner.on_result,
+            governor=decode_governor, authoritative=lambda: scanner.auto_mark
+        )
+        for index, source in enumerate(video_sources)
+    ]
+
+    for scan_pipeline in scan_pipelines:
+        scan_pipeline.start()
+
+    start_background(bridge, validator)
+
+    metrics_server = None
+    if not args.no_metrics:
+        metrics_server = MetricsServer()
+        metrics_server.start()
+
+    stop_event = threading.Event()
+
+    try:
+        scanner.run(stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    for scan_pipeline in scan_pipelines:
+        scan_pipeline.stop()
+        scan_pipeline.capture.close()
+        print(f'Decode ({scan_pipeline.name}): {scan_pipeline.decoder.stats.summary()}')
+
+    decode_scheduler.stop()
+    decode_governor.stop()
+    roster.stop()
+    assignment_watcher.stop()
+    async_bridge.shutdown()
+    journal.close()
+
+    for sink in sinks:
+        sink.close()
+
+    if metrics_server is not None:
+        metrics_server.stop()
+
+
+if __name__ == '__main__':
+    main()
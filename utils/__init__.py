@@ -3,28 +3,38 @@ import binascii
 import json
 from typing import Optional
 
-import cv2
-from pyzbar import pyzbar
-
+from utils.decoders import QrCode, QrDecoder, create_decoder
 from utils.video_capture import VideoCapture
 
-INVERT_COLOR = False
-QR_DATA_PREVIOUS = b''
+_default_decoder: Optional[QrDecoder] = None
 
 
-def get_buffer_and_qr_codes(capture: VideoCapture):
-    frame_buffer = capture.read()
+def get_buffer_and_qr_codes(
+        capture: VideoCapture, timeout: Optional[float] = None, decoder: Optional[QrDecoder] = None
+):
+    captured_frame = capture.read(timeout)
 
-    if frame_buffer is None:
+    if captured_frame is None:
         return None
 
-    if INVERT_COLOR:
-        frame_buffer = cv2.bitwise_not(frame_buffer)
+    return captured_frame.buffer, get_qr_codes(captured_frame.gray(), decoder)
+
+
+def get_qr_codes(frame_buffer, decoder: Optional[QrDecoder] = None) -> list[QrCode]:
+    """Decode with `decoder`, or with the first usable backend if None."""
+
+    global _default_decoder
+
+    if decoder is None:
+        if _default_decoder is None:
+            _default_decoder = create_decoder()
+
+        decoder = _default_decoder
 
-    return frame_buffer, pyzbar.decode(frame_buffer)
+    return decoder.decode(frame_buffer)
 
 
-def decode_qr(qr) -> Optional[dict]:
+def decode_qr(qr: QrCode) -> Optional[dict]:
     qr_data = qr.data.decode('utf-8').split('.')
 
     if len(qr_data) != 3:
@@ -0,0 +1,79 @@
+"""
+Auto-admit. Records attendance for valid passes as soon as the server confirms them, instead of waiting for the operator
+to press "Mark Attendance". Marks are committed to the `AttendanceJournal` off the scan path and synced by its flusher,
+so the mark for one patron overlaps with scanning the next.
+"""
+
+import queue
+import threading
+from typing import Callable, Optional
+
+from utils.journal import AttendanceJournal
+from utils.metrics import REGISTRY
+from utils.pipeline import ScanResult
+
+
+def is_markable(result: ScanResult, assignment: Optional[dict]) -> bool:
+    """
+    Whether attendance may be marked for `result` under `assignment`: a final verdict on a valid pass. Staff passes are
+    never marked, and nothing is marked without an assignment or under a verify-only "!ALL!" one.
+    """
+
+    return not result.provisional and result.verification is not None \
+        and result.verification['status'] == 200 and result.verification['text'] == 'valid' \
+        and assignment is not None and assignment['a_id'] != '!ALL!'
+
+
+class AutoAdmitter:
+    """
+    Marks attendance for every markable result passed to `offer()` while `enabled`. Results are recorded in `journal`
+    on the admitter's own thread, as a journal write waits on the disk and `offer()` is called on the pipelines' verify
+    threads.
+
+    Every function passed to `subscribe()` is called with the result and whether the journal recorded the mark (False
+    if the journal is full). Listeners run on the admitter thread and must not block. Whether the server later accepts
+    the mark is reported by the journal itself.
+    """
+
+    def __init__(self, journal: AttendanceJournal, enabled: bool = False):
+        self.journal = journal
+        self.enabled = enabled
+
+        self._listeners: list[Callable[[ScanResult, bool], None]] = []
+        self._results: queue.Queue[Optional[ScanResult]] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, listener: Callable[[ScanResult, bool], None]):
+        self._listeners.append(listener)
+
+    def offer(self, result: ScanResult):
+        """Pipeline `on_result` callback. Never blocks."""
+
+        if self.enabled and is_markable(result, self.journal.bridge.assignment):
+            self._results.put(result)
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._admit_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._results.put(None)
+
+    def _admit_loop(self):
+        while (result := self._results.get()) is not None:
+            # Switched off while the result was waiting.
+            if not self.enabled:
+                continue
+
+            marked = self.journal.record(result.token)
+
+            REGISTRY.counter(
+                'auto_admit_total', 'Marks recorded automatically, by outcome.',
+                outcome='recorded' if marked else 'refused'
+            ).inc()
+
+            for listener in self._listeners:
+                listener(result, marked)
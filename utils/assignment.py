@@ -0,0 +1,119 @@
+"""
+Background assignment refresh. Keeps `ServerBridge.assignment` current with cheap conditional polls, so nothing on the
+scan path ever waits on `/assignment`, and tells the UI whenever the assignment (or enrollment) changes.
+"""
+
+import random
+import threading
+from typing import Callable, Optional
+
+from utils.bridge import ServerBridge
+
+
+class AssignmentSnapshot:
+    """
+    The kiosk's enrollment and assignment at one moment, taken together so that listeners never see a new assignment
+    paired with a stale server or kiosk name.
+    """
+
+    def __init__(self, bridge: ServerBridge):
+        self.enrolled = not bridge.need_init
+        self.kiosk_name = bridge.kiosk_name
+        self.server_ip = bridge.server_ip
+        self.assignment = bridge.assignment
+
+    @property
+    def verify_only(self) -> bool:
+        """Whether the kiosk may only verify passes. Marks against a "!ALL!" assignment are refused by the server."""
+
+        return self.assignment is not None and self.assignment['a_id'] == '!ALL!'
+
+    def __eq__(self, other):
+        return isinstance(other, AssignmentSnapshot) and (
+            self.enrolled, self.kiosk_name, self.server_ip, self.assignment
+        ) == (other.enrolled, other.kiosk_name, other.server_ip, other.assignment)
+
+
+class AssignmentWatcher:
+    """
+    Polls the server for the kiosk's assignment every `interval` seconds, give or take a random `jitter` share of it so
+    that a fleet of kiosks rebooted together doesn't poll in lockstep. Polls are conditional (`If-None-Match`), so an
+    unchanged assignment costs a bodiless 304. `wake()` polls straight away, e.g. after the server rejected a mark with
+    a 409 because the assignment moved.
+
+    Every function passed to `subscribe()` is called with an `AssignmentSnapshot` once the bridge has loaded and again
+    whenever the snapshot changes. Listeners run on the watcher thread and must not block; UI listeners should hand the
+    snapshot over to the Tk thread.
+    """
+
+    def __init__(self, bridge: ServerBridge, interval: float = 30.0, jitter: float = 0.2):
+        self.bridge = bridge
+        self.interval = interval
+        self.jitter = jitter
+
+        self.snapshot: Optional[AssignmentSnapshot] = None
+
+        self._listeners: list[Callable[[AssignmentSnapshot], None]] = []
+        self._rng = random.Random()
+
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, listener: Callable[[AssignmentSnapshot], None]):
+        self._listeners.append(listener)
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._watch_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        """Poll now rather than at the next interval."""
+
+        self._wake_event.set()
+
+    def poll(self):
+        """Fetch the assignment if enrolled, and tell the listeners if anything changed."""
+
+        if not self.bridge.need_init:
+            self.bridge.get_assignment()
+
+        self._publish()
+
+    def _publish(self):
+        snapshot = AssignmentSnapshot(self.bridge)
+
+        if snapshot == self.snapshot:
+            return
+
+        self.snapshot = snapshot
+
+        for listener in self._listeners:
+            listener(snapshot)
+
+    def _next_delay(self) -> float:
+        return self.interval * (1 + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _watch_loop(self):
+        # Loading the bridge fetches the assignment already; only publish what it found.
+        while not self.bridge.loaded.wait(0.5):
+            if self._stop_event.is_set():
+                return
+
+        self._publish()
+
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self._next_delay())
+            self._wake_event.clear()
+
+            if self._stop_event.is_set():
+                break
+
+            self.poll()
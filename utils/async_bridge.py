@@ -0,0 +1,120 @@
+"""
+Non-blocking front for `ServerBridge`.
+"""
+
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Iterable
+
+from utils.bridge import ServerBridge
+
+
+class AsyncServerBridge:
+    """
+    Runs `ServerBridge` calls on a small thread pool and hands back `concurrent.futures.Future` objects (wrap them with
+    `asyncio.wrap_future()` to await them). Verifications are tracked per token while in flight: asking for a token that
+    is already being verified returns the same future, and `cancel_stale()` cancels every verification for passes that
+    are no longer in front of the camera. Verifications may be tagged with an `owner` (e.g. the camera lane that asked
+    for them) so that one lane only ever cancels its own. When several lanes ask for the same token they share the
+    verification, which is only cancelled once every one of them has let go of it.
+
+    Cancelling a verification resolves its future immediately. If the request is already on the wire it is left to
+    finish (it is bounded by the bridge timeouts) and only warms the verification cache, so it never holds up the pass
+    currently in view as long as a worker is free.
+    """
+
+    def __init__(self, bridge: ServerBridge, max_workers: int = 4):
+        self.bridge = bridge
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bridge')
+        self._in_flight: dict[str, Future] = {}
+        self._owners: dict[str, set] = {}
+        self._authoritative: dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def verify(self, token_string: str, owner: object = None, authoritative: bool = False) -> Future:
+        """See `ServerBridge.verify()`. An authoritative request never reuses one that may be answered locally."""
+
+        with self._lock:
+            future = self._in_flight.get(token_string)
+
+            if future is not None and not future.done() and (self._authoritative[token_string] or not authoritative):
+                self._owners[token_string].add(owner)
+                return future
+
+            future = self._submit(self.bridge.verify, token_string, authoritative)
+            self._in_flight[token_string] = future
+            self._owners[token_string] = {owner}
+            self._authoritative[token_string] = authoritative
+
+        future.add_done_callback(lambda _: self._forget(token_string, future))
+
+        return future
+
+    def cancel_stale(self, keep: Iterable[str] = (), owner: object = None) -> int:
+        """
+        Cancel in-flight verifications for every token not in `keep`. If `owner` is given, it only lets go of its own;
+        a verification shared with other owners carries on for them. Returns the number cancelled.
+        """
+
+        keep = set(keep)
+        stale = []
+
+        with self._lock:
+            for token, future in self._in_flight.items():
+                if token in keep:
+                    continue
+
+                owners = self._owners[token]
+
+                if owner is not None:
+                    if owner not in owners:
+                        continue
+
+                    owners.discard(owner)
+
+                    if len(owners) > 0:
+                        continue
+
+                stale.append(future)
+
+        return sum(future.cancel() for future in stale)
+
+    def shutdown(self):
+        self.cancel_stale()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args) -> Future:
+        # The caller gets its own future rather than the executor's, so it can be cancelled even once running.
+        result = Future()
+        work = self._executor.submit(fn, *args)
+
+        def _relay(done: Future):
+            if done.cancelled():
+                result.cancel()
+                return
+
+            try:
+                if done.exception() is not None:
+                    result.set_exception(done.exception())
+                else:
+                    result.set_result(done.result())
+
+            except InvalidStateError:
+                pass  # Cancelled by the caller while the request was running.
+
+        def _cancel_work(done: Future):
+            if done.cancelled():
+                work.cancel()
+
+        result.add_done_callback(_cancel_work)
+        work.add_done_callback(_relay)
+
+        return result
+
+    def _forget(self, token_string: str, future: Future):
+        with self._lock:
+            if self._in_flight.get(token_string) is future:
+                del self._in_flight[token_string]
+                del self._owners[token_string]
+                del self._authoritative[token_string]
@@ -1,48 +1,143 @@
+import threading
 from typing import Optional
+from urllib.parse import urlsplit
 
 import keyring
 import requests
+from keyring.errors import PasswordDeleteError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.cache import VerificationCache
+from utils.metrics import REGISTRY
+
+
+def _record_response(response: requests.Response, *args, **kwargs):
+    """Session hook recording the round trip and status code of every response from the server."""
+
+    endpoint = urlsplit(response.request.url).path or '/'
+
+    REGISTRY.histogram(
+        'server_request_seconds', 'Round trip of requests to the ticketing server.', endpoint=endpoint
+    ).observe(response.elapsed.total_seconds())
+    REGISTRY.counter(
+        'server_responses_total', 'Responses from the ticketing server.', endpoint=endpoint, status=response.status_code
+    ).inc()
+
+
+def _record_error(url: str):
+    """Count a request to `url` that got no response at all."""
+
+    REGISTRY.counter(
+        'server_responses_total', 'Responses from the ticketing server.', endpoint=urlsplit(url).path or '/',
+        status='error'
+    ).inc()
+
+
+def _record_verification(source: str):
+    REGISTRY.counter('verifications_total', 'Verdicts by where they came from.', source=source).inc()
 
 
 class ServerBridge:
     """
     Pull local data from system secure storage (if present). If `need_init` is True after this, then enrollment is
     needed before passes can be scanned. Otherwise, check if `self.assignment` is not None. If assignment exists,
-    everything is good. If assignment doesn't exist, call `get_assignment()` every few seconds until either the
-    assignment is received. Or a conflict forces the client to reset.
+    everything is good. An `AssignmentWatcher` attached as `assignment_watcher` keeps the assignment fresh in the
+    background, until a conflict forces the client to reset; nothing on the scan path ever fetches it.
+
+    All requests go through one pooled keep-alive session, so repeated calls reuse the same TCP/TLS connection. Every
+    request is bounded by `connect_timeout` and `read_timeout` (seconds), and idempotent GETs are retried up to
+    `retries` times with exponential backoff.
+
+    With `load=False`, nothing is read from secure storage or fetched from the server until `load()` is called, so the
+    kiosk can construct its one bridge straight away and load it on a background thread. `loaded` is set once it has.
     """
 
-    def __init__(self):
+    def __init__(
+            self, connect_timeout: float = 3.05, read_timeout: float = 5.0, retries: int = 2,
+            backoff_factor: float = 0.2, pool_size: int = 4, load: bool = True
+    ):
         self.need_init = True
+        self.loaded = threading.Event()
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = self._create_session(retries, backoff_factor, pool_size)
 
         self.assignment = None
+        self.verification_cache = VerificationCache()
 
-        kiosk_token: Optional[str] = None
-        kiosk_name: Optional[str] = None
+        # Optional `PassRoster` consulted by verify() before asking the server.
+        self.roster = None
 
-        server_ip = keyring.get_password('mp.ticketing.service', 'mp.server')
-        if server_ip is not None:
-            kiosk_token = keyring.get_password('mp.ticketing.service', server_ip)
-            kiosk_name = keyring.get_password('mp.ticketing.service', 'mp.kiosk.name')
+        # Optional `AssignmentWatcher` refreshing the assignment in the background.
+        self.assignment_watcher = None
+        self._assignment_etag: Optional[str] = None
 
-        if kiosk_token is None:
-            try:
-                keyring.delete_password('mp.ticketing.service', 'mp.server')
-                keyring.delete_password('mp.ticketing.service', 'mp.kiosk.name')
-            except:
-                print("Exception while deleting, continuing")
+        self.server_ip: Optional[str] = None
+        self.kiosk_token: Optional[str] = None
+        self.kiosk_name: Optional[str] = None
 
-        else:
-            self.need_init = False
-            self.server_ip = server_ip
-            self.kiosk_token = kiosk_token
+        if load:
+            self.load()
+
+    def load(self):
+        """
+        Read the stored credentials and, if enrolled, fetch the assignment, which also opens the pooled connection to
+        the server ahead of the first scan. Blocks on the keystore and on the network.
+        """
+
+        try:
+            kiosk_token: Optional[str] = None
+            kiosk_name: Optional[str] = None
+
+            server_ip = keyring.get_password('mp.ticketing.service', 'mp.server')
+            if server_ip is not None:
+                kiosk_token = keyring.get_password('mp.ticketing.service', server_ip)
+                kiosk_name = keyring.get_password('mp.ticketing.service', 'mp.kiosk.name')
+
+            if kiosk_token is None:
+                try:
+                    keyring.delete_password('mp.ticketing.service', 'mp.server')
+                    keyring.delete_password('mp.ticketing.service', 'mp.kiosk.name')
+                except:
+                    print("Exception while deleting, continuing")
 
-            if kiosk_name is None:
-                self.kiosk_name = 'Unnamed'
             else:
-                self.kiosk_name = kiosk_name
+                self.server_ip = server_ip
+                self.kiosk_token = kiosk_token
 
-            self.get_assignment()
+                if kiosk_name is None:
+                    self.kiosk_name = 'Unnamed'
+                else:
+                    self.kiosk_name = kiosk_name
+
+                # Only once the credentials are in place, as other threads may already be using the bridge.
+                self.need_init = False
+
+                self.get_assignment()
+
+        finally:
+            self.loaded.set()
+
+    @staticmethod
+    def _create_session(retries: int, backoff_factor: float, pool_size: int) -> requests.Session:
+        retry = Retry(
+            total=retries, backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET'}), raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.hooks['response'].append(_record_response)
+
+        return session
+
+    def close(self):
+        """Close the pooled connections."""
+
+        self.session.close()
 
     def clear_creds(self):
         """Utility function used to clear all stored credentials."""
@@ -52,12 +147,19 @@ class ServerBridge:
             keyring.delete_password('mp.ticketing.service', 'mp.server')
             keyring.delete_password('mp.ticketing.service', 'mp.kiosk.name')
 
+            try:
+                keyring.delete_password('mp.ticketing.service', 'mp.server.pubkey')
+            except PasswordDeleteError:
+                pass
+
             self.server_ip = None
             self.kiosk_token = None
             self.kiosk_name = None
             self.assignment = None
             self.need_init = True
 
+            self.verification_cache.clear()
+
     def enroll(self, address: str, code: str, name: str):
         """
         Register with the server and store credentials for future use. Credentials received are stored into system
@@ -71,7 +173,11 @@ class ServerBridge:
             'name': name
         }
 
-        enroll_response = requests.post(address + '/enroll', json=payload)
+        try:
+            enroll_response = self.session.post(address + '/enroll', json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f'Enrollment Error: {e}')
+            return
 
         if enroll_response.status_code == 200:
             self.server_ip = address
@@ -92,42 +198,152 @@ class ServerBridge:
         If the assignment ID is "!ALL!" then DO NOT ENABLE THE MARK ATTENDANCE BUTTON EVEN IF THE PASS IS VALID.
         Assignments with an ID "!ALL!" allow the kiosk to verify passes passively but not to mark attendance on them.
         Attempting to mark attendance when your own assignment is "!ALL!" will result in a fail (409 conflict).
+
+        The request is conditional: if the server tagged the last assignment with an ETag, it can answer 304 (NOT
+        MODIFIED) with no body, and the current assignment stands.
         """
 
         if self.need_init:
             return False
 
-        assignment_response = requests.get(self.server_ip + '/assignment?kioskToken=' + self.kiosk_token)
+        headers = {'If-None-Match': self._assignment_etag} if self._assignment_etag is not None else None
+
+        try:
+            assignment_response = self.session.get(
+                self.server_ip + '/assignment', params={'kioskToken': self.kiosk_token}, headers=headers,
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            print(f'Assignment Error: {e}')
+            return False
 
         match assignment_response.status_code:
             case 200:
                 assignment_string = assignment_response.text
                 assignment_split_sting = assignment_string.split('+', 1)
 
-                self.assignment = {
+                self._set_assignment({
                     'a_name': assignment_split_sting[0],
                     'a_id': assignment_split_sting[1]
-                }
+                })
+                self._assignment_etag = assignment_response.headers.get('ETag')
 
                 return True
 
+            case 304:
+                return self.assignment is not None
+
             case 204:
-                self.assignment = None
+                self._set_assignment(None)
+                self._assignment_etag = None
                 return False
 
             case 401 | 404 | 409:
-                self.assignment = None
+                self._set_assignment(None)
+                self._assignment_etag = None
                 self.clear_creds()
 
                 return False
 
-    def verify(self, token_string) -> Optional[dict[str, str | int]]:
+    def refresh_assignment(self):
+        """
+        Have the assignment fetched again: in the background by the `assignment_watcher` if there is one, or right away
+        otherwise.
+        """
+
+        if self.assignment_watcher is not None:
+            self.assignment_watcher.wake()
+        else:
+            self.get_assignment()
+
+    def _set_assignment(self, assignment: Optional[dict[str, str]]):
+        """Replace the assignment, dropping cached verifications if it changed since they were made for another one."""
+
+        changed = assignment != self.assignment
+
+        if changed:
+            self.verification_cache.clear()
+
+        self.assignment = assignment
+
+        if changed and self.roster is not None:
+            self.roster.wake()
+
+    def get_public_key(self) -> Optional[bytes]:
+        """
+        Fetch the PEM public key the server signs passes with, used for local pre-validation. The key is cached in the
+        system keystore, so a kiosk that has fetched it once can still validate passes while the server is unreachable.
+        Returns None if the server doesn't publish a key.
+        """
+
+        if self.need_init:
+            return None
+
+        cached_key = keyring.get_password('mp.ticketing.service', 'mp.server.pubkey')
+
+        try:
+            key_response = self.session.get(self.server_ip + '/publickey', timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f'Public Key Error: {e}')
+            return cached_key.encode() if cached_key is not None else None
+
+        if key_response.status_code != 200:
+            return cached_key.encode() if cached_key is not None else None
+
+        if key_response.text != cached_key:
+            keyring.set_password('mp.ticketing.service', 'mp.server.pubkey', key_response.text)
+
+        return key_response.text.encode()
+
+    def get_roster(self, event: str, since: Optional[str] = None) -> Optional[dict]:
+        """
+        Fetch the pass roster for `event`: the full roster, or only the changes after version `since` if given. Returns
+        the decoded JSON body (`version`, `passes` mapping pass ID to state, and for deltas `removed`), None if the
+        server could not be reached, or `{'unsupported': True}` if the server doesn't serve rosters.
+        """
+
+        if self.need_init:
+            return None
+
+        params = {'kioskToken': self.kiosk_token, 'event': event}
+        if since is not None:
+            params['since'] = since
+
+        try:
+            roster_response = self.session.get(self.server_ip + '/roster', params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f'Roster Error: {e}')
+            return None
+
+        match roster_response.status_code:
+            case 200:
+                try:
+                    return roster_response.json()
+                except ValueError as e:
+                    print(f'Roster Error: {e}')
+                    return None
+
+            case 304:
+                return {'version': since, 'passes': {}, 'full': False}
+
+            case 404 | 405 | 501:
+                return {'unsupported': True}
+
+            case _:
+                return None
+
+    def verify(self, token_string, authoritative: bool = False) -> Optional[dict[str, str | int]]:
         """
         Verifies a pass. Returns an object, which contains status, text (to be displayed front and center) and subtext.
         Subtext is only populated if a "Reason" attribute is present in the response. If the status is 200, then the
         pass is either a valid pass, or a staff pass. If the pass is valid, then enable the "mark attendance" button.
         If the pass is staff, don't enable the button, instead show a popup saying "verified staff – allow to proceed".
-        For all other status codes, disable the mark attendance button.
+        For all other status codes, disable the mark attendance button. If the server cannot be reached, the status is
+        0 and the text is "NETWORK ERROR".
+
+        Results are cached per token (see `VerificationCache`), so repeated scans of the same pass don't hit the server.
+        If a roster is attached, signature-checked passes found in it are answered locally and only misses go to the
+        server; pass `authoritative=True` to always ask the server, e.g. when the verdict will be marked on unattended.
         """
 
         default_res = {
@@ -139,7 +355,51 @@ class ServerBridge:
         if self.assignment is None:
             return None
 
-        response = requests.get(self.server_ip + '/verify?token=' + token_string + '&event=' + self.assignment['a_id'])
+        cached = self.verification_cache.get(token_string)
+        if cached is not None:
+            _record_verification('cache')
+            return cached
+
+        if self.roster is not None and not authoritative:
+            roster_state = self.roster.lookup(token_string)
+
+            if roster_state is not None:
+                _record_verification('roster')
+
+            match roster_state:
+                case 'valid':
+                    return default_res
+
+                case 'staff':
+                    default_res['text'] = 'STAFF'
+                    default_res['subtext'] = 'No attendance required.'
+                    return default_res
+
+                case 'marked':
+                    default_res['status'] = 409
+                    default_res['text'] = 'ALREADY MARKED'
+                    return default_res
+
+                case 'revoked':
+                    default_res['status'] = 403
+                    default_res['text'] = 'REVOKED'
+                    return default_res
+
+        try:
+            response = self.session.get(
+                self.server_ip + '/verify', params={'token': token_string, 'event': self.assignment['a_id']},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            _record_error(self.server_ip + '/verify')
+
+            default_res['status'] = 0
+            default_res['text'] = 'NETWORK ERROR'
+            default_res['subtext'] = type(e).__name__
+
+            return default_res
+
+        _record_verification('server')
 
         if response.status_code == 200:
             if 'staff' in response.text:
@@ -147,6 +407,7 @@ class ServerBridge:
                 default_res['text'] = 'STAFF'
                 default_res['subtext'] = 'No attendance required.'
 
+            self.verification_cache.put(token_string, default_res)
             return default_res
 
         else:
@@ -158,32 +419,39 @@ class ServerBridge:
             if len(rsplit) > 1:
                 default_res['subtext'] = rsplit[1].strip()
 
+            # Server-side errors are transient, so only definite verdicts are worth remembering.
+            if 400 <= response.status_code < 500:
+                self.verification_cache.put(token_string, default_res)
+
             return default_res
 
-    def mark_attendance(self, token) -> bool:
+    def send_mark(self, token: str, event: str, idempotency_key: Optional[str] = None) -> Optional[int]:
         """
-        Marks attendance. If a conflict status is received, it may call get_assignment(). Returns True if attendance
-        was marked, False otherwise.
+        Send a single `PUT /mark` for `event` and return the response status code, or None if the server could not be
+        reached. `idempotency_key` is sent as the `Idempotency-Key` header so a retried mark is not counted twice.
         """
 
-        if self.assignment is None:
-            return False
+        if self.need_init:
+            return None
 
         payload = {
             'kioskToken': self.kiosk_token,
-            'event': self.assignment['a_id'],
+            'event': event,
             'token': token
         }
 
-        attn_response = requests.put(self.server_ip + '/mark', json=payload)
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key is not None else None
 
-        match attn_response.status_code:
-            case 200:
-                return True
+        try:
+            attn_response = self.session.put(
+                self.server_ip + '/mark', json=payload, headers=headers, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            print(f'Attendance Error: {e}')
+            _record_error(self.server_ip + '/mark')
+            return None
 
-            case 409:
-                self.get_assignment()
-                return False
+        if attn_response.status_code == 200:
+            self.verification_cache.invalidate(token)
 
-            case _:
-                return False
+        return attn_response.status_code
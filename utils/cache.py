@@ -0,0 +1,88 @@
+"""
+Small thread-safe caches used to avoid redundant round trips to the ticketing server.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class VerificationCache:
+    """
+    Token-keyed cache of `ServerBridge.verify()` results with a time-to-live and least-recently-used eviction. Entries
+    older than `ttl` seconds are treated as missing, and once more than `max_entries` tokens are cached the least
+    recently used one is dropped.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(token, None)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token)
+            self.hits += 1
+
+            return dict(entry[1])
+
+    def put(self, token: str, result: dict):
+        with self._lock:
+            self._entries[token] = (time.monotonic(), dict(result))
+            self._entries.move_to_end(token)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TokenCooldown:
+    """
+    Per-token cooldown window. A token is `ready()` the first time it is seen and again once it has gone unseen for
+    `window` seconds. Every sighting restarts the window, so a pass held in front of the camera is only verified once.
+    """
+
+    def __init__(self, window: float = 5.0, max_entries: int = 256):
+        self.window = window
+        self.max_entries = max_entries
+
+        self._last_seen: OrderedDict[bytes | str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ready(self, token: bytes | str) -> bool:
+        now = time.monotonic()
+
+        with self._lock:
+            last_seen = self._last_seen.get(token)
+
+            self._last_seen[token] = now
+            self._last_seen.move_to_end(token)
+
+            while len(self._last_seen) > self.max_entries:
+                self._last_seen.popitem(last=False)
+
+        return last_seen is None or now - last_seen > self.window
+
+    def reset(self, token: bytes | str):
+        with self._lock:
+            self._last_seen.pop(token, None)
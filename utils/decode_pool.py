@@ -0,0 +1,120 @@
+"""
+Process-pool QR decoding. Decoding in worker processes keeps pyzbar and the OpenCV conversions off the GIL the Tk UI and
+the capture thread need, and spreads the work over every core of the kiosk.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+import cv2
+
+from utils.decoders import QrCode, create_decoder
+from utils.decoding import MultiScaleDecoder
+
+# Per-process decoders, keyed by backend name. Only ever populated inside worker processes.
+_worker_decoders: dict[str, MultiScaleDecoder] = {}
+
+
+def _decode_in_worker(gray, backend_name: str, scales: tuple[float, ...]) -> tuple[list[QrCode], float, bool, bool]:
+    decoder = _worker_decoders.get(backend_name)
+
+    if decoder is None:
+        # Parallelism comes from the pool itself; OpenCV's own threads would only oversubscribe the cores.
+        cv2.setNumThreads(1)
+
+        decoder = MultiScaleDecoder(create_decoder(backend_name), scales)
+        _worker_decoders[backend_name] = decoder
+
+    first_try_hits = decoder.stats.first_try_hits
+    inverted_hits = decoder.stats.inverted_hits
+
+    qr_codes = decoder.decode(gray)
+
+    first_try = decoder.stats.first_try_hits > first_try_hits
+    inverted = decoder.stats.inverted_hits > inverted_hits
+
+    return qr_codes, decoder.stats.last_time, first_try, inverted
+
+
+class DecodePool:
+    """
+    Pool of decoder processes. `submit()` blocks while every worker is busy, so the caller naturally picks up the newest
+    frame once one frees up instead of queueing stale ones. Each frame is tagged with its sequence number and
+    `on_result` is only called for results newer than the last one delivered; results for older frames that finish late
+    are discarded. Results are delivered one at a time from a single pool thread. Frames are converted to grayscale
+    before being sent, so only a third of the pixels cross the process boundary.
+    """
+
+    def __init__(
+            self, on_result: Callable[..., None], workers: Optional[int] = None, scales: tuple[float, ...] = (0.5, 1.0)
+    ):
+        """
+        :param on_result: Called as `on_result(context, qr_codes, elapsed, first_try, inverted)` for every fresh
+            result, where the last three describe the decode like `DecodeStats.record()` expects them.
+        :type on_result: Callable[..., None]
+
+        :param workers: Number of worker processes. Defaults to all cores but two, kept for Tk and capture.
+        :type workers: Optional[int]
+        """
+
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 1) - 2)
+        self.scales = scales
+        self._on_result = on_result
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._free_workers = threading.Semaphore(self.workers)
+        self._lock = threading.Lock()
+
+        self._last_delivered = 0
+
+        self.submitted = 0
+        self.stale = 0
+        self.decode_time = 0.0
+
+    def submit(self, seq: int, frame_buffer, backend_name: str, context: object = None, timeout: float = 0.5) -> bool:
+        """Send a frame to a free worker, waiting up to `timeout` seconds for one. Returns False if none freed up."""
+
+        if not self._free_workers.acquire(timeout=timeout):
+            return False
+
+        gray = frame_buffer if frame_buffer.ndim == 2 else cv2.cvtColor(frame_buffer, cv2.COLOR_BGR2GRAY)
+
+        try:
+            future = self._executor.submit(_decode_in_worker, gray, backend_name, self.scales)
+        except RuntimeError:
+            # The pool is shutting down.
+            self._free_workers.release()
+            return False
+
+        self.submitted += 1
+        future.add_done_callback(lambda done: self._deliver(seq, done, context))
+
+        return True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _deliver(self, seq: int, done: Future, context: object):
+        self._free_workers.release()
+
+        if done.cancelled():
+            return
+
+        if done.exception() is not None:
+            print(f'Decode Worker Error: {done.exception()}')
+            return
+
+        qr_codes, elapsed, first_try, inverted = done.result()
+
+        with self._lock:
+            self.decode_time = elapsed
+
+            if seq <= self._last_delivered:
+                self.stale += 1
+                return
+
+            self._last_delivered = seq
+
+        self._on_result(context, qr_codes, elapsed, first_try, inverted)
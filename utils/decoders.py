@@ -0,0 +1,246 @@
+"""
+Pluggable QR decoder backends. Every backend takes a single-channel (grayscale) frame buffer and returns a list of
+`QrCode`, so callers don't care which library found the code.
+"""
+
+import time
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+
+class Point(NamedTuple):
+    x: int
+    y: int
+
+
+class Rect(NamedTuple):
+    left: int
+    top: int
+    width: int
+    height: int
+
+
+class QrCode(NamedTuple):
+    """A decoded QR code. `data` is the raw payload and `polygon` its corners in frame coordinates."""
+    data: bytes
+    rect: Rect
+    polygon: list[Point]
+    backend: str
+
+
+def unique_codes(qr_codes: list[QrCode]) -> list[QrCode]:
+    """
+    One `QrCode` per payload, keeping the largest sighting, in the order first found. Backends may report the same code
+    twice, e.g. when a multi-code detector also picks up its reflection on a phone's glass.
+    """
+
+    unique: dict[bytes, QrCode] = {}
+
+    for qr in qr_codes:
+        seen = unique.get(qr.data)
+
+        if seen is None or qr.rect.width * qr.rect.height > seen.rect.width * seen.rect.height:
+            unique[qr.data] = qr
+
+    return list(unique.values())
+
+
+def text_codes(qr_codes: list[QrCode]) -> list[QrCode]:
+    """
+    Only the codes whose payload is UTF-8 text, as every pass token is. Anything else (another kind of QR code, a
+    misread) can never be verified.
+    """
+
+    readable = []
+
+    for qr in qr_codes:
+        try:
+            qr.data.decode('utf-8')
+        except UnicodeDecodeError:
+            continue
+
+        readable.append(qr)
+
+    return readable
+
+
+class QrDecoder:
+    """Base class for decoder backends."""
+
+    name = ''
+
+    def decode(self, gray) -> list[QrCode]:
+        raise NotImplementedError
+
+
+class PyzbarDecoder(QrDecoder):
+    """ZBar, through pyzbar. Needs the zbar shared library."""
+
+    name = 'pyzbar'
+
+    def __init__(self):
+        from pyzbar import pyzbar
+
+        self._pyzbar = pyzbar
+        self._symbols = [pyzbar.ZBarSymbol.QRCODE]
+
+    def decode(self, gray) -> list[QrCode]:
+        return [
+            QrCode(result.data, Rect(*result.rect), [Point(*point) for point in result.polygon], self.name)
+            for result in self._pyzbar.decode(gray, symbols=self._symbols)
+        ]
+
+
+class OpenCvDecoder(QrDecoder):
+    """OpenCV's built-in `QRCodeDetector`."""
+
+    name = 'opencv'
+
+    def __init__(self):
+        self._detector = self._create_detector()
+
+    @staticmethod
+    def _create_detector():
+        return cv2.QRCodeDetector()
+
+    def decode(self, gray) -> list[QrCode]:
+        found, texts, points, _ = self._detector.detectAndDecodeMulti(gray)
+
+        if not found:
+            return []
+
+        qr_codes = []
+
+        for text, corners in zip(texts, points):
+            # The detector also reports codes it located but could not read, with empty text.
+            if not text:
+                continue
+
+            polygon = [Point(int(x), int(y)) for x, y in corners]
+            left, top, width, height = cv2.boundingRect(np.asarray(polygon, dtype=np.int32))
+
+            qr_codes.append(QrCode(text.encode('utf-8'), Rect(left, top, width, height), polygon, self.name))
+
+        return qr_codes
+
+
+class OpenCvArucoDecoder(OpenCvDecoder):
+    """OpenCV's ArUco-based `QRCodeDetectorAruco` (OpenCV 4.8+), more tolerant of blur and perspective."""
+
+    name = 'opencv-aruco'
+
+    @staticmethod
+    def _create_detector():
+        return cv2.QRCodeDetectorAruco()
+
+
+BACKENDS: dict[str, type[QrDecoder]] = {
+    PyzbarDecoder.name: PyzbarDecoder,
+    OpenCvDecoder.name: OpenCvDecoder,
+    OpenCvArucoDecoder.name: OpenCvArucoDecoder
+}
+
+
+# Backends already reported as unusable, so each is only reported once however often the decoders are listed.
+_unavailable: set[str] = set()
+
+
+def available_decoders() -> list[QrDecoder]:
+    """Instantiate every backend whose library is usable on this machine."""
+
+    decoders = []
+
+    for backend in BACKENDS.values():
+        try:
+            decoders.append(backend())
+        except (ImportError, AttributeError, OSError) as e:
+            if backend.name not in _unavailable:
+                _unavailable.add(backend.name)
+                print(f'Decoder {backend.name} unavailable: {e}')
+
+    return decoders
+
+
+def create_decoder(name: Optional[str] = None) -> QrDecoder:
+    """Create the backend called `name`, or the first usable one (in `BACKENDS` order) if None or unusable."""
+
+    if name is not None:
+        try:
+            return BACKENDS[name]()
+        except (KeyError, ImportError, AttributeError, OSError) as e:
+            print(f'Decoder {name} unavailable: {e}')
+
+    for backend in BACKENDS.values():
+        try:
+            return backend()
+        except (ImportError, AttributeError, OSError):
+            continue
+
+    raise ImportError('No QR decoder backend is available.')
+
+
+class BackendScore:
+    """Benchmark outcome for one backend."""
+
+    def __init__(self, decoder: QrDecoder, mean_time: float, hits: int, frames_with_codes: int):
+        self.decoder = decoder
+        self.mean_time = mean_time
+        self.hits = hits
+        self.frames_with_codes = frames_with_codes
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.frames_with_codes if self.frames_with_codes > 0 else 0.0
+
+    def __repr__(self):
+        return f'{self.decoder.name}: {self.mean_time * 1000:.1f} ms/frame, hit rate {self.hit_rate:.0%}'
+
+
+def benchmark_decoders(frames: list, decoders: list[QrDecoder]) -> list[BackendScore]:
+    """
+    Time every decoder on every frame. A frame counts as containing a code if any decoder found one in it, and a
+    decoder's hit rate is the share of those frames it decoded. A decoder may be anything with a `name` and `decode()`,
+    e.g. a backend wrapped in a `MultiScaleDecoder` to try both polarities the way the pipeline does.
+    """
+
+    timings = {decoder.name: 0.0 for decoder in decoders}
+    found = {decoder.name: set() for decoder in decoders}
+
+    for index, frame in enumerate(frames):
+        for decoder in decoders:
+            start = time.perf_counter()
+            qr_codes = decoder.decode(frame)
+            timings[decoder.name] += time.perf_counter() - start
+
+            if len(qr_codes) > 0:
+                found[decoder.name].add(index)
+
+    frames_with_codes = len(set().union(*found.values()))
+
+    return [
+        BackendScore(decoder, timings[decoder.name] / max(len(frames), 1), len(found[decoder.name]), frames_with_codes)
+        for decoder in decoders
+    ]
+
+
+def select_decoder(
+        frames: list, decoders: list, min_hit_rate: float = 0.9
+) -> tuple[Optional[QrDecoder], list[BackendScore]]:
+    """
+    Pick the fastest decoder whose hit rate on `frames` is at least `min_hit_rate`. Returns None as the decoder if no
+    frame contained a code, since the backends can't be judged on speed alone.
+    """
+
+    scores = benchmark_decoders(frames, decoders)
+
+    if len(scores) == 0 or scores[0].frames_with_codes == 0:
+        return None, scores
+
+    qualified = [score for score in scores if score.hit_rate >= min_hit_rate]
+
+    if len(qualified) == 0:
+        qualified = [max(scores, key=lambda score: score.hit_rate)]
+
+    return min(qualified, key=lambda score: score.mean_time).decoder, scores
@@ -0,0 +1,326 @@
+"""
+QR decoding strategies layered on top of the raw decoder.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+import cv2
+
+from utils.decoders import Point, QrCode, QrDecoder, Rect, available_decoders, create_decoder, select_decoder
+from utils.video_capture import CapturedFrame
+
+
+class DecodeStats:
+    """Running decode timings and hit rates."""
+
+    def __init__(self):
+        self.frames = 0
+        self.hits = 0
+        self.first_try_hits = 0
+        self.inverted_hits = 0
+
+        self.total_time = 0.0
+        self.last_time = 0.0
+
+    def record(self, elapsed: float, hit: bool, first_try: bool, inverted: bool):
+        self.frames += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+
+        if hit:
+            self.hits += 1
+            self.first_try_hits += first_try
+            self.inverted_hits += inverted
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.frames if self.frames > 0 else 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.frames if self.frames > 0 else 0.0
+
+    @property
+    def first_try_hit_rate(self) -> float:
+        """Share of successful decodes that needed neither a higher resolution nor the other polarity."""
+
+        return self.first_try_hits / self.hits if self.hits > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f'{self.frames} frames, {self.mean_time * 1000:.1f} ms/frame (last {self.last_time * 1000:.1f} ms), '
+            f'hit rate {self.hit_rate:.0%}, first-try {self.first_try_hit_rate:.0%}, inverted {self.inverted_hits}'
+        )
+
+
+class MultiScaleDecoder:
+    """
+    Grayscale, coarse-to-fine decoder with automatic polarity handling. The frame is converted to grayscale and
+    decoded at each of `scales` in turn, smallest first, stopping at the first scale that finds a code. At each scale
+    the polarity that last produced a hit is tried first and the inverted one (light-on-dark codes) second, so inverted
+    passes decode without anyone having to flip a setting.
+
+    Given a `CapturedFrame` rather than a bare buffer, the reduced scales come from `CapturedFrame.gray()`, which for
+    MJPEG sources decodes the JPEG straight to the smaller size.
+    """
+
+    def __init__(self, backend: QrDecoder, scales: tuple[float, ...] = (0.5, 1.0)):
+        """
+        :param backend: Decoder backend. May be swapped at any time through `self.backend`.
+        :type backend: QrDecoder
+
+        :param scales: Resize factors to try, in order. 1.0 is full resolution.
+        :type scales: tuple[float, ...]
+        """
+
+        self.backend = backend
+        self.scales = scales
+        self.inverted = False
+
+        self.stats = DecodeStats()
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    def decode(self, frame) -> list[QrCode]:
+        start = time.perf_counter()
+
+        if not isinstance(frame, CapturedFrame):
+            frame = CapturedFrame(frame, 0, 0.0)
+
+        first_try = True
+
+        for scale in self.scales:
+            reduction = 1 / scale
+
+            if reduction.is_integer():
+                scaled = frame.gray(int(reduction))
+            else:
+                scaled = cv2.resize(frame.gray(), None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            for inverted in (self.inverted, not self.inverted):
+                qr_codes = self.backend.decode(cv2.bitwise_not(scaled) if inverted else scaled)
+
+                if len(qr_codes) > 0:
+                    self.inverted = inverted
+                    self.stats.record(time.perf_counter() - start, True, first_try, inverted)
+
+                    if scale == 1.0:
+                        return qr_codes
+
+                    # Reduced sizes are rounded, so map back with the exact ratio in each direction.
+                    (full_height, full_width), (height, width) = frame.shape, scaled.shape[:2]
+
+                    return [_transform(qr, 0, 0, full_width / width, full_height / height) for qr in qr_codes]
+
+                first_try = False
+
+        self.stats.record(time.perf_counter() - start, False, False, False)
+
+        return []
+
+
+class DecoderSelector:
+    """
+    Picks the decoder backend for `MultiScaleDecoder` by benchmarking every available backend on recently seen frames,
+    keeping the fastest one whose hit rate is at least `min_hit_rate`. Frames are sampled at most once every
+    `sample_interval` seconds, separately for frames with and without a code, so the benchmark reflects this camera and
+    lighting. A benchmark is pending from construction and again after every `request()`, and runs once at least
+    `min_samples_with_codes` frames containing a code have been seen.
+
+    Every backend is benchmarked inside a `MultiScaleDecoder` with the live decoder's scales, so inverted codes count
+    as hits just as they do when scanning. The benchmark runs on a thread of its own, so it never holds up a decode or
+    a verdict. If it can't pick a backend, sampling starts over after a pause that doubles with every failure, up to
+    `max_backoff` seconds.
+    """
+
+    def __init__(
+            self, decoder: MultiScaleDecoder, min_hit_rate: float = 0.9, sample_interval: float = 0.5,
+            samples: int = 8, min_samples_with_codes: int = 3, max_backoff: float = 300.0
+    ):
+        self.decoder = decoder
+        self.min_hit_rate = min_hit_rate
+        self.sample_interval = sample_interval
+        self.min_samples_with_codes = min_samples_with_codes
+        self.max_backoff = max_backoff
+
+        self._with_codes = deque(maxlen=samples)
+        self._without_codes = deque(maxlen=samples)
+        self._last_sample = 0.0
+
+        # Benchmark-only instances, built on the first benchmark and reused; the live backend is never benchmarked.
+        self._backends: Optional[list[QrDecoder]] = None
+        self._running = threading.Lock()
+        self._failures = 0
+        self._resume_at = 0.0
+
+        self.pending = True
+        self.scores = []
+
+    def request(self):
+        """Benchmark again as soon as enough frames have been sampled, e.g. after the lighting changed."""
+
+        self._with_codes.clear()
+        self._without_codes.clear()
+        self._failures = 0
+        self._resume_at = 0.0
+        self.pending = True
+
+    def observe(self, frame, qr_codes: list[QrCode]):
+        """
+        Offer a decoded frame (a buffer or a `CapturedFrame`) for sampling and start the benchmark in the background if
+        one is due. Call from the decode thread.
+        """
+
+        if not self.pending or self._running.locked():
+            return
+
+        now = time.monotonic()
+
+        if now < self._resume_at:
+            return
+
+        if now - self._last_sample >= self.sample_interval:
+            self._last_sample = now
+
+            if isinstance(frame, CapturedFrame):
+                gray = frame.gray()
+            else:
+                gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            (self._with_codes if len(qr_codes) > 0 else self._without_codes).append(gray)
+
+        if len(self._with_codes) >= self.min_samples_with_codes and self._running.acquire(blocking=False):
+            frames = list(self._with_codes) + list(self._without_codes)
+            threading.Thread(target=self._select_in_background, args=(frames,), daemon=True).start()
+
+    def select(self, frames: Optional[list] = None):
+        """Benchmark the backends on `frames` (by default the frames sampled so far) and switch to the best one."""
+
+        if frames is None:
+            frames = list(self._with_codes) + list(self._without_codes)
+
+        if self._backends is None:
+            self._backends = available_decoders()
+
+        candidates = [MultiScaleDecoder(backend, self.decoder.scales) for backend in self._backends]
+        decoder, self.scores = select_decoder(frames, candidates, self.min_hit_rate)
+
+        if decoder is None:
+            # Nothing decoded the sampled frames; collect fresh ones later rather than benchmarking the same again.
+            self._failures += 1
+            self._resume_at = time.monotonic() + min(self.max_backoff, self.sample_interval * 2 ** (self._failures + 2))
+            self._with_codes.clear()
+            self._without_codes.clear()
+
+            print(f'Decoder benchmark: {self.scores}, none selected')
+            return
+
+        # A fresh instance, as the benchmark's own may be benchmarked again later while this one decodes.
+        self.decoder.backend = create_decoder(decoder.name)
+        self.pending = False
+
+        print(f'Decoder benchmark: {self.scores}, selected {decoder.name}')
+
+    def _select_in_background(self, frames: list):
+        try:
+            self.select(frames)
+        finally:
+            self._running.release()
+
+
+class RoiTracker:
+    """
+    Region-of-interest tracker. Once a QR code has been found, the following frames are decoded only within a crop
+    around its last known location, expanded by `margin` times the code's size on each side to allow for movement. The
+    whole frame is rescanned every `full_scan_interval` seconds to pick up new codes, and immediately whenever the crop
+    comes up empty, so a code that moved out of the crop is never missed.
+    """
+
+    def __init__(self, decode: Callable, margin: float = 0.5, full_scan_interval: float = 0.5):
+        """
+        :param decode: Decoder taking a frame buffer (or a `CapturedFrame`, for full-frame scans) and returning a list
+            of `QrCode`.
+        :type decode: Callable
+
+        :param margin: Fraction of the code's width/height to pad the crop with on each side.
+        :type margin: float
+
+        :param full_scan_interval: Maximum time in seconds between two full-frame scans.
+        :type full_scan_interval: float
+        """
+
+        self._decode = decode
+        self.margin = margin
+        self.full_scan_interval = full_scan_interval
+
+        self.roi: Optional[tuple[int, int, int, int]] = None
+        self._last_full_scan = 0.0
+
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def decode(self, frame) -> list:
+        """Decode a frame buffer or a `CapturedFrame`. Crops of a `CapturedFrame` are cut from its grayscale version."""
+
+        now = time.monotonic()
+
+        if self.roi is not None and now - self._last_full_scan < self.full_scan_interval:
+            qr_codes = self._decode_roi(frame.gray() if isinstance(frame, CapturedFrame) else frame)
+
+            if len(qr_codes) > 0:
+                return qr_codes
+
+        self._last_full_scan = now
+        self.full_scans += 1
+
+        qr_codes = self._decode(frame)
+        self._update_roi(qr_codes, frame.shape)
+
+        return qr_codes
+
+    def reset(self):
+        self.roi = None
+
+    def _decode_roi(self, frame_buffer) -> list:
+        left, top, right, bottom = self.roi
+        self.roi_scans += 1
+
+        qr_codes = [_transform(qr, left, top) for qr in self._decode(frame_buffer[top:bottom, left:right])]
+        self._update_roi(qr_codes, frame_buffer.shape)
+
+        return qr_codes
+
+    def _update_roi(self, qr_codes: list, shape: tuple):
+        if len(qr_codes) == 0:
+            self.roi = None
+            return
+
+        left = min(qr.rect.left for qr in qr_codes)
+        top = min(qr.rect.top for qr in qr_codes)
+        right = max(qr.rect.left + qr.rect.width for qr in qr_codes)
+        bottom = max(qr.rect.top + qr.rect.height for qr in qr_codes)
+
+        pad_x = int((right - left) * self.margin)
+        pad_y = int((bottom - top) * self.margin)
+
+        height, width = shape[:2]
+        self.roi = max(0, left - pad_x), max(0, top - pad_y), min(width, right + pad_x), min(height, bottom + pad_y)
+
+
+def _transform(qr: QrCode, dx: int, dy: int, scale_x: float = 1.0, scale_y: Optional[float] = None) -> QrCode:
+    """Map a decode result found in a crop or a resized frame back into full-frame coordinates."""
+
+    scale_y = scale_x if scale_y is None else scale_y
+
+    return qr._replace(
+        rect=Rect(
+            int(qr.rect.left * scale_x) + dx, int(qr.rect.top * scale_y) + dy,
+            int(qr.rect.width * scale_x), int(qr.rect.height * scale_y)
+        ),
+        polygon=[Point(int(point.x * scale_x) + dx, int(point.y * scale_y) + dy) for point in qr.polygon]
+    )
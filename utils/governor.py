@@ -0,0 +1,229 @@
+"""
+Adaptive decode rate. Decoding every frame of every lane is what costs the kiosk its CPU, yet most of the time there is
+nothing in front of the cameras. `DecodeGovernor` decodes as little as it can while still meeting a scan-latency SLO,
+and backs off further when the machine is short of CPU or the UI starts to lag.
+"""
+
+import ctypes
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from utils.metrics import REGISTRY, MetricsRegistry
+
+# Seconds from a pass being held up to the camera to its verdict, at the 95th percentile.
+DEFAULT_SCAN_SLO = 0.75
+
+
+def system_cpu_times() -> tuple[float, float]:
+    """
+    CPU time spent busy and in total across the whole machine, in arbitrary but consistent units, so that decode worker
+    processes and anything else running on the box count against the headroom. Falls back to this process's own CPU
+    time (and, once they have exited, its children's) where the system figures cannot be read.
+    """
+
+    if sys.platform == 'win32':
+        idle, kernel, user = ctypes.c_ulonglong(), ctypes.c_ulonglong(), ctypes.c_ulonglong()
+
+        # Kernel time includes idle time.
+        if ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)):
+            return float(kernel.value + user.value - idle.value), float(kernel.value + user.value)
+
+    else:
+        try:
+            with open('/proc/stat') as file:
+                # user, nice, system, idle, iowait, irq, softirq, steal
+                ticks = [int(field) for field in file.readline().split()[1:9]]
+
+            return float(sum(ticks) - ticks[3] - ticks[4]), float(sum(ticks))
+
+        except (OSError, ValueError, IndexError):
+            pass
+
+    times = os.times()
+    busy = times.user + times.system + times.children_user + times.children_system
+
+    return busy, time.monotonic() * (os.cpu_count() or 1)
+
+
+class LaneState:
+    """What the governor has decided for one lane, and when the lane was last let through."""
+
+    def __init__(self, full_scales: tuple[float, ...]):
+        self.full_scales = full_scales
+        self.reduced_scales = full_scales[:1]
+
+        self.active_interval = 0.0
+        self.idle_interval = 0.0
+        self.last_decode = 0.0
+
+
+class DecodeGovernor:
+    """
+    Sets how often each lane decodes, and at what resolution, from its detection state:
+
+    - hot (a code in view) and active (the scene is changing, e.g. a pass being brought up to the camera, not yet
+      readable): decode every frame at full resolution, to catch the code as soon as it can be read;
+    - idle: decode only as often as the SLO allows, at the decoder's smallest scale.
+
+    The idle interval is what is left of `slo` once the lane's decode latency is taken out, between
+    `min_idle_interval` and `max_interval`. Server latency is deliberately left out: the kiosk cannot make a slow
+    server faster by decoding more often, so an idle lane never decodes more than the floor allows, however slow the
+    server gets.
+
+    Every `period` seconds the governor also measures the machine's CPU headroom (see `system_cpu_times()`) and the UI
+    tick lag. While either is short of its limit, pressure builds up and stretches every interval towards the idle
+    one, so that a loaded kiosk sheds decodes before it misses frames on screen; hot lanes also drop to the reduced
+    resolution once the pressure is high. Pressure eases off as soon as the load does.
+
+    Lanes decoding in worker processes (`decode_workers`) keep their resolution, as the workers' scales are fixed.
+    """
+
+    def __init__(
+            self, slo: float = DEFAULT_SCAN_SLO, min_interval: float = 0.0, min_idle_interval: float = 0.25,
+            max_interval: float = 1.0, min_headroom: float = 0.2, max_ui_lag: float = 0.05, period: float = 0.5,
+            registry: MetricsRegistry = REGISTRY
+    ):
+        """
+        :param slo: Target scan latency, in seconds.
+        :type slo: float
+
+        :param min_interval: Seconds between decodes for hot and active lanes, when there is no pressure.
+        :type min_interval: float
+
+        :param min_idle_interval: Shortest time between decodes for idle lanes.
+        :type min_idle_interval: float
+
+        :param max_interval: Longest the governor ever lets a lane go without decoding, whatever the SLO allows.
+        :type max_interval: float
+
+        :param min_headroom: Share of the machine's CPU (0-1) to keep free.
+        :type min_headroom: float
+
+        :param max_ui_lag: 95th percentile of the UI tick lag, in seconds, above which the UI counts as lagging.
+        :type max_ui_lag: float
+
+        :param period: Seconds between two measurements.
+        :type period: float
+        """
+
+        self.slo = slo
+        self.min_interval = min_interval
+        self.min_idle_interval = min_idle_interval
+        self.max_interval = max_interval
+        self.min_headroom = min_headroom
+        self.max_ui_lag = max_ui_lag
+        self.period = period
+        self.registry = registry
+
+        self.headroom = 1.0
+        self.pressure = 0.0
+
+        self._lanes: dict[object, LaneState] = {}
+        self._lock = threading.Lock()
+
+        self._last_busy, self._last_total = system_cpu_times()
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, lane):
+        """
+        Add a lane. `lane` must provide a `name`, a `decoder` with `scales`, and `has_code_in_view` and `has_motion`
+        properties.
+        """
+
+        with self._lock:
+            self._lanes[lane] = LaneState(lane.decoder.scales)
+
+    def unregister(self, lane):
+        with self._lock:
+            state = self._lanes.pop(lane, None)
+
+        if state is not None:
+            lane.decoder.scales = state.full_scales
+
+    def should_decode(self, lane) -> bool:
+        """Whether to decode the lane's newest frame. Called for every frame that gets past the motion gate."""
+
+        with self._lock:
+            state = self._lanes.get(lane)
+
+        if state is None:
+            return True
+
+        now = time.monotonic()
+        hot = lane.has_code_in_view
+        active = hot or lane.has_motion
+
+        # Switching resolution takes effect straight away, so a lane ramps up on the first frame with motion in it.
+        full_resolution = active and not (hot and self.pressure >= 0.5)
+        lane.decoder.scales = state.full_scales if full_resolution else state.reduced_scales
+
+        if now - state.last_decode < (state.active_interval if active else state.idle_interval):
+            return False
+
+        state.last_decode = now
+
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._govern_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def update(self):
+        """Take one measurement and recompute every lane's intervals."""
+
+        busy, total = system_cpu_times()
+
+        if total > self._last_total:
+            self.headroom = max(0.0, 1.0 - (busy - self._last_busy) / (total - self._last_total))
+
+        self._last_busy, self._last_total = busy, total
+
+        # Without a UI (headless), there is no tick lag to go by.
+        ui_lag = self._quantile('ui_tick_lag_seconds')
+        overloaded = self.headroom < self.min_headroom or (ui_lag is not None and ui_lag > self.max_ui_lag)
+
+        # Builds up quickly and eases off gradually, so the rate doesn't flap at the edge of the limits.
+        self.pressure = min(1.0, self.pressure + 0.25) if overloaded else self.pressure * 0.7
+
+        with self._lock:
+            lanes = list(self._lanes.items())
+
+        for lane, state in lanes:
+            decode_latency = self._quantile('decode_seconds', lane=lane.name) or 0.0
+
+            state.idle_interval = max(self.min_idle_interval, min(self.max_interval, self.slo - decode_latency))
+            state.active_interval = self.min_interval + self.pressure * (state.idle_interval - self.min_interval)
+
+            self.registry.gauge(
+                'decode_interval_seconds', 'Seconds between decodes the governor allows, by detection state.',
+                lane=lane.name, state='active'
+            ).set(state.active_interval)
+            self.registry.gauge(
+                'decode_interval_seconds', 'Seconds between decodes the governor allows, by detection state.',
+                lane=lane.name, state='idle'
+            ).set(state.idle_interval)
+
+        self.registry.gauge('cpu_headroom_ratio', "Share of the machine's CPU left free.").set(self.headroom)
+        self.registry.gauge('decode_pressure_ratio', 'How far load has pushed decode rates down (0-1).').set(
+            self.pressure
+        )
+
+    def _quantile(self, name: str, **labels) -> Optional[float]:
+        histogram = self.registry.get(name, **labels)
+
+        return histogram.quantile(0.95) if histogram is not None else None
+
+    def _govern_loop(self):
+        while not self._stop_event.wait(self.period):
+            self.update()
@@ -0,0 +1,227 @@
+"""
+Durable offline attendance journal. Marks are committed to a local SQLite database first and drained to the server by a
+background flusher, so admitting a patron costs a local disk write instead of a network round trip and no mark is lost
+when the venue Wi-Fi drops.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from utils.bridge import ServerBridge
+
+DEFAULT_JOURNAL_PATH = os.path.join(
+    os.getenv('LOCALAPPDATA', os.path.expanduser('~')), 'mptkt-scanner', 'attendance.db'
+)
+
+
+class AttendanceJournal:
+    """
+    Append-only journal of attendance marks. `record()` commits a mark locally and returns straight away; `start()`
+    launches a flusher thread that sends pending marks to the server in batches of `batch_size`. Marks that fail to
+    send because the server is unreachable (or answers 5xx) are retried with exponential backoff. Any other answer is
+    final: 200 marks the entry as synced, and other statuses (e.g. a 409 conflict) mark it as rejected.
+
+    Every entry carries an idempotency key, so a mark that reached the server but whose response was lost is not
+    counted twice when retried. Once `max_pending` marks are waiting, `record()` refuses new ones so that the backlog
+    cannot grow without bound while the kiosk is offline.
+
+    Every function passed to `subscribe()` is called with the token and the server's status once a mark reaches a final
+    state. Listeners run on the flusher thread and must not block.
+    """
+
+    _SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS marks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            token TEXT NOT NULL,
+            event TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            status INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            UNIQUE (token, event)
+        )
+    '''
+
+    def __init__(
+            self, bridge: ServerBridge, path: str = DEFAULT_JOURNAL_PATH, batch_size: int = 20,
+            max_pending: int = 5000, flush_interval: float = 1.0, max_backoff: float = 60.0
+    ):
+        self.bridge = bridge
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # One connection shared by the UI and the flusher; the lock serialises access to it.
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')
+        self._db.execute(self._SCHEMA)
+        self._db.execute('CREATE INDEX IF NOT EXISTS marks_pending ON marks (state, next_attempt_at)')
+
+        self._listeners: list[Callable[[str, int], None]] = []
+
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, token: str) -> bool:
+        """
+        Durably record a mark for `token` against the current assignment. Returns False if there is no assignment or
+        the journal is full. Recording the same pass twice for one event is a no-op that still returns True, unless the
+        server rejected the earlier mark, which is then queued again.
+        """
+
+        assignment = self.bridge.assignment
+        if assignment is None:
+            return False
+
+        with self._lock:
+            # One transaction, so concurrent callers cannot both pass the cap check and overshoot it.
+            self._db.execute('BEGIN IMMEDIATE')
+
+            try:
+                pending = self._db.execute("SELECT COUNT(*) FROM marks WHERE state = 'pending'").fetchone()[0]
+                row = self._db.execute(
+                    'SELECT id, state FROM marks WHERE token = ? AND event = ?', (token, assignment['a_id'])
+                ).fetchone()
+
+                if row is not None and row[1] != 'rejected':
+                    self._db.execute('ROLLBACK')
+                    return True
+
+                if pending >= self.max_pending:
+                    self._db.execute('ROLLBACK')
+                    return False
+
+                if row is None:
+                    self._db.execute(
+                        'INSERT INTO marks (idempotency_key, token, event, created_at) VALUES (?, ?, ?, ?)',
+                        (uuid.uuid4().hex, token, assignment['a_id'], time.time())
+                    )
+                else:
+                    # A fresh key, as the server has already answered the old one.
+                    self._db.execute(
+                        "UPDATE marks SET idempotency_key = ?, created_at = ?, state = 'pending', status = NULL, "
+                        "attempts = 0, next_attempt_at = 0 WHERE id = ?",
+                        (uuid.uuid4().hex, time.time(), row[0])
+                    )
+
+                self._db.execute('COMMIT')
+
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+
+        self.bridge.verification_cache.invalidate(token)
+
+        if self.bridge.roster is not None:
+            self.bridge.roster.note_marked(token)
+
+        self._wake_event.set()
+
+        return True
+
+    def subscribe(self, listener: Callable[[str, int], None]):
+        self._listeners.append(listener)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM marks WHERE state = 'pending'").fetchone()[0]
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+        if self._thread is None:
+            with self._lock:
+                self._db.close()
+            return
+
+        # The flusher closes the connection itself once it has stopped, so it is never closed while a batch is being
+        # written back. At most the mark being sent is waited for, as the flusher stops between marks.
+        self._thread.join(timeout=self.bridge.timeout[0] + self.bridge.timeout[1])
+
+    def flush(self) -> int:
+        """Send one batch of due marks. Returns the number of marks that reached a final state."""
+
+        with self._lock:
+            batch = self._db.execute(
+                "SELECT id, idempotency_key, token, event, attempts FROM marks "
+                "WHERE state = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+
+        settled = []
+        settled_tokens = []
+        retry = []
+
+        for row_id, idempotency_key, token, event, attempts in batch:
+            # Whatever is left stays pending for the next run.
+            if self._stop_event.is_set():
+                break
+
+            status = self.bridge.send_mark(token, event, idempotency_key)
+
+            if status is None or status >= 500:
+                retry.append((time.time() + min(self.max_backoff, 2 ** attempts), row_id))
+
+                # The server is unreachable or struggling, no point in sending the rest of the batch now.
+                break
+
+            settled.append(('synced' if status == 200 else 'rejected', status, row_id))
+            settled_tokens.append((token, status))
+
+            # The assignment may have moved on since the mark was recorded.
+            if status == 409:
+                self.bridge.refresh_assignment()
+
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany('UPDATE marks SET state = ?, status = ?, attempts = attempts + 1 WHERE id = ?', settled)
+            self._db.executemany(
+                'UPDATE marks SET next_attempt_at = ?, attempts = attempts + 1 WHERE id = ?', retry
+            )
+            self._db.execute('COMMIT')
+
+        for token, status in settled_tokens:
+            for listener in self._listeners:
+                listener(token, status)
+
+        return len(settled)
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+
+            if self._stop_event.is_set() or self.bridge.need_init:
+                continue
+
+            try:
+                # Keep draining while full batches go through, so a backlog clears quickly once back online.
+                while self.flush() == self.batch_size and not self._stop_event.is_set():
+                    pass
+
+            except sqlite3.Error as e:
+                print(f'Journal Error: {e}')
+
+        with self._lock:
+            self._db.close()
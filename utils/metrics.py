@@ -0,0 +1,357 @@
+"""
+In-process performance metrics. Counters, gauges and latency histograms live in one registry (`REGISTRY`) that the
+capture, decode, server and UI code record into. `MetricsServer` serves them in the Prometheus text format and
+`MetricsLogger` appends periodic snapshots to a JSONL file, so a slow kiosk can be spotted live or diagnosed later.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEFAULT_METRICS_PORT = 9108
+DEFAULT_METRICS_LOG_PATH = os.path.join(
+    os.getenv('LOCALAPPDATA', os.path.expanduser('~')), 'mptkt-scanner', 'metrics.jsonl'
+)
+
+# Upper bounds, in seconds. Wide enough for both millisecond decodes and multi-second server timeouts.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Monotonic count. Also remembers when recent increments happened, for live rates like FPS."""
+
+    def __init__(self, window: int = 512):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self._recent = deque(maxlen=window)
+
+    def inc(self, amount: float = 1.0):
+        now = time.monotonic()
+
+        with self._lock:
+            self.value += amount
+            self._recent.append((now, amount))
+
+    def rate(self, period: float = 5.0) -> float:
+        """Increments per second over the last `period` seconds."""
+
+        cutoff = time.monotonic() - period
+
+        with self._lock:
+            recent = [(at, amount) for at, amount in self._recent if at >= cutoff]
+
+        if len(recent) < 2:
+            return 0.0
+
+        span = max(recent[-1][0] - recent[0][0], 1e-6)
+
+        # The first increment only marks the start of the span.
+        return sum(amount for _, amount in recent[1:]) / span
+
+    def snapshot(self) -> dict:
+        return {'value': self.value}
+
+
+class Gauge:
+    """A value that goes up and down."""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def snapshot(self) -> dict:
+        return {'value': self.value}
+
+
+class Histogram:
+    """
+    Cumulative histogram over fixed `buckets` (upper bounds, in seconds), as Prometheus expects, plus the last
+    `window` observations for live percentiles.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, window: int = 256):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self._recent.append(value)
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The `q` quantile of the recent observations, or None if there are none."""
+
+        with self._lock:
+            recent = sorted(self._recent)
+
+        if len(recent) == 0:
+            return None
+
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+
+
+class MetricsRegistry:
+    """
+    Named metric families, each with one child per combination of label values. `counter()`, `gauge()` and
+    `histogram()` return the existing child or create it, so callers can either look metrics up every time or keep
+    the child around on hot paths.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: dict[str, dict] = {}
+
+    def counter(self, name: str, help_text: str = '', **labels) -> Counter:
+        return self._child(name, 'counter', help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str = '', **labels) -> Gauge:
+        return self._child(name, 'gauge', help_text, labels, Gauge)
+
+    def histogram(
+            self, name: str, help_text: str = '', buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels
+    ) -> Histogram:
+        return self._child(name, 'histogram', help_text, labels, lambda: Histogram(buckets))
+
+    def children(self, name: str) -> list[tuple[dict, object]]:
+        """Every child of `name`, with its labels."""
+
+        family = self._families.get(name)
+
+        if family is None:
+            return []
+
+        with self._lock:
+            return [(dict(key), child) for key, child in family['children'].items()]
+
+    def get(self, name: str, **labels):
+        """The existing child of `name` with exactly these labels, or None."""
+
+        family = self._families.get(name)
+
+        if family is None:
+            return None
+
+        return family['children'].get(tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+    def _child(self, name: str, kind: str, help_text: str, labels: dict, factory):
+        key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+        with self._lock:
+            family = self._families.get(name)
+
+            if family is None:
+                family = {'kind': kind, 'help': help_text, 'children': {}}
+                self._families[name] = family
+
+            elif family['kind'] != kind:
+                raise ValueError(f'Metric {name} is a {family["kind"]}, not a {kind}')
+
+            child = family['children'].get(key)
+
+            if child is None:
+                child = factory()
+                family['children'][key] = child
+
+            return child
+
+    def _items(self) -> list[tuple[str, dict, list]]:
+        with self._lock:
+            return [
+                (name, family, list(family['children'].items())) for name, family in sorted(self._families.items())
+            ]
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+
+        lines = []
+
+        for name, family, children in self._items():
+            if family['help']:
+                lines.append(f'# HELP {name} {family["help"]}')
+            lines.append(f'# TYPE {name} {family["kind"]}')
+
+            for key, child in children:
+                if family['kind'] != 'histogram':
+                    lines.append(f'{name}{_format_labels(key)} {_format_value(child.value)}')
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(child.buckets, child.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(key + (("le", repr(bound)),))} {cumulative}')
+
+                lines.append(f'{name}_bucket{_format_labels(key + (("le", "+Inf"),))} {child.count}')
+                lines.append(f'{name}_sum{_format_labels(key)} {_format_value(child.sum)}')
+                lines.append(f'{name}_count{_format_labels(key)} {child.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """All metrics as plain data: `{name: [{'labels': {...}, ...values}]}`."""
+
+        return {
+            name: [{'labels': dict(key)} | child.snapshot() for key, child in children]
+            for name, family, children in self._items()
+        }
+
+
+def _format_labels(key: tuple) -> str:
+    if len(key) == 0:
+        return ''
+
+    escaped = (
+        (label, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for label, value in key
+    )
+
+    return '{' + ','.join(f'{label}="{value}"' for label, value in escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        registry: MetricsRegistry = self.server.registry
+
+        match self.path.split('?', 1)[0]:
+            case '/metrics':
+                body = registry.render_prometheus().encode()
+                content_type = 'text/plain; version=0.0.4'
+
+            case '/metrics.json':
+                body = json.dumps(registry.snapshot()).encode()
+                content_type = 'application/json'
+
+            case _:
+                self.send_error(404)
+                return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """
+    Serves the registry at `/metrics` (Prometheus text format) and `/metrics.json`. Binds to localhost by default, so
+    the metrics are only reachable from the kiosk itself unless `host` says otherwise.
+    """
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = DEFAULT_METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> bool:
+        """Start serving in the background. Returns False if the port could not be bound."""
+
+        try:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        except OSError as e:
+            print(f'Metrics Server Error: {e}')
+            return False
+
+        self._httpd.daemon_threads = True
+        self._httpd.registry = self.registry
+
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+        return True
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+class MetricsLogger:
+    """
+    Appends a snapshot of the registry to a JSONL file every `interval` seconds, one JSON object per line. The file is
+    rotated to `<path>.1` once it grows past `max_bytes`.
+    """
+
+    def __init__(
+            self, registry: MetricsRegistry = REGISTRY, path: str = DEFAULT_METRICS_LOG_PATH, interval: float = 10.0,
+            max_bytes: int = 10 * 1024 * 1024
+    ):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._log_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+        self.write()
+
+    def write(self):
+        line = json.dumps({'time': time.time(), 'metrics': self.registry.snapshot()})
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+
+            with open(self.path, 'a') as file:
+                file.write(line + '\n')
+
+        except OSError as e:
+            print(f'Metrics Log Error: {e}')
+
+    def _log_loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
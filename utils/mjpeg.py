@@ -0,0 +1,299 @@
+"""
+Native reader for multipart MJPEG streams, such as the `/video` endpoint of IP Webcam.
+"""
+
+import io
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+import requests
+
+from utils.video_capture import CaptureMetrics, CapturedFrame, VideoCapture
+
+DEFAULT_VIDEO_SOURCE = 'http://localhost:5000/video'
+
+# libjpeg can scale a JPEG down by these factors while decoding it, skipping most of the decode work.
+_REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+}
+_REDUCED_COLOR = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
+class MjpegFrame(CapturedFrame):
+    """
+    A frame kept as the JPEG it arrived as. Nothing is decoded until asked for: `buffer` decodes the full colour frame
+    (only needed for frames that are displayed) and `gray(reduction)` decodes straight to grayscale at 1/2, 1/4 or 1/8
+    scale inside libjpeg, which is several times cheaper than a full decode followed by a resize. `color(reduction)`
+    does the same in colour, for video tiles smaller than the frame.
+    """
+
+    def __init__(self, jpeg: bytes, seq: int, timestamp: float):
+        super().__init__(None, seq, timestamp)
+        self.jpeg = jpeg
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            self._buffer = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        return self._buffer
+
+    @property
+    def readable(self) -> bool:
+        """
+        Whether the JPEG decodes at all. A part can pass the marker checks and still be corrupt, in which case every
+        decode returns None. Checked with the cheapest decode, which the motion gate then reuses.
+        """
+
+        return self.gray(8) is not None
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        if self._buffer is None:
+            # Estimate from a reduced decode if one exists, rather than decoding the full frame just for its size.
+            for reduction, gray in list(self._gray.items()):
+                return gray.shape[0] * reduction, gray.shape[1] * reduction
+
+        return self.buffer.shape[:2]
+
+    def color(self, reduction: int = 1):
+        flag = _REDUCED_COLOR.get(reduction)
+
+        if flag is None:
+            return super().color(reduction)
+
+        return cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), flag)
+
+    def _make_gray(self, reduction: int):
+        flag = _REDUCED_GRAYSCALE.get(reduction)
+
+        if flag is None:
+            return super()._make_gray(reduction)
+
+        return cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), flag)
+
+
+class MjpegCapture:
+    """
+    Reads a `multipart/x-mixed-replace` MJPEG stream over HTTP on a background thread. Each part is read as raw JPEG
+    bytes and only the newest is kept, so frames that are replaced before anyone reads them are never decoded at all.
+    Frames are handed out as `MjpegFrame`, which decodes lazily.
+
+    Drop-in replacement for `VideoCapture`: same `read()`, `close()` and counters, and the same reconnection with
+    exponential backoff when the stream drops or stalls for longer than `read_timeout`.
+    """
+
+    def __init__(
+            self, url: str, reconnect_delay: float = 0.5, max_reconnect_delay: float = 10.0,
+            connect_timeout: float = 3.05, read_timeout: float = 5.0
+    ):
+        self.name = url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._condition = threading.Condition()
+        self._frame: Optional[MjpegFrame] = None
+        self._last_read_seq = 0
+        self._seq = 0
+
+        self._stop_event = threading.Event()
+        self._response: Optional[requests.Response] = None
+
+        self.connected = False
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.metrics = CaptureMetrics(url)
+
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        delay = self.reconnect_delay
+
+        while not self._stop_event.is_set():
+            try:
+                with requests.get(self.name, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    self._response = response
+
+                    for jpeg in self._parts(response):
+                        self.connected = True
+                        delay = self.reconnect_delay
+
+                        self._publish(jpeg)
+
+            except (requests.exceptions.RequestException, ValueError, OSError) as e:
+                if not self._stop_event.is_set():
+                    print(f'MJPEG Stream Error: {e}')
+
+            finally:
+                self._response = None
+
+            if self._stop_event.is_set():
+                break
+
+            self.connected = False
+            self.reconnects += 1
+            self.metrics.disconnected()
+
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _parts(self, response: requests.Response):
+        """Yield the body of every part of the multipart stream, as bytes."""
+
+        content_type = response.headers.get('Content-Type', '')
+        boundary = None
+
+        for param in content_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+
+            if key.lower() == 'boundary':
+                # Some cameras include the leading dashes in the header, some don't.
+                boundary = value.strip('"').lstrip('-').encode('latin-1')
+
+        if not boundary:
+            raise ValueError(f'Not a multipart MJPEG stream: {content_type!r}')
+
+        stream = io.BufferedReader(response.raw, buffer_size=64 * 1024)
+
+        if not _skip_to_delimiter(stream, boundary):
+            return
+
+        while not self._stop_event.is_set():
+            headers = {}
+
+            while True:
+                line = stream.readline()
+
+                if not line:
+                    return  # the stream ended
+
+                line = line.strip()
+
+                if not line:
+                    break
+
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            length = headers.get('content-length')
+
+            if length is not None and length.isdigit():
+                body = stream.read(int(length))
+
+                if len(body) < int(length):
+                    return
+
+                if not _skip_to_delimiter(stream, boundary):
+                    return
+
+            else:
+                # Without a length the body runs until the next delimiter line.
+                chunks = []
+
+                while True:
+                    line = stream.readline()
+
+                    if not line:
+                        return
+
+                    if _is_delimiter(line, boundary):
+                        break
+
+                    chunks.append(line)
+
+                body = b''.join(chunks).rstrip(b'\r\n')
+
+            # Parts cut short by a hiccup on the camera side would fail to decode; drop them here.
+            if body[:2] == b'\xff\xd8' and body[-2:] == b'\xff\xd9':
+                yield body
+
+    def _publish(self, jpeg: bytes):
+        timestamp = time.monotonic()
+
+        with self._condition:
+            self._seq += 1
+            self.frames_captured += 1
+
+            dropped = self._has_new_frame
+            if dropped:
+                self.frames_dropped += 1  # discard previous (unprocessed) frame, without ever decoding it
+
+            self._frame = MjpegFrame(jpeg, self._seq, timestamp)
+            self._condition.notify_all()
+
+        self.metrics.frame(timestamp, dropped)
+
+    @property
+    def _has_new_frame(self) -> bool:
+        return self._frame is not None and self._frame.seq > self._last_read_seq
+
+    def read(self, timeout: Optional[float] = None) -> Optional[MjpegFrame]:
+        """Wait for a frame newer than the last one returned. Returns None on timeout or once closed."""
+
+        with self._condition:
+            has_new_frame = self._condition.wait_for(lambda: self._stop_event.is_set() or self._has_new_frame, timeout)
+
+            if not has_new_frame or self._stop_event.is_set():
+                return None
+
+            self._last_read_seq = self._frame.seq
+
+            return self._frame
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Stop the reader thread and wait for it to finish, for at most `timeout` seconds. Reads are interrupted, but a
+        connection still being set up is not, so by default this waits out the connect and read timeouts.
+        """
+
+        self._stop_event.set()
+
+        with self._condition:
+            self._condition.notify_all()
+
+        # Closing the response unblocks a reader waiting on the socket.
+        response = self._response
+        if response is not None:
+            response.close()
+
+        self._thread.join(timeout if timeout is not None else sum(self.timeout) + 1.0)
+
+
+def open_capture(source: str):
+    """HTTP sources (IP Webcam's `/video`) are read natively as MJPEG; anything else goes through OpenCV."""
+
+    if source.startswith(('http://', 'https://')):
+        return MjpegCapture(source)
+
+    return VideoCapture(source)
+
+
+def _is_delimiter(line: bytes, boundary: bytes) -> bool:
+    return line.startswith(b'--') and line.strip().strip(b'-') == boundary
+
+
+def _skip_to_delimiter(stream: io.BufferedReader, boundary: bytes) -> bool:
+    """Read up to and including the next delimiter line. Returns False if the stream ended first."""
+
+    while True:
+        line = stream.readline()
+
+        if not line:
+            return False
+
+        if _is_delimiter(line, boundary):
+            return True
@@ -0,0 +1,69 @@
+"""
+Cheap change detection used to skip decoding frames that show nothing new.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Decides whether a frame is worth decoding. Each frame is shrunk to a small grayscale thumbnail and compared with
+    the thumbnail of the last frame let through; if the mean absolute pixel difference is below `threshold` the scene
+    hasn't changed and the frame is skipped. While nothing changes, one frame every `idle_interval` seconds is still let
+    through so the gate can't get stuck, and any motion wakes it up on the very next frame.
+    """
+
+    def __init__(self, threshold: float = 3.0, thumbnail_size: tuple[int, int] = (64, 36), idle_interval: float = 1.0):
+        """
+        :param threshold: Mean absolute difference (0-255) above which a frame counts as changed.
+        :type threshold: float
+
+        :param thumbnail_size: Width and height of the thumbnails compared.
+        :type thumbnail_size: tuple[int, int]
+
+        :param idle_interval: Seconds between frames let through while the scene is static.
+        :type idle_interval: float
+        """
+
+        self.threshold = threshold
+        self.thumbnail_size = thumbnail_size
+        self.idle_interval = idle_interval
+
+        self._reference = None
+        self._last_pass = 0.0
+
+        self.passed = 0
+        self.skipped = 0
+        self.difference = 0.0
+
+    def should_decode(self, frame_buffer) -> bool:
+        thumbnail = cv2.resize(frame_buffer, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+
+        now = time.monotonic()
+
+        if self._reference is None or self._reference.shape != thumbnail.shape:
+            changed = True
+        else:
+            self.difference = float(np.mean(cv2.absdiff(thumbnail, self._reference)))
+            changed = self.difference >= self.threshold
+
+        if not changed and now - self._last_pass < self.idle_interval:
+            self.skipped += 1
+            return False
+
+        self._reference = thumbnail
+        self._last_pass = now
+        self.passed += 1
+
+        return True
+
+    @property
+    def idle(self) -> bool:
+        """Whether the scene was static as of the last frame offered."""
+
+        return self.difference < self.threshold
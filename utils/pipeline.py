@@ -0,0 +1,486 @@
+"""
+Staged scan pipeline. Capture runs on its own worker thread and hands frames on through single-slot, latest-wins
+buffers; decoding runs on the threads of a `DecodeScheduler` (possibly shared with other cameras) and verification on
+the `AsyncServerBridge` worker pool. The Tk event loop never
+blocks on any of them; it only polls for the newest frame and the newest verdict and paints them.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from utils import decode_qr
+from utils.async_bridge import AsyncServerBridge
+from utils.cache import TokenCooldown
+from utils.decode_pool import DecodePool
+from utils.decoders import QrCode, create_decoder, text_codes, unique_codes
+from utils.decoding import DecoderSelector, MultiScaleDecoder, RoiTracker
+from utils.governor import DecodeGovernor
+from utils.metrics import REGISTRY
+from utils.motion import MotionGate
+from utils.scheduler import DecodeScheduler
+from utils.token_validator import LocalVerdict, TokenValidator
+from utils.video_capture import CapturedFrame, VideoCapture
+
+
+class LatestSlot:
+    """
+    Bounded hand-off buffer holding at most one item. `put()` never blocks and replaces whatever the consumer has not
+    picked up yet, so a slow consumer always works on the newest item and never on a backlog.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._item = None
+        self._has_item = False
+
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            if self._has_item:
+                self.dropped += 1
+
+            self._item = item
+            self._has_item = True
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None):
+        """Block until an item is available or `timeout` seconds elapse. Returns None on timeout."""
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._has_item, timeout):
+                return None
+
+            return self._take()
+
+    def get_nowait(self):
+        """Return the pending item, or None if there is nothing new since the last call."""
+
+        with self._condition:
+            if not self._has_item:
+                return None
+
+            return self._take()
+
+    def _take(self):
+        item = self._item
+        self._item = None
+        self._has_item = False
+
+        return item
+
+
+class DecodedFrame:
+    """
+    A captured frame together with the QR codes found in it and, by payload, the newest result for each of those
+    already verified. `display_buffer`, if set, is the frame already decoded for display, with width and height divided
+    by `display_reduction`.
+    """
+
+    def __init__(self, frame: CapturedFrame, qr_codes: list, results: Optional[dict] = None):
+        self.frame = frame
+        self.seq = frame.seq
+        self.qr_codes = qr_codes
+        self.results: dict[bytes, ScanResult] = results if results is not None else {}
+        self.captured_at = frame.timestamp
+
+        self.display_buffer = None
+        self.display_reduction = 1
+
+    @property
+    def frame_buffer(self):
+        """The full-resolution BGR frame. For MJPEG sources this is where the frame gets fully decoded."""
+
+        return self.frame.buffer
+
+
+class ScanResult:
+    """
+    Outcome of verifying one scanned pass. `verification` is what `ServerBridge.verify()` returned and `pass_info` is
+    the locally decoded token payload (None if the token could not be decoded). A `provisional` result comes from local
+    validation alone and is followed by the server's verdict.
+    """
+
+    def __init__(
+            self, qr, verification: Optional[dict], pass_info: Optional[dict], captured_at: float,
+            provisional: bool = False, lane: str = ''
+    ):
+        self.qr = qr
+        self.lane = lane
+        self.token = qr.data.decode('utf-8')
+        self.verification = verification
+        self.pass_info = pass_info
+        self.captured_at = captured_at
+        self.provisional = provisional
+        self.completed_at = time.monotonic()
+
+    @property
+    def latency(self) -> float:
+        """Seconds between the frame being captured and the verdict being available."""
+
+        return self.completed_at - self.captured_at
+
+
+class ScanPipeline:
+    """
+    Capture → decode → verify pipeline. Call `start()` once, then poll `latest_frame()` and `poll_result()` from the
+    Tk event loop. Neither call ever blocks.
+
+    Every code in a frame is verified, concurrently, so a family holding up several phones is checked in one go. The
+    passes seen within the last `group_window` seconds make up the group in view (see `group()`). When a pass leaves
+    the group, verifications still in flight for it are cancelled so their results never overwrite the verdicts for the
+    passes currently in front of the camera.
+
+    If a `TokenValidator` is given, passes it rejects are answered locally without asking the server, and passes whose
+    signature it accepts get a provisional verdict straight away.
+
+    `decoder_backend` names the QR decoder to start with (see `utils.decoders.BACKENDS`). If `auto_select_decoder` is
+    set, the backends are benchmarked on the first frames with a code in them and the best one takes over.
+
+    With `decode_workers` above zero, decoding runs in that many worker processes instead of the decode thread (see
+    `DecodePool`). Region-of-interest tracking is not used in that mode, as every worker decodes whole frames.
+
+    A kiosk with several cameras runs one pipeline per camera (a lane, identified by `name`) and passes them all the
+    same `scheduler`, which shares the decode threads between the lanes. Without one, the pipeline runs a private
+    single-threaded scheduler.
+
+    Unless `motion_gating` is off, frames that show no change since the last decoded one are not decoded at all while
+    no code is in view (see `MotionGate`); they are still displayed. With a `governor`, shared by all lanes like the
+    scheduler, the frames that get past the gate are further thinned out and decoded at a lower resolution whenever
+    that still meets the scan-latency SLO (see `DecodeGovernor`).
+
+    `capture` may also be an `MjpegCapture`. Only the reduced grayscale versions of a frame are used for detection, so
+    its frames are only ever fully decoded if they get displayed. Once the UI sets `display_size` (its video tile's
+    width and height), every frame is also decoded for display on the capture thread, at the smallest size that still
+    fills the tile, so the Tk thread only ever gets a buffer ready to paint.
+
+    Without a UI to poll it, pass `on_result` to be handed every result as soon as it is published, on whichever
+    thread produced it (a decode thread or an `AsyncServerBridge` worker). It must not block.
+
+    While `authoritative` returns True, every pass is verified by the server even if the roster could answer it, as
+    results get marked without an operator looking at them (see `AutoAdmitter`).
+    """
+
+    def __init__(
+            self, capture: VideoCapture, bridge: AsyncServerBridge, validator: Optional[TokenValidator] = None,
+            decoder_backend: Optional[str] = None, auto_select_decoder: bool = True, decode_workers: int = 0,
+            scheduler: Optional[DecodeScheduler] = None, name: str = '', motion_gating: bool = True,
+            on_result: Optional[Callable[[ScanResult], None]] = None, group_window: float = 1.0,
+            governor: Optional[DecodeGovernor] = None, authoritative: Optional[Callable[[], bool]] = None
+    ):
+        self.capture = capture
+        self.bridge = bridge
+        self.validator = validator
+        self.name = name
+        self.on_result = on_result
+        self.authoritative = authoritative
+
+        self._owns_scheduler = scheduler is None
+        self.scheduler = scheduler if scheduler is not None else DecodeScheduler()
+        self.scheduler.register(self)
+
+        self._display_slot = LatestSlot()
+
+        self.display_size: Optional[tuple[int, int]] = None
+        self._display_reduction = 1
+        self._result_slot = LatestSlot()
+
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        self.qr_codes: list = []
+        self._last_hit = 0.0
+        self._last_motion = 0.0
+        self.decoder = MultiScaleDecoder(create_decoder(decoder_backend))
+        self.tracker = RoiTracker(self.decoder.decode)
+
+        self.decoder_selector = DecoderSelector(self.decoder)
+        self.decoder_selector.pending = auto_select_decoder
+
+        self.motion_gate = MotionGate() if motion_gating else None
+
+        self.governor = governor
+        if self.governor is not None:
+            self.governor.register(self)
+
+        self.decode_pool: Optional[DecodePool] = None
+        if decode_workers > 0:
+            self.decode_pool = DecodePool(self._on_pool_result, decode_workers, self.decoder.scales)
+
+        # A token is re-sent for verification when it rejoins the group in view or returns after its cooldown.
+        self.cooldown = TokenCooldown()
+
+        # When each pass in view was last seen, and its newest result. Written by decode and verify threads alike.
+        self.group_window = group_window
+        self._sightings: dict[bytes, float] = {}
+        self._group_results: dict[bytes, ScanResult] = {}
+        self._group_lock = threading.Lock()
+
+        self._decode_time = REGISTRY.histogram('decode_seconds', 'Time spent decoding one frame.', lane=name)
+        self._decode_hits = REGISTRY.counter('decodes_total', 'Frames decoded.', lane=name, result='hit')
+        self._decode_misses = REGISTRY.counter('decodes_total', 'Frames decoded.', lane=name, result='miss')
+        self._hit_ratio = REGISTRY.gauge('decode_hit_ratio', 'Share of decoded frames with a code in them.', lane=name)
+        self._first_try_ratio = REGISTRY.gauge(
+            'decode_first_try_hit_ratio',
+            'Share of hits that needed neither a higher resolution nor the other polarity.', lane=name
+        )
+        self._decode_throttled = REGISTRY.counter(
+            'decode_throttled_total', 'Frames not decoded because the governor held the lane back.', lane=name
+        )
+        self._decode_skipped = REGISTRY.counter(
+            'decode_skipped_total', 'Frames not decoded because nothing had changed.', lane=name
+        )
+        self._frames_unreadable = REGISTRY.counter(
+            'capture_frames_unreadable_total', 'Frames skipped because they could not be decoded.', lane=name
+        )
+        self._scan_latency = REGISTRY.histogram(
+            'scan_latency_seconds', 'Time from capturing a pass to having its final verdict.', lane=name
+        )
+
+    def start(self):
+        if self._owns_scheduler:
+            self.scheduler.start()
+
+        thread = threading.Thread(target=self._capture_stage, daemon=True)
+        thread.start()
+
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+        self.scheduler.unregister(self)
+
+        if self.governor is not None:
+            self.governor.unregister(self)
+
+        if self._owns_scheduler:
+            self.scheduler.stop()
+
+        if self.decode_pool is not None:
+            self.decode_pool.shutdown()
+
+    @property
+    def has_code_in_view(self) -> bool:
+        """Whether a QR code was decoded on this lane within the last second."""
+
+        return time.monotonic() - self._last_hit < 1.0
+
+    @property
+    def has_motion(self) -> bool:
+        """
+        Whether the scene changed within the last second while no code was in view, e.g. as a pass is brought up to
+        the camera. Always True without motion gating, as nothing else measures change.
+        """
+
+        return self.motion_gate is None or time.monotonic() - self._last_motion < 1.0
+
+    @property
+    def running(self) -> bool:
+        return not self._stop_event.is_set()
+
+    def latest_frame(self) -> Optional[DecodedFrame]:
+        """
+        Newest captured frame not yet handed to the UI. `qr_codes` holds the most recent decode result and `results`
+        the newest result for each pass in view.
+        """
+
+        decoded_frame = self._display_slot.get_nowait()
+
+        if decoded_frame is not None:
+            decoded_frame.qr_codes = self.qr_codes
+            decoded_frame.results = {token: result for token, result in self.group().items() if result is not None}
+
+        return decoded_frame
+
+    def group(self) -> dict[bytes, Optional[ScanResult]]:
+        """
+        The passes in view, i.e. seen within the last `group_window` seconds, in the order they came into view, each
+        with its newest result (None while the first is still awaited).
+        """
+
+        now = time.monotonic()
+
+        with self._group_lock:
+            return {
+                token: self._group_results.get(token) for token, seen in self._sightings.items()
+                if now - seen < self.group_window
+            }
+
+    def poll_result(self) -> Optional[ScanResult]:
+        """Newest verification result not yet handed to the UI."""
+
+        return self._result_slot.get_nowait()
+
+    def _capture_stage(self):
+        while self.running:
+            captured_frame = self.capture.read(timeout=0.5)
+
+            if captured_frame is None:
+                continue
+
+            if not captured_frame.readable:
+                self._frames_unreadable.inc()
+                continue
+
+            # One bad frame must not end capture for the lane.
+            try:
+                self._handle_captured(captured_frame)
+            except Exception as e:
+                print(f'Capture Error: {e}')
+
+    def _handle_captured(self, captured_frame: CapturedFrame):
+        decoded_frame = DecodedFrame(captured_frame, [])
+
+        if self.display_size is not None:
+            self._prepare_display(decoded_frame)
+
+        # The gate only looks at a tiny thumbnail, so an eighth-size grayscale frame is plenty.
+        gated = self.motion_gate is not None and not self.has_code_in_view
+
+        passed_gate = not gated or self.motion_gate.should_decode(captured_frame.gray(8))
+
+        if gated and self.motion_gate.difference >= self.motion_gate.threshold:
+            self._last_motion = time.monotonic()
+
+        if not passed_gate:
+            self._decode_skipped.inc()
+        elif self.governor is not None and not self.governor.should_decode(self):
+            self._decode_throttled.inc()
+        else:
+            self.scheduler.submit(self, decoded_frame)
+
+        self._display_slot.put(decoded_frame)
+
+    def _prepare_display(self, decoded_frame: DecodedFrame):
+        reduction = self._display_reduction
+
+        decoded_frame.display_buffer = decoded_frame.frame.color(reduction)
+        decoded_frame.display_reduction = reduction
+
+        # The next frame is decoded at the largest reduction that still covers the tile, at this frame's size.
+        height, width = decoded_frame.display_buffer.shape[:2]
+        full_width, full_height = width * reduction, height * reduction
+        tile_width, tile_height = self.display_size
+
+        self._display_reduction = max(
+            (factor for factor in (2, 4, 8) if full_width // factor >= tile_width and full_height // factor >= tile_height),
+            default=1
+        )
+
+    def decode_frame(self, decoded_frame: DecodedFrame):
+        """Decode one frame. Called by the scheduler on one of its decode threads."""
+
+        if not self.running:
+            return
+
+        if self.decode_pool is not None:
+            self.decode_pool.submit(
+                decoded_frame.seq, decoded_frame.frame.gray(), self.decoder.backend.name, decoded_frame
+            )
+            return
+
+        start = time.perf_counter()
+        qr_codes = self.tracker.decode(decoded_frame.frame)
+        self._decode_time.observe(time.perf_counter() - start)
+
+        self._handle_decoded(decoded_frame, qr_codes)
+
+    def _on_pool_result(
+            self, decoded_frame: DecodedFrame, qr_codes: list[QrCode], elapsed: float, first_try: bool, inverted: bool
+    ):
+        self.decoder.stats.record(elapsed, len(qr_codes) > 0, first_try, inverted)
+        self._decode_time.observe(elapsed)
+
+        if self.running:
+            self._handle_decoded(decoded_frame, qr_codes)
+
+    def _handle_decoded(self, decoded_frame: DecodedFrame, qr_codes: list[QrCode]):
+        qr_codes = text_codes(unique_codes(qr_codes))
+        self.qr_codes = qr_codes
+
+        self._hit_ratio.set(self.decoder.stats.hit_rate)
+        self._first_try_ratio.set(self.decoder.stats.first_try_hit_rate)
+
+        if len(qr_codes) == 0:
+            self._decode_misses.inc()
+            self.decoder_selector.observe(decoded_frame.frame, qr_codes)
+            return
+
+        self._decode_hits.inc()
+
+        now = time.monotonic()
+        self._last_hit = now
+
+        with self._group_lock:
+            # Every sighting must reach the cooldown, so the readiness check comes first.
+            fresh = [
+                qr for qr in qr_codes
+                if self.cooldown.ready(qr.data) or now - self._sightings.get(qr.data, 0.0) >= self.group_window
+            ]
+
+            for qr in qr_codes:
+                self._sightings[qr.data] = now
+
+            for token in [token for token, seen in self._sightings.items() if now - seen >= self.group_window]:
+                del self._sightings[token]
+                self._group_results.pop(token, None)
+
+            in_view = [token.decode('utf-8') for token in self._sightings]
+
+        if len(fresh) > 0:
+            self.bridge.cancel_stale(keep=in_view, owner=self)
+
+            for qr in fresh:
+                self._verify(qr, decoded_frame.captured_at)
+
+        # Only once the passes are on their way to the server, so sampling never delays a verdict.
+        self.decoder_selector.observe(decoded_frame.frame, qr_codes)
+
+    def _verify(self, qr, captured_at: float):
+        token = qr.data.decode('utf-8')
+
+        if self.validator is not None:
+            verdict, reason = self.validator.validate(token)
+
+            match verdict:
+                case LocalVerdict.INVALID:
+                    local_res = {'status': 400, 'text': reason, 'subtext': 'Rejected without contacting the server.'}
+                    self._publish(ScanResult(qr, local_res, decode_qr(qr), captured_at, lane=self.name))
+                    return
+
+                case LocalVerdict.VALID:
+                    local_res = {'status': 200, 'text': 'LIKELY VALID', 'subtext': 'Confirming with server...'}
+                    self._publish(ScanResult(qr, local_res, decode_qr(qr), captured_at, provisional=True, lane=self.name))
+
+        authoritative = self.authoritative is not None and self.authoritative()
+        future = self.bridge.verify(token, owner=self, authoritative=authoritative)
+
+        def _on_verified(done: Future):
+            # Cancelled or failed: the pass has no verdict, so try again on the next sighting.
+            if done.cancelled() or done.exception() is not None:
+                self.cooldown.reset(qr.data)
+                return
+
+            # No assignment yet (e.g. the bridge is still loading at startup) or the server was unreachable: try again
+            # on the next sighting too, rather than leaving the pass on NETWORK ERROR while it stays in view.
+            if done.result() is None or done.result()['status'] == 0:
+                self.cooldown.reset(qr.data)
+
+            self._publish(ScanResult(qr, done.result(), decode_qr(qr), captured_at, lane=self.name))
+
+        future.add_done_callback(_on_verified)
+
+    def _publish(self, result: ScanResult):
+        if not result.provisional:
+            self._scan_latency.observe(result.latency)
+
+        with self._group_lock:
+            if result.qr.data in self._sightings:
+                self._group_results[result.qr.data] = result
+
+        self._result_slot.put(result)
+
+        if self.on_result is not None:
+            self.on_result(result)
@@ -0,0 +1,203 @@
+"""
+Pre-synced pass roster for the current assignment. Lets `ServerBridge.verify()` answer from a local hash index instead
+of asking the server for every scan.
+"""
+
+import base64
+import binascii
+import gzip
+import json
+import os
+import threading
+from typing import Optional
+
+from utils.bridge import ServerBridge
+from utils.token_validator import LocalVerdict, TokenValidator
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.getenv('LOCALAPPDATA', os.path.expanduser('~')), 'mptkt-scanner', 'roster')
+
+
+def pass_id_from_token(token: str) -> Optional[str]:
+    """
+    Return the `_id` claim of a pass token, or None if the token can't be decoded. The claim is not authenticated; see
+    `PassRoster.lookup()`.
+    """
+
+    segments = token.split('.')
+
+    if len(segments) != 3:
+        return None
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(segments[1] + '=' * (-len(segments[1]) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+
+    if not isinstance(payload, dict) or '_id' not in payload:
+        return None
+
+    return str(payload['_id'])
+
+
+class PassRoster:
+    """
+    In-memory index of pass ID → state ('valid', 'staff', 'marked' or 'revoked') for the event the kiosk is assigned
+    to. A background thread downloads the full roster whenever the assignment changes and then keeps it fresh with
+    delta syncs every `refresh_interval` seconds. Each sync is also written to a gzipped snapshot in `snapshot_dir` so
+    a restarted kiosk can answer immediately, before the first sync completes.
+
+    Passes are indexed by the `_id` in the token payload, which anyone can copy into a token of their own, so only
+    tokens whose signature `validator` has checked are looked up at all. Until the validator has the server's public
+    key, every lookup misses and the server is asked.
+
+    If the server doesn't serve rosters, the roster disables itself and every lookup misses.
+    """
+
+    def __init__(
+            self, bridge: ServerBridge, validator: TokenValidator, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR,
+            refresh_interval: float = 30.0
+    ):
+        self.bridge = bridge
+        self.validator = validator
+        self.snapshot_dir = snapshot_dir
+        self.refresh_interval = refresh_interval
+
+        self.enabled = True
+        self.event: Optional[str] = None
+        self.version: Optional[str] = None
+
+        self._passes: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def lookup(self, token: str) -> Optional[str]:
+        """State of the pass `token` belongs to, or None on a miss, including for tokens not signed by the server."""
+
+        assignment = self.bridge.assignment
+
+        if not self.enabled or assignment is None or assignment['a_id'] != self.event:
+            return None
+
+        # A forged token can carry a genuine pass's ID; only the signature ties the token to that pass.
+        if self.validator.validate(token)[0] is not LocalVerdict.VALID:
+            return None
+
+        pass_id = pass_id_from_token(token)
+        if pass_id is None:
+            return None
+
+        with self._lock:
+            return self._passes.get(pass_id)
+
+    def note_marked(self, token: str):
+        """Record a local mark, so a rescan before the next sync isn't reported as valid."""
+
+        pass_id = pass_id_from_token(token)
+
+        with self._lock:
+            if pass_id is not None and self._passes.get(pass_id) == 'valid':
+                self._passes[pass_id] = 'marked'
+
+    def __len__(self):
+        with self._lock:
+            return len(self._passes)
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        """Sync now rather than at the next interval, e.g. because the assignment changed."""
+
+        self._wake_event.set()
+
+    def sync(self):
+        """Bring the index up to date with the server for the current assignment."""
+
+        assignment = self.bridge.assignment
+
+        if assignment is None:
+            return
+
+        event = assignment['a_id']
+
+        if event != self.event:
+            self._load_snapshot(event)
+
+        response = self.bridge.get_roster(event, since=self.version)
+
+        if response is None:
+            return
+
+        if response.get('unsupported'):
+            self.enabled = False
+            return
+
+        with self._lock:
+            if response.get('full', self.version is None):
+                self._passes = {str(pass_id): state for pass_id, state in response.get('passes', {}).items()}
+            else:
+                self._passes.update({str(pass_id): state for pass_id, state in response.get('passes', {}).items()})
+
+                for pass_id in response.get('removed', []):
+                    self._passes.pop(str(pass_id), None)
+
+            self.version = response.get('version')
+
+        self._save_snapshot()
+
+    def _sync_loop(self):
+        while not self._stop_event.is_set() and self.enabled:
+            try:
+                self.sync()
+            except (OSError, ValueError) as e:
+                print(f'Roster Error: {e}')
+
+            self._wake_event.wait(self.refresh_interval)
+            self._wake_event.clear()
+
+    def _snapshot_path(self, event: str) -> str:
+        return os.path.join(self.snapshot_dir, base64.urlsafe_b64encode(event.encode()).decode() + '.json.gz')
+
+    def _load_snapshot(self, event: str):
+        passes: dict[str, str] = {}
+        version = None
+
+        try:
+            with gzip.open(self._snapshot_path(event), 'rt', encoding='utf-8') as snapshot:
+                data = json.load(snapshot)
+
+            passes = data['passes']
+            version = data['version']
+
+        except (OSError, ValueError, KeyError):
+            pass
+
+        with self._lock:
+            self._passes = passes
+            self.version = version
+            self.event = event
+
+    def _save_snapshot(self):
+        with self._lock:
+            data = {'event': self.event, 'version': self.version, 'passes': dict(self._passes)}
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+        path = self._snapshot_path(self.event)
+        temp_path = path + '.tmp'
+
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as snapshot:
+            json.dump(data, snapshot, separators=(',', ':'))
+
+        os.replace(temp_path, path)
@@ -0,0 +1,116 @@
+"""
+Decode scheduling shared between the camera lanes of one kiosk.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class DecodeScheduler:
+    """
+    Hands frames from any number of lanes (one `ScanPipeline` per camera) to a fixed number of decode threads. Each
+    lane has a single latest-wins slot, so a lane never queues more than its newest frame. When a decode thread frees
+    up, it serves the waiting lane that has gone longest without being served, with the wait of a lane that currently
+    has a QR code in view counted `hot_weight` times, so that lane gets decoded more often without starving the rest.
+    """
+
+    def __init__(self, workers: int = 1, hot_weight: float = 3.0):
+        self.workers = workers
+        self.hot_weight = hot_weight
+
+        self._condition = threading.Condition()
+        self._pending: dict[object, object] = {}
+        self._last_served: dict[object, float] = {}
+        self._busy: set = set()
+
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        self.served: dict[object, int] = {}
+
+    def register(self, lane):
+        """Add a lane. `lane` must provide `decode_frame(item)` and a `has_code_in_view` property."""
+
+        with self._condition:
+            self._last_served[lane] = time.monotonic()
+            self.served[lane] = 0
+
+    def unregister(self, lane):
+        with self._condition:
+            self._pending.pop(lane, None)
+            self._last_served.pop(lane, None)
+
+    def submit(self, lane, item):
+        """Queue `item` for `lane`, replacing any frame of that lane not yet decoded."""
+
+        with self._condition:
+            self._pending[lane] = item
+            self._condition.notify()
+
+    def start(self):
+        if len(self._threads) > 0:
+            return
+
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+
+        with self._condition:
+            self._condition.notify_all()
+
+    def _next(self) -> Optional[tuple[object, object]]:
+        now = time.monotonic()
+        best_lane = None
+        best_score = -1.0
+
+        # A lane is only decoded by one thread at a time, so its ROI tracker and decoder state stay consistent.
+        for lane in self._pending:
+            if lane in self._busy:
+                continue
+
+            score = (now - self._last_served.get(lane, now)) * (self.hot_weight if lane.has_code_in_view else 1.0)
+
+            if score > best_score:
+                best_lane = lane
+                best_score = score
+
+        if best_lane is None:
+            return None
+
+        self._busy.add(best_lane)
+        self._last_served[best_lane] = now
+        self.served[best_lane] = self.served.get(best_lane, 0) + 1
+
+        return best_lane, self._pending.pop(best_lane)
+
+    def _work(self):
+        while not self._stop_event.is_set():
+            with self._condition:
+                job = self._next()
+
+                while job is None and not self._stop_event.is_set():
+                    self._condition.wait(timeout=0.5)
+                    job = self._next()
+
+            if job is None:
+                return
+
+            lane, item = job
+
+            try:
+                lane.decode_frame(item)
+
+            # One bad frame must not take the decode thread, and with it every lane it serves, down with it.
+            except Exception as e:
+                print(f'Decode Error: {e}')
+
+            finally:
+                with self._condition:
+                    self._busy.discard(lane)
+                    self._condition.notify()
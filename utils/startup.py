@@ -0,0 +1,49 @@
+"""
+Startup work that must not hold up the first camera frame. The window and the cameras come up straight away on an
+unloaded `ServerBridge`; everything that waits on the keystore or the network, or loads native libraries, runs here on
+a background thread instead, and each step's duration is recorded in `startup_step_seconds{step}`.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+from utils.bridge import ServerBridge
+from utils.decoders import available_decoders
+from utils.metrics import REGISTRY
+from utils.token_validator import TokenValidator
+
+
+def _timed(step: str, fn: Callable[[], object]):
+    start = time.perf_counter()
+
+    try:
+        fn()
+    finally:
+        REGISTRY.gauge('startup_step_seconds', 'Time taken by each background startup step.', step=step).set(
+            time.perf_counter() - start
+        )
+
+
+def run_startup(bridge: ServerBridge, validator: Optional[TokenValidator] = None):
+    """
+    Load the bridge (credentials, assignment and the pooled server connection), then give `validator` the server's
+    public key and load every decoder backend's library, so neither happens on the first scan. Blocks.
+    """
+
+    _timed('bridge', bridge.load)
+
+    if validator is not None:
+        _timed('public_key', lambda: validator.set_public_key(bridge.get_public_key()))
+
+    # The decoder selector benchmarks every backend on the first passes it sees; load their libraries before that.
+    _timed('decoders', available_decoders)
+
+
+def start_background(bridge: ServerBridge, validator: Optional[TokenValidator] = None) -> threading.Thread:
+    """Run `run_startup()` on a daemon thread. `bridge.loaded` is set as soon as the bridge itself has loaded."""
+
+    thread = threading.Thread(target=run_startup, args=(bridge, validator), daemon=True)
+    thread.start()
+
+    return thread
@@ -0,0 +1,154 @@
+"""
+Local pre-validation of pass tokens, so malformed, expired or forged passes are rejected before they cost a round trip
+to `/verify`. Signature checks need the optional `cryptography` package and the server's public key; without them only
+the token structure and its time-based claims are checked.
+"""
+
+import base64
+import binascii
+import json
+import time
+from enum import Enum
+from typing import Optional
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, padding
+    from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+except ImportError:
+    serialization = None
+
+
+class LocalVerdict(Enum):
+    """Outcome of local validation."""
+    VALID = 'valid'
+    INVALID = 'invalid'
+    UNVERIFIED = 'unverified'
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+class TokenValidator:
+    """
+    Validates JWS compact tokens (`header.payload.signature`) offline. `validate()` returns a `LocalVerdict` and a
+    reason. INVALID is final and the server need not be asked. VALID means the signature checked out against the cached
+    public key and the token is within its `nbf`/`exp` window, which is enough for a provisional verdict while the
+    server confirms. UNVERIFIED means nothing was wrong locally but the signature could not be checked.
+    """
+
+    _HASHES = {
+        '256': 'SHA256',
+        '384': 'SHA384',
+        '512': 'SHA512'
+    }
+
+    def __init__(self, public_key_pem: Optional[bytes] = None, leeway: float = 30.0):
+        """
+        :param public_key_pem: PEM encoded server public key (RSA or EC). Signatures are not checked if None.
+        :type public_key_pem: Optional[bytes]
+
+        :param leeway: Clock skew tolerated on `exp` and `nbf`, in seconds.
+        :type leeway: float
+        """
+
+        self.leeway = leeway
+        self.public_key = None
+
+        self.set_public_key(public_key_pem)
+
+    def set_public_key(self, public_key_pem: Optional[bytes]):
+        """Start checking signatures against this key, e.g. once it has been fetched after startup."""
+
+        if public_key_pem is not None and serialization is not None:
+            try:
+                self.public_key = serialization.load_pem_public_key(public_key_pem)
+            except ValueError as e:
+                print(f'Public Key Error: {e}')
+
+    @property
+    def checks_signatures(self) -> bool:
+        return self.public_key is not None
+
+    def validate(self, token: str) -> tuple[LocalVerdict, str]:
+        segments = token.split('.')
+
+        if len(segments) != 3:
+            return LocalVerdict.INVALID, 'MALFORMED PASS'
+
+        try:
+            header = json.loads(_b64url_decode(segments[0]))
+            payload = json.loads(_b64url_decode(segments[1]))
+            signature = _b64url_decode(segments[2])
+
+        except (binascii.Error, ValueError):
+            return LocalVerdict.INVALID, 'MALFORMED PASS'
+
+        if not isinstance(header, dict) or not isinstance(payload, dict):
+            return LocalVerdict.INVALID, 'MALFORMED PASS'
+
+        now = time.time()
+
+        try:
+            if 'exp' in payload and float(payload['exp']) < now - self.leeway:
+                return LocalVerdict.INVALID, 'PASS EXPIRED'
+
+            if 'nbf' in payload and float(payload['nbf']) > now + self.leeway:
+                return LocalVerdict.INVALID, 'PASS NOT YET VALID'
+
+        except (TypeError, ValueError):
+            return LocalVerdict.INVALID, 'MALFORMED PASS'
+
+        if not self.checks_signatures:
+            return LocalVerdict.UNVERIFIED, ''
+
+        signed = f'{segments[0]}.{segments[1]}'.encode()
+
+        match self._check_signature(str(header.get('alg', '')), signed, signature):
+            case True:
+                return LocalVerdict.VALID, ''
+
+            case False:
+                return LocalVerdict.INVALID, 'INVALID SIGNATURE'
+
+            case _:
+                return LocalVerdict.UNVERIFIED, ''
+
+    def _check_signature(self, alg: str, signed: bytes, signature: bytes) -> Optional[bool]:
+        """Returns None if `alg` can't be checked with the cached key."""
+
+        hash_name = self._HASHES.get(alg[2:])
+        if hash_name is None:
+            return None
+
+        algorithm = getattr(hashes, hash_name)()
+
+        try:
+            match alg[:2]:
+                case 'RS':
+                    self.public_key.verify(signature, signed, padding.PKCS1v15(), algorithm)
+
+                case 'PS':
+                    pss = padding.PSS(mgf=padding.MGF1(algorithm), salt_length=padding.PSS.DIGEST_LENGTH)
+                    self.public_key.verify(signature, signed, pss, algorithm)
+
+                case 'ES':
+                    half = len(signature) // 2
+                    der_signature = encode_dss_signature(
+                        int.from_bytes(signature[:half], 'big'), int.from_bytes(signature[half:], 'big')
+                    )
+                    self.public_key.verify(der_signature, signed, ec.ECDSA(algorithm))
+
+                case _:
+                    return None
+
+        except InvalidSignature:
+            return False
+
+        except (TypeError, AttributeError):
+            # The algorithm doesn't match the key type (e.g. an RS256 token against an EC key).
+            return None
+
+        return True
@@ -1,33 +1,227 @@
-from queue import Queue, Empty
-from threading import Thread
+import threading
+import time
+from typing import Optional
 
 import cv2
 
+from utils.metrics import REGISTRY
+
+
+class CapturedFrame:
+    """
+    A frame read from a capture, with its sequence number and capture time (`time.monotonic()`). `gray()` gives the
+    grayscale frame the decoders work on, at full or reduced resolution; each version is made once and then cached.
+    """
+
+    def __init__(self, buffer, seq: int, timestamp: float):
+        self._buffer = buffer
+        self.seq = seq
+        self.timestamp = timestamp
+
+        # Filled from whichever thread asks first. Two threads racing for the same version at worst both compute it.
+        self._gray: dict[int, object] = {}
+
+    @property
+    def buffer(self):
+        """The full-resolution BGR frame."""
+
+        return self._buffer
+
+    @property
+    def readable(self) -> bool:
+        """Whether the frame holds an image at all. Frames read from a camera always do."""
+
+        return True
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """Height and width of the full-resolution frame."""
+
+        return self.buffer.shape[:2]
+
+    def color(self, reduction: int = 1):
+        """
+        The BGR frame with width and height divided by `reduction`, e.g. sized for a video tile. Not cached, as only the
+        display asks for it, once per frame.
+        """
+
+        if reduction == 1:
+            return self.buffer
+
+        height, width = self.buffer.shape[:2]
+
+        return cv2.resize(
+            self.buffer, (max(1, width // reduction), max(1, height // reduction)), interpolation=cv2.INTER_AREA
+        )
+
+    def gray(self, reduction: int = 1):
+        """The frame in grayscale, with width and height divided by `reduction`."""
+
+        gray = self._gray.get(reduction)
+
+        if gray is None:
+            gray = self._make_gray(reduction)
+            self._gray[reduction] = gray
+
+        return gray
+
+    def _make_gray(self, reduction: int):
+        if reduction > 1 and 1 in self._gray:
+            source = self._gray[1]
+        else:
+            source = self.buffer
+
+        if reduction > 1:
+            height, width = source.shape[:2]
+            size = (max(1, width // reduction), max(1, height // reduction))
+            source = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+
+        return source if source.ndim == 2 else cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+
+
+class CaptureMetrics:
+    """Capture metrics for one source, shared by the capture classes."""
+
+    def __init__(self, source: str):
+        self.interval = REGISTRY.histogram(
+            'capture_interval_seconds', 'Time between frames from the camera.', source=source
+        )
+        self.frames = REGISTRY.counter('capture_frames_total', 'Frames received from the camera.', source=source)
+        self.dropped = REGISTRY.counter(
+            'capture_frames_dropped_total', 'Frames replaced before anything read them.', source=source
+        )
+        self.reconnects = REGISTRY.counter('capture_reconnects_total', 'Times the stream was reopened.', source=source)
+        self.connected = REGISTRY.gauge('capture_connected', 'Whether the stream is delivering frames.', source=source)
+
+        self._last_frame_at: Optional[float] = None
+
+    def frame(self, timestamp: float, dropped: bool):
+        if self._last_frame_at is not None:
+            self.interval.observe(timestamp - self._last_frame_at)
+
+        self._last_frame_at = timestamp
+        self.frames.inc()
+        self.connected.set(1)
+
+        if dropped:
+            self.dropped.inc()
+
+    def disconnected(self):
+        self._last_frame_at = None
+        self.reconnects.inc()
+        self.connected.set(0)
+
 
 class VideoCapture:
-    def __init__(self, name):
-        self.cap = cv2.VideoCapture(name)
-        self.q = Queue()
+    """
+    Wrapper for `cv2.VideoCapture` that reads frames on a background thread and keeps only the most recent one, in a
+    single slot guarded by a condition variable. `read()` waits for a frame newer than the last one it returned, for at
+    most `timeout` seconds. Frames overwritten before anyone read them are counted in `frames_dropped`.
+
+    When the stream drops (the phone app restarts, Wi-Fi blips), the reader reopens it with exponential backoff,
+    starting at `reconnect_delay` seconds and capped at `max_reconnect_delay`. `close()` stops the reader thread.
+    """
+
+    def __init__(
+            self, name, reconnect_delay: float = 0.5, max_reconnect_delay: float = 10.0, io_timeout_ms: int = 5000
+    ):
+        self.name = name
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.io_timeout_ms = io_timeout_ms
+
+        self._condition = threading.Condition()
+        self._frame: Optional[CapturedFrame] = None
+        self._last_read_seq = 0
+        self._seq = 0
+
+        self._stop_event = threading.Event()
+
+        self.connected = False
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.metrics = CaptureMetrics(str(name))
 
-        t = Thread(target=self._reader)
-        t.daemon = True
-        t.start()
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def _open(self) -> cv2.VideoCapture:
+        # Bound open and read times, so a stalled stream is noticed instead of blocking the reader indefinitely.
+        return cv2.VideoCapture(self.name, cv2.CAP_ANY, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, self.io_timeout_ms,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, self.io_timeout_ms
+        ])
 
     # read frames as soon as they are available, keeping only most recent one
     def _reader(self):
-        while True:
-            ret, frame = self.cap.read()
+        delay = self.reconnect_delay
+
+        while not self._stop_event.is_set():
+            cap = self._open()
+
+            while not self._stop_event.is_set():
+                ret, frame = cap.read()
+
+                if not ret:
+                    break
+
+                self.connected = True
+                delay = self.reconnect_delay
+
+                timestamp = time.monotonic()
+
+                with self._condition:
+                    self._seq += 1
+                    self.frames_captured += 1
 
-            if not ret:
+                    dropped = self._has_new_frame
+                    if dropped:
+                        self.frames_dropped += 1  # discard previous (unprocessed) frame
+
+                    self._frame = CapturedFrame(frame, self._seq, timestamp)
+                    self._condition.notify_all()
+
+                self.metrics.frame(timestamp, dropped)
+
+            cap.release()
+
+            if self._stop_event.is_set():
                 break
 
-            if not self.q.empty():
-                try:
-                    self.q.get_nowait()  # discard previous (unprocessed) frame
-                except Empty:
-                    pass
+            self.connected = False
+            self.reconnects += 1
+            self.metrics.disconnected()
+
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    @property
+    def _has_new_frame(self) -> bool:
+        return self._frame is not None and self._frame.seq > self._last_read_seq
+
+    def read(self, timeout: Optional[float] = None) -> Optional[CapturedFrame]:
+        """Wait for a frame newer than the last one returned. Returns None on timeout or once closed."""
+
+        with self._condition:
+            has_new_frame = self._condition.wait_for(lambda: self._stop_event.is_set() or self._has_new_frame, timeout)
+
+            if not has_new_frame or self._stop_event.is_set():
+                return None
+
+            self._last_read_seq = self._frame.seq
+
+            return self._frame
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Stop the reader thread and wait for it to finish, for at most `timeout` seconds. A blocked `cv2.VideoCapture`
+        read cannot be interrupted, so by default this waits out the I/O timeout, the longest the reader can be stuck.
+        """
+
+        self._stop_event.set()
 
-            self.q.put(frame)
+        with self._condition:
+            self._condition.notify_all()
 
-    def read(self):
-        return self.q.get()
+        self._thread.join(timeout if timeout is not None else self.io_timeout_ms / 1000 + 1.0)
@@ -1,18 +1,30 @@
 """
 Core window.
 """
+import argparse
+import os
+import time
 import tkinter as tk
 from enum import IntEnum
-
-import requests
-from PIL import Image
+from typing import Optional
 
 from frames.admittance_frame import AdmittanceFrame
 from frames.controls_frame import ControlsFrame
 from frames.info_frame import InfoFrame
 from frames.video_frame import VideoFrame
+from utils.admit import AutoAdmitter
+from utils.assignment import AssignmentSnapshot, AssignmentWatcher
+from utils.async_bridge import AsyncServerBridge
 from utils.bridge import ServerBridge
-from utils.video_capture import VideoCapture
+from utils.governor import DecodeGovernor
+from utils.journal import AttendanceJournal
+from utils.metrics import REGISTRY, MetricsLogger, MetricsServer
+from utils.mjpeg import DEFAULT_VIDEO_SOURCE, open_capture
+from utils.pipeline import LatestSlot, ScanPipeline
+from utils.roster import PassRoster
+from utils.scheduler import DecodeScheduler
+from utils.startup import start_background
+from utils.token_validator import TokenValidator
 
 
 class FrameType(IntEnum):
@@ -30,15 +42,23 @@ class Display:
     Main display class. It composes the tk.Tk() and its corresponding canvas and frame children.
     """
 
-    def __init__(self, title: str, full_screen: bool, kiosk_name: str, server_ip: str, assignment_name: str):
+    def __init__(
+            self, title: str, full_screen: bool, server_bridge: ServerBridge, video_sources: Optional[list[str]] = None
+    ):
         """
-        Initialise the display but not run it.
+        Initialise the display but not run it. Nothing in here waits on the network, so the window comes up at once.
 
         :param title: Title of the tkinter display.
         :type title: str
 
         :param full_screen: Whether the display is fullscreen or "maximised". It is not truly maximised, just scaled to the display size.
         :type full_screen: bool
+
+        :param server_bridge: The kiosk's one bridge, shared by every frame. It may still be loading in the background.
+        :type server_bridge: ServerBridge
+
+        :param video_sources: Camera stream URLs, one on-screen tile each. Defaults to the local IP Webcam stream.
+        :type video_sources: Optional[list[str]]
         """
 
         self.root = tk.Tk()
@@ -52,16 +72,35 @@ class Display:
         self.width = self.root.winfo_screenwidth()
         self.height = self.root.winfo_screenheight()
 
-        self.server_bridge = ServerBridge()
+        self.server_bridge = server_bridge
+        self.async_bridge = AsyncServerBridge(self.server_bridge)
+
+        self.journal = AttendanceJournal(self.server_bridge)
+        self.journal.start()
+
+        # Assignment changes reach the Tk thread through a slot, and are applied to every frame in one go.
+        self._assignment_slot = LatestSlot()
+        self.assignment_watcher = AssignmentWatcher(self.server_bridge)
+        self.assignment_watcher.subscribe(self._assignment_slot.put)
+        self.server_bridge.assignment_watcher = self.assignment_watcher
+        self.assignment_watcher.start()
+
+        # Off until the operator switches it on in the admittance frame.
+        self.auto_admitter = AutoAdmitter(self.journal)
+        self.auto_admitter.start()
 
         # Canvas is the code child of the root. It is to be modified and never the root directly.
         self._canvas = tk.Canvas(self.root, width=self.width, height=self.height, bg='black')
         self._canvas.pack()
 
+        self.video_sources = video_sources if video_sources else [DEFAULT_VIDEO_SOURCE]
+
         self.frames = self._init_frames()
-        self._init_status_bar(kiosk_name, server_ip, assignment_name)
+        self._init_status_bar()
+
+        self.root.bind('<F3>', lambda event: self.video_frame.toggle_overlay())
 
-    def _init_frames(self, video_source: str = 'http://localhost:5000/video') -> dict[FrameType, tk.Frame]:
+    def _init_frames(self) -> dict[FrameType, tk.Frame]:
         """
         Initialize all four corner frames. Currently, contain three dummy frames and one image frame.
 
@@ -80,13 +119,17 @@ class Display:
         # foo_label = tk.Label(foo_frame, text='Foo', fg='white', bg='blue', font=('Helvetica', 48, 'bold'))
         # foo_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
 
-        self.admittance_frame = AdmittanceFrame(self._canvas, self.server_bridge, info_frame)
+        self.admittance_frame = AdmittanceFrame(
+            self._canvas, self.async_bridge, info_frame, self.journal, self.auto_admitter
+        )
 
         # Top-left frame to show incoming video streaming data.
-        self.video_frame = VideoFrame(self._canvas, self.server_bridge, info_frame, self.admittance_frame)
+        self.video_frame = VideoFrame(
+            self._canvas, self.server_bridge, info_frame, self.admittance_frame, len(self.video_sources)
+        )
 
         # Bottom-left dummy frame.
-        bar_frame = ControlsFrame(self._canvas)
+        bar_frame = ControlsFrame(self._canvas, self.server_bridge)
         # bar_frame = tk.Frame(self._canvas, bg='green', width=self.width // 2, height=self.height // 2)
 
         self._canvas.create_window(0, 0, anchor=tk.NW, window=self.video_frame.frame)
@@ -94,13 +137,37 @@ class Display:
         self._canvas.create_window(self.width // 2, self.height // 2, anchor=tk.NW, window=self.admittance_frame.frame)
         self._canvas.create_window(0, self.height // 2, anchor=tk.NW, window=bar_frame.frame)
 
-    def _init_status_bar(self, kiosk_name: str, server_ip: str, assignment_name: str):
-        text = f'{kiosk_name.title()} enslaved to {server_ip.lower()} assigned to {assignment_name.title()}'
+    def _init_status_bar(self):
+        self.status_bar_label = tk.Label(
+            self._canvas, text='Starting...', fg='white', bg='black', width=self._canvas.winfo_screenwidth()
+        )
+        self.status_bar_label.place(relx=0.5, rely=0, anchor=tk.N)
+
+        self._poll_assignment()
+
+    def _poll_assignment(self):
+        snapshot = self._assignment_slot.get_nowait()
+
+        if snapshot is not None:
+            self.apply_assignment(snapshot)
+
+        self.root.after(250, self._poll_assignment)
+
+    def apply_assignment(self, snapshot: AssignmentSnapshot):
+        """Show a new enrollment or assignment on the status bar and the admittance frame. Must run on the Tk thread."""
+
+        self.admittance_frame.apply_assignment(snapshot)
+
+        if not snapshot.enrolled:
+            self.status_bar_label.config(text='Not enrolled')
+            return
+
+        assignment_name = 'None' if snapshot.assignment is None else snapshot.assignment.get('a_name', 'None')
 
-        status_bar_label = tk.Label(
-            self._canvas, text=text, fg='white', bg='black', width=self._canvas.winfo_screenwidth()
+        self.status_bar_label.config(
+            text=f'{snapshot.kiosk_name.title()} enslaved to {snapshot.server_ip.lower()} '
+                 f'assigned to {assignment_name.title()}'
         )
-        status_bar_label.place(relx=0.5, rely=0, anchor=tk.N)
 
     def run(self):
         """
@@ -109,28 +176,132 @@ class Display:
         self.root.mainloop()
 
 
-def apply_video_stream(display_core: Display, capture: VideoCapture):
-    image = display_core.video_frame.generate_image(capture)
-    display_core.video_frame.refresh_image(image)
+def apply_video_stream(
+        display_core: Display, pipelines: list[ScanPipeline], display_fps: float = 30.0, due: Optional[float] = None,
+        group_lane: int = 0
+):
+    """
+    Tk-side end of the scan pipelines, one per camera lane. Paints the newest frame of every lane and the newest
+    verdict, if any, and reschedules itself to run `display_fps` times a second, independently of how fast frames are
+    captured or decoded. Nothing in here blocks, so the UI keeps its frame rate however slow decoding or the server is.
+
+    `due` is when this tick was scheduled to run; how late it actually ran is recorded as the UI tick lag. `group_lane`
+    is the lane that produced the newest verdict, whose group of passes in view is summarised on every tick, so the
+    summary clears as soon as the group leaves the frame.
+    """
+
+    tick_start = time.perf_counter()
+
+    if due is not None:
+        REGISTRY.histogram('ui_tick_lag_seconds', 'How late UI ticks run after they were due').observe(
+            max(0.0, tick_start - due)
+        )
+
+    for lane, pipeline in enumerate(pipelines):
+        decoded_frame = pipeline.latest_frame()
+        if decoded_frame is not None:
+            render_start = time.perf_counter()
+            image = display_core.video_frame.generate_image(decoded_frame, lane)
+            display_core.video_frame.refresh_image(image, lane)
+
+            REGISTRY.histogram('render_seconds', 'Time to paint a video tile', lane=pipeline.name).observe(
+                time.perf_counter() - render_start
+            )
+            REGISTRY.counter('frames_rendered_total', 'Video frames painted', lane=pipeline.name).inc()
+
+        result = pipeline.poll_result()
+        if result is not None:
+            display_core.video_frame.apply_result(result)
+            group_lane = lane
+
+    display_core.video_frame.info_frame.set_group(pipelines[group_lane].group())
 
-    display_core.root.after(1, lambda: apply_video_stream(display_core, capture))
+    # Subtract the time spent painting, so the display rate holds however long rendering takes.
+    delay_ms = max(1, int(1000 / display_fps - (time.perf_counter() - tick_start) * 1000))
+    next_due = time.perf_counter() + delay_ms / 1000
+    display_core.root.after(
+        delay_ms, lambda: apply_video_stream(display_core, pipelines, display_fps, next_due, group_lane)
+    )
+
+
+def refresh_diagnostics(display_core: Display, pipelines: list[ScanPipeline], interval_ms: int = 500):
+    """Keep the diagnostics overlay (F3) up to date. Cheap when the overlay is hidden."""
+
+    display_core.video_frame.refresh_overlay(pipelines)
+    display_core.root.after(interval_ms, lambda: refresh_diagnostics(display_core, pipelines, interval_ms))
 
 
 if __name__ == '__main__':
-    try:
-        requests.get('https://www.google.com')
-    except Exception as e:
-        print(f'Connection Error: {e}')
-        exit(1)
-
-    bridge = ServerBridge()
-    assignment = bridge.assignment
-
-    if assignment is None:
-        assignment_name = 'None'
-    else:
-        assignment_name = bridge.assignment.get('a_name', 'None')
-
-    display = Display('Ticket Validation Kiosk', False, bridge.kiosk_name, bridge.server_ip, assignment_name)
-    apply_video_stream(display, VideoCapture('http://localhost:5000/video'))
+    # One bridge for the whole kiosk. It loads in the background (see `start_background` below), so nothing before the
+    # first camera frame waits on the keystore or the network.
+    bridge = ServerBridge(load=False)
+
+    parser = argparse.ArgumentParser(description='Ticket validation kiosk.')
+    parser.add_argument('sources', nargs='*', help=f'camera stream URLs (default {DEFAULT_VIDEO_SOURCE})')
+    parser.add_argument(
+        '--decode-workers', type=int, default=0,
+        help='decode in this many processes, not threads, so decoding does not compete with the UI for the GIL'
+    )
+    args = parser.parse_args()
+
+    video_sources = args.sources or [DEFAULT_VIDEO_SOURCE]
+
+    display = Display('Ticket Validation Kiosk', False, bridge, video_sources)
+
+    # Passes are only checked structurally until the public key arrives.
+    validator = TokenValidator()
+
+    # Only consulted for passes whose signature checks out, i.e. once the public key has arrived.
+    roster = PassRoster(bridge, validator)
+    bridge.roster = roster
+    roster.start()
+
+    # One decode thread per lane at most, leaving a core for Tk and the capture threads.
+    decode_scheduler = DecodeScheduler(workers=max(1, min(len(video_sources), (os.cpu_count() or 2) - 1)))
+    decode_scheduler.start()
+
+    # Decodes only as often, and at as high a resolution, as the scan-latency SLO needs.
+    decode_governor = DecodeGovernor()
+    decode_governor.start()
+
+    scan_pipelines = [
+        ScanPipeline(
+            open_capture(source), display.async_bridge, validator, decode_workers=args.decode_workers,
+            scheduler=decode_scheduler, name=f'Lane {index + 1}', on_result=display.auto_admitter.offer,
+            governor=decode_governor,
+            authoritative=lambda: display.auto_admitter.enabled
+        )
+        for index, source in enumerate(video_sources)
+    ]
+
+    for scan_pipeline in scan_pipelines:
+        scan_pipeline.display_size = display.video_frame.image_size
+        scan_pipeline.start()
+
+    start_background(bridge, validator)
+
+    # Per-stage metrics, for Prometheus at http://127.0.0.1:9108/metrics and in a JSONL log for later diagnosis.
+    metrics_server = MetricsServer()
+    metrics_server.start()
+    metrics_logger = MetricsLogger()
+    metrics_logger.start()
+
+    apply_video_stream(display, scan_pipelines)
+    refresh_diagnostics(display, scan_pipelines)
     display.run()
+
+    for scan_pipeline in scan_pipelines:
+        scan_pipeline.stop()
+        scan_pipeline.capture.close()
+        print(f'Decode ({scan_pipeline.name}): {scan_pipeline.decoder.stats.summary()}')
+
+    decode_scheduler.stop()
+    decode_governor.stop()
+    roster.stop()
+    display.assignment_watcher.stop()
+    display.auto_admitter.stop()
+    display.async_bridge.shutdown()
+    display.journal.close()
+
+    metrics_logger.stop()
+    metrics_server.stop()